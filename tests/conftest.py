@@ -0,0 +1,21 @@
+# Shared fixtures of the tests of opentabulate.py and tabctl.py.
+
+# Modules
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'tools'))
+
+@pytest.fixture
+def pddir(tmp_path, monkeypatch):
+    """
+    Changes to a temporary directory with the data processing directories, as
+    created by 'tabctl.py --initialize', since the pipeline uses paths relative
+    to them. Returns the path of the temporary directory.
+    """
+    for d in ['pddir/raw', 'pddir/dirty', 'pddir/clean']:
+        os.makedirs(tmp_path / d)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
@@ -0,0 +1,68 @@
+# Tests of BuildRecord, which decides whether the outputs of a source are up
+# to date.
+
+# Modules
+import json
+import os
+
+import opentabulate
+
+def make_source():
+    with open('pddir/raw/d.csv', 'w') as f:
+        f.write('NAME,POSTCODE\nn1,K1A0B1\nn2,bad\n')
+    with open('d.json', 'w') as f:
+        json.dump({'localfile' : 'd.csv', 'format' : 'csv', 'database_type' : 'business', \
+                   'info' : {'bus_name' : 'NAME', 'address' : {'postcode' : 'POSTCODE'}}}, f)
+    source = opentabulate.Source('d.json')
+    source.parse()
+    return source
+
+def process(source):
+    opentabulate.DataProcess(source, opentabulate.AddressParser(lambda address: [], version='test')).process()
+
+def test_unchanged_outputs_are_current(pddir):
+    source = make_source()
+    process(source)
+    record = opentabulate.BuildRecord(parser_version='test')
+    fingerprint = record.fingerprint(source)
+    record.store(source, fingerprint)
+    assert record.is_current(source, fingerprint)
+    # outputs of another version of the address parser are not current
+    other = opentabulate.BuildRecord(parser_version='other')
+    assert not other.is_current(source, other.fingerprint(source))
+
+def test_changed_errors_output_is_not_current(pddir):
+    source = make_source()
+    process(source)
+    record = opentabulate.BuildRecord()
+    fingerprint = record.fingerprint(source)
+    record.store(source, fingerprint)
+    assert os.path.exists(source.cleanpath + '.errors')
+    os.remove(source.cleanpath + '.errors')
+    assert not record.is_current(source, fingerprint)
+
+def test_new_errors_output_is_not_current(pddir):
+    source = make_source()
+    process(source)
+    record = opentabulate.BuildRecord()
+    fingerprint = record.fingerprint(source)
+    if os.path.exists(source.dirtypath + '.errors'):
+        os.remove(source.dirtypath + '.errors')
+    record.store(source, fingerprint)
+    assert record.is_current(source, fingerprint)
+    with open(source.dirtypath + '.errors', 'w') as f:
+        f.write('ERROR,NAME,POSTCODE\n')
+    assert not record.is_current(source, fingerprint)
+
+def test_missing_clean_dataset_is_not_recorded(pddir):
+    source = make_source()
+    record = opentabulate.BuildRecord()
+    fingerprint = record.fingerprint(source)
+    # no outputs were written
+    record.store(source, fingerprint)
+    assert not record.is_current(source, fingerprint)
+    process(source)
+    record.store(source, fingerprint)
+    os.remove(source.cleanpath)
+    record.store(source, fingerprint)
+    assert not record.is_current(source, fingerprint)
@@ -0,0 +1,91 @@
+# Tests that processing a CSV dataset in chunks, as done by tabctl.py with
+# '--chunk-size', gives the same outputs as processing it in one job.
+
+# Modules
+import json
+import os
+
+import pytest
+
+import opentabulate
+
+def parse_address(address):
+    return [(address.lower(), 'road')]
+
+def rows(n, newline='\n'):
+    lines = ['NAME,DESC,ADDRESS,POSTCODE']
+    for i in range(n):
+        if i % 7 == 3:
+            # a quote character in an unquoted field
+            lines.append('n%d,5" pipe,%d Main St,K1A0B1' % (i, i))
+        elif i % 5 == 4:
+            lines.append('n%d,"multi\nline, ""desc""",%d Main St,K1A0B1' % (i, i))
+        elif i % 11 == 6:
+            # too many entries
+            lines.append('n%d,extra,%d Main St,K1A0B1,x' % (i, i))
+        else:
+            lines.append('n%d,plain,%d Main St,K1A0B1' % (i, i))
+    return (newline.join(lines) + newline) if n >= 0 else ''
+
+DATASETS = {'lf' : rows(400), 'crlf' : rows(400, '\r\n'), 'cr' : rows(400, '\r'), \
+            'header_only' : rows(0), 'empty' : rows(-1)}
+
+def make_source(data, output_format='csv', blank_fill=False):
+    with open('pddir/raw/d.csv', 'w', newline='') as f:
+        f.write(data)
+    with open('d.json', 'w') as f:
+        json.dump({'localfile' : 'd.csv', 'format' : 'csv', 'database_type' : 'business', \
+                   'info' : {'bus_name' : 'NAME', 'bus_desc' : 'DESC', 'full_addr' : 'ADDRESS', \
+                             'postcode' : 'POSTCODE'}}, f)
+    source = opentabulate.Source('d.json', blank_fill_flag=blank_fill, output_format=output_format)
+    source.parse()
+    return source
+
+def outputs(source):
+    contents = dict()
+    for path in [source.cleanpath, source.cleanpath + '.bf', source.cleanpath + '.errors', \
+                 source.dirtypath + '.errors']:
+        if os.path.exists(path):
+            if path.endswith('.errors') or source.output_format == 'csv':
+                with open(path, 'rb') as f:
+                    contents[os.path.basename(path)] = f.read()
+            else:
+                with opentabulate.open_output(path) as f:
+                    contents[os.path.basename(path)] = (f.fieldnames, list(f))
+            os.remove(path)
+    return contents
+
+def process(data, chunk_size, output_format='csv', blank_fill=False):
+    source = make_source(data, output_format, blank_fill)
+    address_parser = opentabulate.AddressParser(parse_address, version='test')
+    if chunk_size == None:
+        opentabulate.DataProcess(source, address_parser).process()
+    else:
+        ranges = opentabulate.DataProcess(source, address_parser).splitData(chunk_size)
+        counts = [opentabulate.DataProcess(source, address_parser).processChunk(i, *r) \
+                  for i, r in enumerate(ranges)]
+        opentabulate.DataProcess(source, address_parser).mergeChunks(counts)
+    return outputs(source)
+
+@pytest.mark.parametrize('name', sorted(DATASETS))
+def test_chunks_match_single_job(pddir, name):
+    expected = process(DATASETS[name], None)
+    for chunk_size in [300, 1000, 1 << 20]:
+        assert process(DATASETS[name], chunk_size) == expected
+
+@pytest.mark.parametrize('output_format', ['csv', 'columnar'])
+def test_chunks_match_single_job_with_blank_fill(pddir, output_format):
+    expected = process(DATASETS['lf'], None, output_format, True)
+    assert any(name.endswith('.bf') for name in expected)
+    assert process(DATASETS['lf'], 700, output_format, True) == expected
+
+def test_chunks_end_on_record_boundaries(pddir):
+    source = make_source(DATASETS['crlf'])
+    ranges = opentabulate.DataProcess(source, opentabulate.AddressParser(parse_address, version='test')) \
+                         .splitData(500)
+    assert len(ranges) > 1
+    with open(source.rawpath, 'rb') as f:
+        data = f.read()
+    for start, end in ranges:
+        assert data[start - 2:start] == b'\r\n'
+    assert ranges[-1][1] == len(data)
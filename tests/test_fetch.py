@@ -0,0 +1,150 @@
+# Tests of conditional fetching in Source.fetch_url, against a local HTTP
+# server standing in for a data portal. The server sends ETag and
+# Last-Modified headers, and answers conditional requests whose validators
+# match with 304 Not Modified.
+
+# Modules
+import gzip
+import hashlib
+import http.server
+import json
+import os
+import stat
+import threading
+
+from email.utils import formatdate
+
+import pytest
+
+import opentabulate
+
+class DatasetHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Serves the dataset of the server at any path. The ETag is derived from the
+    content and a revision number, so a revision can change the validators
+    without changing the content.
+    """
+    def do_GET(self):
+        server = self.server
+        etag = '"%s-%d"' % (hashlib.sha256(server.data).hexdigest()[:16], server.revision)
+        last_modified = formatdate(server.mtime, usegmt=True)
+        server.requests.append(dict(self.headers))
+        if self.headers.get('If-None-Match') == etag or \
+           (self.headers.get('If-None-Match') == None and self.headers.get('If-Modified-Since') == last_modified):
+            # recorded before the client can read the response
+            server.statuses.append(304)
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        server.statuses.append(200)
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', last_modified)
+        self.send_header('Content-Length', str(len(server.data)))
+        self.end_headers()
+        self.wfile.write(server.data)
+
+    def log_message(self, format, *args):
+        pass
+
+def dataset(tag):
+    lines = ['Name,Licence,PostalCode'] + ['Business %d %s,L%07d,K1A 0B1' % (i, tag, i) for i in range(1000)]
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+@pytest.fixture
+def server():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), DatasetHandler)
+    server.data = dataset('A')
+    server.revision = 0
+    server.mtime = 1500000000
+    server.requests = []
+    server.statuses = []
+    server.url = 'http://127.0.0.1:%d/business.csv' % server.server_address[1]
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def make_source(url, data):
+    """
+    Writes a source file for the dataset at 'url', with the checksum of 'data',
+    and returns its parsed Source object with fetching enabled.
+    """
+    with open('business.json', 'w') as f:
+        json.dump({'localfile' : 'business.csv', 'url' : url, 'format' : 'csv', \
+                   'database_type' : 'business', \
+                   'checksum' : 'sha256:' + hashlib.sha256(data).hexdigest(), \
+                   'info' : {'bus_name' : 'Name', 'lic_no' : 'Licence', \
+                             'address' : {'postcode' : 'PostalCode'}}}, f)
+    source = opentabulate.Source('business.json', no_fetch_flag=False)
+    source.parse()
+    return source
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+RAWPATH = './pddir/raw/business.csv'
+
+def test_unchanged_dataset_is_not_downloaded(pddir, server):
+    source = make_source(server.url, server.data)
+    assert source.fetch_url()
+    assert server.statuses == [200]
+    assert read(RAWPATH) == server.data
+    # the permissions follow the umask, as for a file created by 'open'
+    assert stat.S_IMODE(os.stat(RAWPATH).st_mode) == 0o666 & ~opentabulate._UMASK
+    mtime = os.stat(RAWPATH).st_mtime_ns
+
+    assert not source.fetch_url()
+    assert server.statuses[-1] == 304
+    assert 'If-None-Match' in server.requests[-1] and 'If-Modified-Since' in server.requests[-1]
+    assert os.stat(RAWPATH).st_mtime_ns == mtime
+
+def test_same_content_keeps_local_copy(pddir, server):
+    source = make_source(server.url, server.data)
+    source.fetch_url()
+    mtime = os.stat(RAWPATH).st_mtime_ns
+
+    # new validators for the same content
+    server.revision += 1
+    server.mtime += 60
+    assert not source.fetch_url()
+    assert server.statuses[-1] == 200
+    assert os.stat(RAWPATH).st_mtime_ns == mtime
+    # the manifest records the new validators
+    assert not source.fetch_url()
+    assert server.statuses[-1] == 304
+
+def test_checksum_mismatch_keeps_local_copy(pddir, server):
+    source = make_source(server.url, server.data)
+    source.fetch_url()
+    mtime = os.stat(RAWPATH).st_mtime_ns
+
+    # the dataset changes, but the source file keeps the old checksum
+    server.data = dataset('B')
+    server.revision += 1
+    with pytest.raises(ValueError, match='Checksum mismatch'):
+        source.fetch_url()
+    assert read(RAWPATH) == dataset('A')
+    assert os.stat(RAWPATH).st_mtime_ns == mtime
+    # no partial download is left behind
+    assert os.listdir('pddir/raw') == ['business.csv']
+
+    # the source file is updated with the checksum of the new dataset
+    source = make_source(server.url, server.data)
+    assert source.fetch_url()
+    assert read(RAWPATH) == server.data
+
+def test_extracted_dataset_follows_umask(pddir):
+    with gzip.open('pddir/raw/business.csv.gz', 'wb') as f:
+        f.write(dataset('A'))
+    with open('business.json', 'w') as f:
+        json.dump({'localfile' : 'business.csv', 'compression' : 'gzip', 'format' : 'csv', \
+                   'database_type' : 'business', 'info' : {'bus_name' : 'Name'}}, f)
+    source = opentabulate.Source('business.json', no_extract_flag=False, extract_flag=True)
+    source.parse()
+    source.archive_extraction()
+    assert read(RAWPATH) == dataset('A')
+    assert stat.S_IMODE(os.stat(RAWPATH).st_mode) == 0o666 & ~opentabulate._UMASK
@@ -0,0 +1,76 @@
+# Tests that every output format stores the same rows as the CSV format, both
+# when written directly and by the pipeline.
+
+# Modules
+import json
+
+import pytest
+
+import opentabulate
+
+FORMATS = ['csv', 'columnar', pytest.param('parquet', marks=pytest.mark.skipif(opentabulate.pyarrow == None, \
+                                                                               reason='pyarrow is not installed'))]
+
+FIELDNAMES = ['bus_name', 'city', 'prov/terr', 'postcode']
+
+def rows(n):
+    # 'city' and 'prov/terr' have few distinct entries, so they are dictionary
+    # encoded by the columnar format
+    names = ['Business %d', 'Café "%d", Inc.', 'multi\nline %d', '']
+    return [[names[i % 4].replace('%d', str(i)), ['Ottawa', 'Montréal', ''][i % 3], ['ON', 'QC'][i % 2], \
+             'K1A %dB%d' % (i % 10, i % 7) if i % 13 else 'bad'] for i in range(n)]
+
+@pytest.mark.parametrize('output_format', FORMATS)
+@pytest.mark.parametrize('n', [0, 1, 1000])
+def test_sink_round_trip(tmp_path, output_format, n):
+    sink_class = opentabulate.OUTPUT_FORMATS[output_format]
+    path = str(tmp_path / ('d-clean' + sink_class.suffix))
+    kwargs = {'row_group_size' : 128} if output_format == 'columnar' else {}
+    with sink_class(path, FIELDNAMES, **kwargs) as sink:
+        for row in rows(n)[:10]:
+            sink.writerow(row)
+        sink.writerows(rows(n)[10:])
+    expected = rows(n)
+    with opentabulate.open_output(path) as reader:
+        assert isinstance(reader, sink_class.reader)
+        assert reader.fieldnames == FIELDNAMES
+        assert list(reader) == expected
+        assert reader.column('city') == [row[1] for row in expected]
+
+def test_blank_fill_sink_projects_columns(tmp_path):
+    clean_path, filled_path = str(tmp_path / 'd-clean.csv'), str(tmp_path / 'd-clean.csv.bf')
+    filled_fieldnames = ['postcode', 'phone', 'bus_name']
+    with opentabulate.BlankFillSink(opentabulate.CSVSink(clean_path, FIELDNAMES), \
+                                    opentabulate.CSVSink(filled_path, filled_fieldnames)) as sink:
+        sink.writerows(rows(10))
+    with opentabulate.open_output(filled_path) as reader:
+        assert reader.fieldnames == filled_fieldnames
+        assert list(reader) == [[row[3], '', row[0]] for row in rows(10)]
+    with opentabulate.open_output(clean_path) as reader:
+        assert list(reader) == rows(10)
+
+def process(output_format):
+    with open('pddir/raw/d.csv', 'w') as f:
+        f.write('NAME,CITY,PROVINCE,POSTCODE\n')
+        for row in rows(500):
+            f.write(','.join('"%s"' % entry.replace('"', '""') for entry in row) + '\n')
+    with open('d.json', 'w') as f:
+        json.dump({'localfile' : 'd.csv', 'format' : 'csv', 'database_type' : 'business', \
+                   'info' : {'bus_name' : 'NAME', 'address' : {'city' : 'CITY', 'prov/terr' : 'PROVINCE', \
+                                                               'postcode' : 'POSTCODE'}}}, f)
+    source = opentabulate.Source('d.json', blank_fill_flag=True, output_format=output_format)
+    source.parse()
+    opentabulate.DataProcess(source, opentabulate.AddressParser(lambda address: [], version='test')).process()
+    outputs = []
+    for path in [source.cleanpath, source.cleanpath + '.bf']:
+        with opentabulate.open_output(path) as reader:
+            outputs.append((reader.fieldnames, list(reader)))
+    with open(source.cleanpath + '.errors', 'rb') as f:
+        outputs.append(f.read())
+    return outputs
+
+@pytest.mark.parametrize('output_format', FORMATS)
+def test_pipeline_output_matches_csv(pddir, output_format):
+    expected = process('csv')
+    assert len(expected[0][1]) > 0 and len(expected[2]) > 0
+    assert process(output_format) == expected
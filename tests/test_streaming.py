@@ -0,0 +1,64 @@
+# Tests that the streaming pipeline gives the same outputs as the staged
+# pipeline, which writes the dirty dataset between processing steps.
+
+# Modules
+import json
+import os
+
+import pytest
+
+import opentabulate
+
+def parse_address(address):
+    # addresses of the CSV dataset have the form 'road;city;postcode'
+    return list(zip(address.lower().split(';'), ['road', 'city', 'postcode']))
+
+CSV_DATASET = 'NAME,TYPE,ADDRESS\n' + ''.join(
+    'Business %d,%s,%d Main St;Montréal;%s\n' % (i, ['Retail', '"Home, Based"', ''][i % 3], i, \
+                                                  'K1A 0B1' if i % 13 else 'bad') if i % 17 != 5 else \
+    'Business %d,too,many,entries\n' % i for i in range(300)) + '\n'
+
+XML_DATASET = '<?xml version="1.0" encoding="utf-8"?>\n<recs>\n' + ''.join(
+    '<rec><Name>Business %d &amp; Co</Name><Type>%s</Type><Loc><Civic>%d Main St</Civic>'
+    '<City>Montréal</City><PostalCode>%s</PostalCode></Loc></rec>\n' % (i, ['Retail', '', 'Home'][i % 3], i, \
+                                                                        'K1A 0B1' if i % 13 else 'bad') \
+    for i in range(300)) + '</recs>\n'
+
+def make_source(fmt, encoding, staged, blank_fill):
+    with open('pddir/raw/d.' + fmt, 'w', encoding=encoding) as f:
+        if fmt == 'csv' and encoding == 'utf-8':
+            # a byte order mark, which is removed by format correction
+            f.write('\ufeff')
+        f.write(CSV_DATASET if fmt == 'csv' else XML_DATASET)
+    metadata = {'localfile' : 'd.' + fmt, 'format' : fmt, 'database_type' : 'business', 'encoding' : encoding}
+    if fmt == 'csv':
+        metadata['info'] = {'bus_name' : 'NAME', 'bus_type' : 'TYPE', 'full_addr' : 'ADDRESS'}
+    else:
+        metadata['header'] = 'rec'
+        metadata['info'] = {'bus_name' : 'Name', 'bus_type' : 'Type', \
+                            'address' : {'street_name' : 'Civic', 'city' : 'City', 'postcode' : 'PostalCode'}}
+    with open('d.json', 'w') as f:
+        json.dump(metadata, f)
+    source = opentabulate.Source('d.json', staged_flag=staged, blank_fill_flag=blank_fill)
+    source.parse()
+    return source
+
+def process(fmt, encoding, staged, blank_fill):
+    source = make_source(fmt, encoding, staged, blank_fill)
+    opentabulate.DataProcess(source, opentabulate.AddressParser(parse_address, version='test')).process()
+    contents = dict()
+    for path in [source.cleanpath, source.cleanpath + '.bf', source.cleanpath + '.errors', \
+                 source.dirtypath + '.errors']:
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                contents[os.path.basename(path)] = f.read()
+            os.remove(path)
+    return contents
+
+@pytest.mark.parametrize('fmt', ['csv', 'xml'])
+@pytest.mark.parametrize('encoding', ['utf-8', 'cp1252'])
+@pytest.mark.parametrize('blank_fill', [False, True])
+def test_streaming_matches_staged(pddir, fmt, encoding, blank_fill):
+    staged = process(fmt, encoding, True, blank_fill)
+    assert 'd-clean.csv' in staged and 'd-clean.csv.errors' in staged
+    assert process(fmt, encoding, False, blank_fill) == staged
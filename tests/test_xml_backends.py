@@ -0,0 +1,57 @@
+# Differential tests of the XML backends of XML_Algorithm, which must give
+# the rows of the original parser, which read the whole dataset with
+# ElementTree and selected fields with 'element.find'.
+
+# Modules
+import json
+
+import pytest
+
+import opentabulate
+
+DATASET = '''<?xml version="1.0" encoding="utf-8"?>
+<recs>
+<rec><Name>A &amp; B</Name><x><x><name>inner</name></x><name>outer</name></x>
+<Contact><Phone>613</Phone></Contact><Loc><City>Ottawa</City><Civic>1 Main</Civic></Loc></rec>
+<rec><Name> spaced   name </Name><Contact/><Loc><City>Hull</City></Loc></rec>
+<rec><Name>Nested</Name><rec><Name>inner rec</Name></rec></rec>
+</recs>
+'''
+
+# rows given by the original parser
+EXPECTED = [['bus_name', 'bus_desc', 'street_name', 'city', 'phone'],
+            ['a & b', 'outer', '1 main', 'ottawa', '613'],
+            ['spaced name', '', '', 'hull', ''],
+            ['nested', '', '', '', ''],
+            ['inner rec', '', '', '', '']]
+
+BACKENDS = ['etree', 'auto', pytest.param('lxml', marks=pytest.mark.skipif(opentabulate.lxml_etree == None, \
+                                                                           reason='lxml is not installed'))]
+
+def make_source(backend):
+    with open('pddir/raw/r.xml', 'w', encoding='utf-8') as f:
+        f.write(DATASET)
+    with open('r.json', 'w') as f:
+        json.dump({'localfile' : 'r.xml', 'format' : 'xml', 'header' : 'rec', 'database_type' : 'business', \
+                   'info' : {'bus_name' : 'Name', 'bus_desc' : 'x/name', 'phone' : 'Contact/Phone', \
+                             'address' : {'city' : 'Loc/City', 'street_name' : 'Civic'}}}, f)
+    source = opentabulate.Source('r.json', xml_backend=backend)
+    source.parse()
+    return source
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_rows_match_original_parser(pddir, backend):
+    source = make_source(backend)
+    algorithm = opentabulate.XML_Algorithm(None, 'business')
+    algorithm.extract_labels(source)
+    assert list(algorithm._parse_rows(source)) == EXPECTED
+
+@pytest.mark.skipif(opentabulate.lxml_etree == None, reason='lxml is not installed')
+def test_backends_select_the_same_element():
+    # XPath returns the inner 'name' first, in document order
+    for path in ['.//x/name', './/name', 'x/x/name', './/x']:
+        compiled = [backend().compile_path(path) for backend in (opentabulate.ElementTreeBackend, \
+                                                                  opentabulate.LxmlBackend)]
+        etree_found = compiled[0](opentabulate.ElementTree.fromstring(DATASET.encode('utf-8'))[0])
+        lxml_found = compiled[1](opentabulate.lxml_etree.fromstring(DATASET.encode('utf-8'))[0])
+        assert (etree_found.tag, etree_found.text) == (lxml_found.tag, lxml_found.text)
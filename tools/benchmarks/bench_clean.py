@@ -0,0 +1,83 @@
+# A benchmark comparing cleaning rows one at a time with cleaning batches of
+# rows column by column, on a synthetic business dataset.
+
+# Modules
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+import opentabulate
+
+def dirty_rows(n, seed):
+    """
+    Generates 'n' rows resembling a scrubbed business dataset before cleaning,
+    with some entries that fail the cleaning rules.
+    """
+    rnd = random.Random(seed)
+    cities = ['ottawa', 'winnipeg', 'montréal', "st. john's", 'halifax', 'toronto', 'regina']
+    provs = ['on', 'manitoba', 'qc', 'nl', 'nova scotia', 'québec', 'sk', 'ont.', '']
+    countries = ['ca', 'canada', 'ca', 'usa', '']
+    rows = []
+    for i in range(n):
+        postcode = 'k%d%s %d%s%d' % (rnd.randint(0, 9), 'abc'[i % 3], rnd.randint(0, 9), 'xyz'[i % 3], i % 10)
+        if i % 50 == 0:
+            postcode = rnd.choice(['k1a 0b', '12345', 'kk1 1a1', ''])
+        rows.append(['business %d inc.' % i, str(i), str(rnd.randint(1, 9999)), 'main st',
+                     rnd.choice(cities), rnd.choice(provs), rnd.choice(countries), postcode,
+                     '(613) 555-%04d' % rnd.randint(0, 9999), rnd.choice(['', '613-555-0199']),
+                     rnd.choice(['y', 'n'])])
+    return rows
+
+cmd_args = argparse.ArgumentParser(description='Benchmark row and batch cleaning.')
+cmd_args.add_argument('-n', '--rows', action='store', default=1000000, type=int, metavar='N', \
+                      help='number of synthetic rows to clean')
+cmd_args.add_argument('-b', '--batch', action='append', type=int, metavar='ROWS', \
+                      help='batch size to test, may be repeated (default: 1000, 10000 and 100000)')
+args = cmd_args.parse_args()
+
+fieldnames = ['bus_name', 'bus_no', 'street_no', 'street_name', 'city', 'prov/terr', 'country',
+              'postcode', 'phone', 'fax', 'active']
+rows = dirty_rows(args.rows, 0)
+tmpdir = tempfile.mkdtemp(prefix='opentab-bench-')
+
+srcpath = os.path.join(tmpdir, 'bench.json')
+with open(srcpath, 'w') as f:
+    json.dump({'localfile': 'bench.csv', 'format': 'csv', 'database_type': 'business',
+               'info': {'bus_name': 'NAME'}}, f)
+source = opentabulate.Source(srcpath)
+source.parse()
+
+print("Cleaning", args.rows, "rows of", len(fieldnames), "columns.")
+print("%-12s %10s %12s %8s" % ('mode', 'seconds', 'rows/s', 'speedup'))
+base = None
+for batch_size in [None] + (args.batch or [1000, 10000, 100000]):
+    algorithm = opentabulate.Algorithm(database_type='business')
+    source.clean_batch_size = batch_size
+    path = os.path.join(tmpdir, 'clean-%s.csv' % batch_size)
+
+    # rows are cleaned in place, so each run gets its own copy
+    copies = [fieldnames] + [list(row) for row in rows]
+    start = time.perf_counter()
+    algorithm._write_clean(source, copies, path)
+    elapsed = time.perf_counter() - start
+
+    name = 'row' if batch_size == None else 'batch %d' % batch_size
+    if base == None:
+        base = elapsed
+        expected = path
+    else:
+        for suffix in ['', '.errors']:
+            with open(expected + suffix, 'rb') as f, open(path + suffix, 'rb') as g:
+                if f.read() != g.read():
+                    print("Error! Output of", name, "differs from cleaning rows one at a time.")
+                    exit(1)
+    print("%-12s %10.3f %12.0f %7.2fx" % (name, elapsed, args.rows / elapsed, base / elapsed))
+print("Rejected rows:", dict(algorithm.clean_rejections))
+
+shutil.rmtree(tmpdir)
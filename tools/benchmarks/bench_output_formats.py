@@ -0,0 +1,72 @@
+# A benchmark comparing the output formats of clean datasets by file size,
+# write time and read time.
+
+# Modules
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+import opentabulate
+
+def clean_rows(n, seed):
+    """
+    Generates 'n' rows resembling a clean business dataset, where the address
+    columns repeat a few values.
+    """
+    rnd = random.Random(seed)
+    cities = ['ottawa', 'winnipeg', 'montréal', "st. john's", 'halifax', 'toronto', 'regina']
+    provs = ['on', 'mb', 'qc', 'nl', 'ns', 'sk']
+    types = ['retail', 'restaurant', 'construction', 'home based', '']
+    rows = []
+    for i in range(n):
+        rows.append(['business %d inc.' % i, str(i), rnd.choice(types), str(rnd.randint(1, 9999)),
+                     'main st', rnd.choice(cities), rnd.choice(provs), 'ca',
+                     'k%d%s %d%s%d' % (rnd.randint(0, 9), 'abc'[i % 3], rnd.randint(0, 9), 'xyz'[i % 3], i % 10),
+                     '613555%04d' % rnd.randint(0, 9999), rnd.choice(['y', 'n'])])
+    return rows
+
+cmd_args = argparse.ArgumentParser(description='Benchmark the output formats of clean datasets.')
+cmd_args.add_argument('-n', '--rows', action='store', default=500000, type=int, metavar='N', \
+                      help='number of synthetic rows to write')
+args = cmd_args.parse_args()
+
+fieldnames = ['bus_name', 'bus_no', 'bus_type', 'street_no', 'street_name', 'city', 'prov/terr',
+              'country', 'postcode', 'phone', 'active']
+rows = clean_rows(args.rows, 0)
+tmpdir = tempfile.mkdtemp(prefix='opentab-bench-')
+
+print("Writing", args.rows, "rows of", len(fieldnames), "columns.")
+print("%-10s %12s %10s %10s %12s" % ('format', 'bytes', 'write s', 'read s', 'column s'))
+for name in sorted(opentabulate.OUTPUT_FORMATS):
+    sink = opentabulate.OUTPUT_FORMATS[name]
+    if name == 'parquet' and opentabulate.pyarrow == None:
+        print("%-10s not installed" % name)
+        continue
+    path = os.path.join(tmpdir, 'clean' + sink.suffix)
+
+    start = time.perf_counter()
+    with sink(path, fieldnames) as out:
+        out.writerows(rows)
+    write_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with opentabulate.open_output(path) as reader:
+        nrows = sum(1 for row in reader)
+    read_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with opentabulate.open_output(path) as reader:
+        cities = reader.column('city')
+    column_time = time.perf_counter() - start
+
+    if nrows != len(rows) or cities != [row[5] for row in rows]:
+        print("Error! Format", name, "does not read back the written rows.")
+        exit(1)
+    print("%-10s %12d %10.3f %10.3f %12.3f" % (name, os.path.getsize(path), write_time, read_time, column_time))
+
+shutil.rmtree(tmpdir)
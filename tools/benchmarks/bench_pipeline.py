@@ -0,0 +1,291 @@
+# A benchmark of the complete DataProcess pipeline on synthetic business,
+# education, hospital and library datasets, in CSV and XML and in several
+# character encodings. Each stage is timed and its peak memory measured, and
+# the results can be saved and compared with an earlier run to find
+# regressions.
+#
+# Addresses are parsed by a deterministic stub instead of libpostal, so the
+# timings of the address parsing stage do not reflect libpostal.
+
+# Modules
+import argparse
+import csv
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+import opentabulate
+
+from xml.sax.saxutils import escape
+
+# names of the encodings in XML declarations
+XML_ENCODING_NAMES = {'utf-8' : 'UTF-8', 'cp1252' : 'windows-1252', 'cp437' : 'IBM437'}
+
+CITIES = [('Ottawa', 'ON'), ('Winnipeg', 'MB'), ('Montréal', 'QC'), ("St. John's", 'NL'),
+          ('Halifax', 'NS'), ('Trois-Rivières', 'Québec'), ('Regina', 'Saskatchewan')]
+STREETS = ['Main St', 'King Street W', 'Rue Sainte-Catherine Est', 'Portage Ave', 'Chemin Côte-des-Neiges']
+
+# columns of each database type, as (column, label, generator of entries)
+COLUMNS = {
+    'business' : [('Name', 'bus_name', lambda i, rnd: 'Business %d Inc.' % i),
+                  ('Type', 'bus_type', lambda i, rnd: rnd.choice(['Retail', 'Restaurant', 'Home Based', ''])),
+                  ('Licence', 'lic_no', lambda i, rnd: 'L%07d' % i),
+                  ('Status', 'active', lambda i, rnd: rnd.choice(['Y', 'N']))],
+    'education' : [('School', 'ins_name', lambda i, rnd: 'École %d' % i),
+                   ('Level', 'edu_level', lambda i, rnd: rnd.choice(['Elementary', 'Secondary', 'K-12'])),
+                   ('Board', 'board_name', lambda i, rnd: 'District Board %d' % (i % 60)),
+                   ('BoardCode', 'board_code', lambda i, rnd: 'B%03d' % (i % 60))],
+    'hospital' : [('Facility', 'hospital_name', lambda i, rnd: 'General Hospital %d' % i),
+                  ('Type', 'hospital_type', lambda i, rnd: rnd.choice(['Acute Care', 'Psychiatric', 'Rehabilitation'])),
+                  ('Authority', 'health_authority', lambda i, rnd: 'Health Region %d' % (i % 20)),
+                  ('Hours', 'hours', lambda i, rnd: '24/7')],
+    'library' : [('Library', 'library_name', lambda i, rnd: 'Library %d & Archive' % i),
+                 ('Type', 'library_type', lambda i, rnd: rnd.choice(['Public', 'Branch', 'Regional'])),
+                 ('Board', 'library_board', lambda i, rnd: 'Board %d' % (i % 40)),
+                 ('Hours', 'hours', lambda i, rnd: rnd.choice(['9-5', '10-8', '']))]
+}
+
+def record(database_type, i, rnd):
+    """
+    Returns a list of (column, entry) pairs of the 'i'th synthetic record of
+    'database_type'. One record in a hundred has a malformed postal code, so
+    that it is rejected by the cleaning rules.
+    """
+    city, prov = rnd.choice(CITIES)
+    postcode = 'K%dA %dB%d' % (rnd.randint(0, 9), rnd.randint(0, 9), i % 10)
+    if i % 100 == 0:
+        postcode = rnd.choice(['K1A 0B', '12345', 'KK1 1A1'])
+    entries = [(column, generate(i, rnd)) for column, label, generate in COLUMNS[database_type]]
+    return entries + [('Address', '%d %s' % (rnd.randint(1, 9999), rnd.choice(STREETS))),
+                      ('City', city), ('Province', prov), ('PostalCode', postcode),
+                      ('Phone', '(613) 555-%04d' % rnd.randint(0, 9999))]
+
+def write_csv(path, database_type, n, encoding, seed):
+    """
+    Writes a CSV dataset of 'n' records to 'path', with one row of the wrong
+    length for format correction to remove.
+    """
+    rnd = random.Random(seed)
+    with open(path, 'w', encoding=encoding, newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow([column for column, entry in record(database_type, 1, random.Random(0))])
+        for i in range(n):
+            writer.writerow([entry for column, entry in record(database_type, i, rnd)])
+            if i == n // 2:
+                writer.writerow(['Malformed row', ''])
+
+def write_xml(path, database_type, n, encoding, seed):
+    """
+    Writes an XML dataset of 'n' records to 'path', with the address and
+    contact columns nested in elements of each record.
+    """
+    rnd = random.Random(seed)
+    with open(path, 'w', encoding=encoding) as f:
+        f.write('<?xml version="1.0" encoding="%s"?>\n<Records>\n' % XML_ENCODING_NAMES[encoding])
+        for i in range(n):
+            entries = record(database_type, i, rnd)
+            f.write('<Record>')
+            f.write(''.join('<%s>%s</%s>' % (column, escape(entry), column) for column, entry in entries[:-5]))
+            f.write('<Location>')
+            f.write(''.join('<%s>%s</%s>' % (column, escape(entry), column) for column, entry in entries[-5:-1]))
+            f.write('</Location><Contact><Phone>%s</Phone></Contact></Record>\n' % escape(entries[-1][1]))
+        f.write('</Records>\n')
+
+def write_source(path, localfile, database_type, fmt, full_addr):
+    """
+    Writes the source file of a synthetic dataset to 'path'. If 'full_addr' is
+    set, the address columns are concatenated for the address parser.
+    """
+    info = dict((label, column) for column, label, generate in COLUMNS[database_type])
+    info['phone'] = 'Phone'
+    if full_addr:
+        info['full_addr'] = ['Address', 'City', 'Province', 'PostalCode']
+    else:
+        info['address'] = {'street_name' : 'Address', 'city' : 'City', 'prov/terr' : 'Province', \
+                           'postcode' : 'PostalCode'}
+    metadata = {'localfile' : localfile, 'format' : fmt, 'database_type' : database_type, 'info' : info}
+    if fmt == 'xml':
+        metadata['header'] = 'Record'
+    with open(path, 'w') as f:
+        json.dump(metadata, f, indent=1)
+
+def stub_parse_address(addr):
+    """
+    A deterministic stand-in for libpostal, which labels the tokens of the
+    synthetic addresses by their position.
+    """
+    tokens = addr.split()
+    if len(tokens) < 6:
+        return [(addr, 'road')]
+    return [(tokens[0], 'house_number'), (' '.join(tokens[1:-4]), 'road'), (tokens[-4], 'city'), \
+            (tokens[-3], 'state'), (' '.join(tokens[-2:]), 'postcode')]
+
+def run(srcpath, staged, blank_fill, trace_memory):
+    """
+    Processes a source file with DataProcess one step at a time, and returns
+    the stages recorded in its metrics with the peak memory of the step that
+    ran each stage.
+    """
+    source = opentabulate.Source(srcpath, staged_flag=staged, blank_fill_flag=blank_fill and not staged)
+    source.parse()
+    address_parser = opentabulate.AddressParser(stub_parse_address, version='stub')
+    dp = opentabulate.DataProcess(source, address_parser)
+    steps = [dp.prepareData, dp.extractLabels]
+    if staged:
+        steps += [dp.parse, dp.clean]
+        # the blank-filled dataset is written by its own pass in this mode
+        if blank_fill:
+            steps.append(dp.blankFill)
+    else:
+        steps.append(dp.stream)
+
+    stages = []
+    for step in steps:
+        recorded = len(dp.metrics.stages)
+        if trace_memory:
+            tracemalloc.start()
+        step()
+        peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+        if trace_memory:
+            tracemalloc.stop()
+        for stage in dp.metrics.stages[recorded:]:
+            stage['peak_memory'] = peak
+            stages.append(stage)
+    address_parser.flush()
+    dp._record_address_parsing()
+    stages.extend(dp.metrics.stages[len(stages):])
+    return stages
+
+def compare(results, baseline, threshold):
+    """
+    Prints the change of throughput and peak memory of each stage from the
+    results of an earlier run, and returns the number of stages that are
+    slower, or use more memory, by more than 'threshold' percent.
+    """
+    previous = dict(((r['dataset'], r['mode'], r['stage']), r) for r in baseline['results'])
+    regressions = 0
+    print()
+    print("Compared with", baseline['date'], "(threshold %g%%):" % threshold)
+    if baseline['options'].get('no_memory') != args.no_memory:
+        print("WARNING: only one of the runs measured peak memory, which slows down every stage.")
+    print("%-28s %-7s %-18s %10s %10s" % ('dataset', 'mode', 'stage', 'rows/s', 'memory'))
+    for r in results:
+        old = previous.get((r['dataset'], r['mode'], r['stage']))
+        if old == None or not old.get('rows_per_sec') or not r.get('rows_per_sec'):
+            continue
+        speed = 100.0 * (r['rows_per_sec'] / old['rows_per_sec'] - 1)
+        memory = None
+        if old.get('peak_memory') and r.get('peak_memory') != None:
+            memory = 100.0 * (r['peak_memory'] / old['peak_memory'] - 1)
+        flag = ''
+        if speed < -threshold or (memory != None and memory > threshold):
+            flag = '  REGRESSION'
+            regressions += 1
+        print("%-28s %-7s %-18s %+9.1f%% %10s%s" % (r['dataset'], r['mode'], r['stage'], speed, \
+              '-' if memory == None else '%+9.1f%%' % memory, flag))
+    return regressions
+
+cmd_args = argparse.ArgumentParser(description='Benchmark the DataProcess pipeline on synthetic datasets.')
+cmd_args.add_argument('-n', '--records', action='store', default=100000, type=int, metavar='N', \
+                      help='number of records of each synthetic dataset')
+cmd_args.add_argument('-t', '--type', action='append', choices=sorted(COLUMNS), dest='types', \
+                      help='database type to test, may be repeated (default: all)')
+cmd_args.add_argument('-f', '--format', action='append', choices=['csv', 'xml'], dest='formats', \
+                      help='dataset format to test, may be repeated (default: csv and xml)')
+cmd_args.add_argument('-e', '--encoding', action='append', choices=sorted(XML_ENCODING_NAMES), dest='encodings', \
+                      help='character encoding of the datasets, may be repeated (default: utf-8)')
+cmd_args.add_argument('-m', '--mode', action='store', default='both', choices=['staged', 'stream', 'both'], \
+                      help='run the staged passes, the streaming pass, or both (default: both)')
+cmd_args.add_argument('--split-address', action='store_true', default=False, \
+                      help='use separate address columns instead of parsing a full address')
+cmd_args.add_argument('-b', '--blank-fill', action='store_true', default=False, \
+                      help='also write blank-filled datasets')
+cmd_args.add_argument('-r', '--repeat', action='store', default=1, type=int, metavar='N', \
+                      help='run each dataset N times and keep the fastest run of each stage')
+cmd_args.add_argument('--no-memory', action='store_true', default=False, \
+                      help='do not measure peak memory, which slows down every stage')
+cmd_args.add_argument('-o', '--output', action='store', default=None, type=str, metavar='FILE', \
+                      help='save the results to FILE as JSON')
+cmd_args.add_argument('-c', '--compare', action='store', default=None, type=str, metavar='FILE', \
+                      help='compare with the results saved in FILE, failing on regressions')
+cmd_args.add_argument('--threshold', action='store', default=10.0, type=float, metavar='PERCENT', \
+                      help='slowdown or memory growth reported as a regression (default: 10)')
+args = cmd_args.parse_args()
+
+if args.records < 1 or args.repeat < 1:
+    print("Error! Records and repeats should be positive integers.")
+    exit(1)
+
+baseline = None
+if args.compare != None:
+    with open(args.compare) as f:
+        baseline = json.load(f)
+if args.output != None:
+    args.output = os.path.abspath(args.output)
+
+# the pipeline uses paths relative to the processing directory tree
+tmpdir = tempfile.mkdtemp(prefix='opentab-bench-')
+cwd = os.getcwd()
+os.chdir(tmpdir)
+for d in ['pddir/raw', 'pddir/dirty', 'pddir/clean']:
+    os.makedirs(d)
+
+modes = ['staged', 'stream'] if args.mode == 'both' else [args.mode]
+results = []
+print("%-28s %-7s %-18s %9s %9s %12s %8s %9s" % ('dataset', 'mode', 'stage', 'rows', 'seconds', \
+                                                  'rows/s', 'MB/s', 'peak MB'))
+try:
+    for database_type in args.types or sorted(COLUMNS):
+        for fmt in args.formats or ['csv', 'xml']:
+            for encoding in args.encodings or ['utf-8']:
+                name = '%s-%s-%s' % (database_type, fmt, encoding)
+                localfile = name + '.' + fmt
+                (write_csv if fmt == 'csv' else write_xml)('pddir/raw/' + localfile, database_type, \
+                                                           args.records, encoding, 0)
+                srcpath = os.path.join(tmpdir, name + '.json')
+                write_source(srcpath, localfile, database_type, fmt, not args.split_address)
+
+                for mode in modes:
+                    best = dict()
+                    for i in range(args.repeat):
+                        # encodings are guessed again by every run
+                        if os.path.exists('pddir/encoding_cache.json'):
+                            os.remove('pddir/encoding_cache.json')
+                        for stage in run(srcpath, mode == 'staged', args.blank_fill, not args.no_memory):
+                            if stage['stage'] not in best or stage['wall'] < best[stage['stage']]['wall']:
+                                best[stage['stage']] = stage
+                    for stage in best.values():
+                        result = {'dataset' : name, 'mode' : mode, 'stage' : stage['stage'], \
+                                  'rows' : stage.get('rows_out'), 'wall' : stage['wall'], 'cpu' : stage['cpu'], \
+                                  'rows_per_sec' : stage.get('rows_per_sec'), \
+                                  'bytes_per_sec' : stage.get('bytes_per_sec'), \
+                                  'peak_memory' : stage.get('peak_memory')}
+                        results.append(result)
+                        print("%-28s %-7s %-18s %9s %9.3f %12s %8s %9s" % (name, mode, result['stage'], \
+                              '-' if result['rows'] == None else result['rows'], result['wall'], \
+                              '-' if result['rows_per_sec'] == None else '%.0f' % result['rows_per_sec'], \
+                              '-' if result['bytes_per_sec'] == None else '%.1f' % (result['bytes_per_sec'] / 1e6), \
+                              '-' if result['peak_memory'] == None else '%.1f' % (result['peak_memory'] / 1e6)))
+finally:
+    os.chdir(cwd)
+    shutil.rmtree(tmpdir)
+
+if args.output != None:
+    with open(args.output, 'w') as f:
+        json.dump({'date' : time.strftime('%Y-%m-%d %H:%M:%S'), \
+                   'python' : platform.python_version(), \
+                   'platform' : platform.platform(), \
+                   'version' : opentabulate.Algorithm.VERSION, \
+                   'options' : vars(args), \
+                   'results' : results}, f, indent=1)
+    print("Results saved to", args.output)
+
+if baseline != None and compare(results, baseline, args.threshold) > 0:
+    exit(1)
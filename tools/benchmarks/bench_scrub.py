@@ -0,0 +1,74 @@
+# A micro-benchmark comparing the regular expression implementation of
+# Algorithm._quick_scrub with the current batch scrubbing engine.
+
+# Modules
+import argparse
+import os
+import random
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+import opentabulate
+
+def legacy_quick_scrub(entry):
+    """
+    The original regular expression implementation of Algorithm._quick_scrub.
+    """
+    if isinstance(entry, bytes):
+        entry = entry.decode()
+    entry = re.sub(r"\s+", " ", entry)
+    entry = re.sub(r"^\s+([^\s].+)", r"\1", entry)
+    entry = re.sub(r"(.+[^\s])\s+$", r"\1", entry)
+    entry = re.sub(r"^\s+$", "", entry)
+    entry = entry.lower()
+    return entry
+
+def business_rows(n, seed):
+    """
+    Generates 'n' rows of raw fields resembling a municipal business register.
+    """
+    rnd = random.Random(seed)
+    names = ['ACME HOLDINGS INC.', 'Tim Hortons #1042', "  Bob's   Diner ", 'GESTION L. TREMBLAY LTÉE',
+             'Maple Leaf\tFoods', 'J', '']
+    streets = ['123 Main St', '45  KING STREET W', ' 7 Rue Sainte-Catherine Est', '1000 Portage Ave\n', '']
+    cities = ['Ottawa', 'WINNIPEG', ' Montréal', 'St. John\'s ', 'Halifax']
+    provs = ['ON', 'Manitoba', 'QC', ' NL', 'nova scotia']
+    codes = ['K1A 0B1', 'R3C4T3', 'h2x 1y4 ', '', 'B3H  4R2']
+    phones = ['(613) 555-1234', '204-555-0199', '', '514 555 0100']
+    rows = []
+    for i in range(n):
+        rows.append([rnd.choice(names), str(i), rnd.choice(streets), rnd.choice(cities), rnd.choice(provs),
+                     rnd.choice(codes), rnd.choice(phones), rnd.choice(['Y', 'N', ' y ']),
+                     '%.4f' % rnd.uniform(42, 60), '%.4f' % rnd.uniform(-140, -52)])
+    return rows
+
+cmd_args = argparse.ArgumentParser(description='Benchmark the entry scrubbing engine.')
+cmd_args.add_argument('-n', '--rows', action='store', default=100000, type=int, metavar='N', \
+                      help='number of synthetic rows to scrub')
+cmd_args.add_argument('-r', '--repeat', action='store', default=3, type=int, metavar='R', \
+                      help='number of timing repetitions, the best time is reported')
+args = cmd_args.parse_args()
+
+rows = business_rows(args.rows, 0)
+nfields = sum(len(row) for row in rows)
+algorithm = opentabulate.Algorithm()
+
+# the batch engine must give the same output as the original implementation
+for row in rows:
+    if algorithm._quick_scrub_batch(row) != [legacy_quick_scrub(entry) for entry in row]:
+        print("Error! Scrubbed output differs for row:", row)
+        exit(1)
+
+timings = [('legacy (per entry, regex)', lambda: [[legacy_quick_scrub(e) for e in row] for row in rows]),
+           ('_quick_scrub (per entry)', lambda: [[algorithm._quick_scrub(e) for e in row] for row in rows]),
+           ('_quick_scrub_batch (per row)', lambda: [algorithm._quick_scrub_batch(row) for row in rows])]
+
+print("Scrubbing", nfields, "fields in", args.rows, "rows.")
+base = None
+for name, func in timings:
+    best = min(timeit.repeat(func, number=1, repeat=args.repeat))
+    if base == None:
+        base = best
+    print("%-30s %8.3f s %12.0f fields/s %6.1fx" % (name, best, nfields / best, base / best))
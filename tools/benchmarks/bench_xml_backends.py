@@ -0,0 +1,81 @@
+# A benchmark comparing the XML backends of XML_Algorithm on the same dataset.
+
+# Modules
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+import opentabulate
+
+from xml.sax.saxutils import escape
+
+def write_dataset(path, n, seed):
+    """
+    Writes an XML dataset of 'n' library records to 'path'.
+    """
+    rnd = random.Random(seed)
+    cities = ['Ottawa', 'Winnipeg', 'Montréal', "St. John's", 'Halifax']
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="utf-8"?>\n<Libraries>\n')
+        for i in range(n):
+            f.write('<Library><Name>%s</Name><Type>Public</Type><Board>Board %d</Board>'
+                    '<Location><Civic>%d Main St</Civic><City>%s</City><Province>ON</Province>'
+                    '<PostalCode>K1A 0B1</PostalCode></Location><Contact><Phone>613-555-%04d</Phone>'
+                    '<Hours/></Contact></Library>\n' % (escape('Library %d & Archive' % i), i % 40,
+                                                         rnd.randint(1, 9999), escape(rnd.choice(cities)),
+                                                         rnd.randint(0, 9999)))
+        f.write('</Libraries>\n')
+
+cmd_args = argparse.ArgumentParser(description='Benchmark the XML backends of XML_Algorithm.')
+cmd_args.add_argument('-n', '--records', action='store', default=100000, type=int, metavar='N', \
+                      help='number of synthetic records to parse')
+cmd_args.add_argument('--source', action='store', default=None, type=str, metavar='FILE', \
+                      help='benchmark the XML dataset of a source file instead of a synthetic dataset')
+args = cmd_args.parse_args()
+
+tmpdir = tempfile.mkdtemp(prefix='opentab-bench-')
+if args.source != None:
+    source = opentabulate.Source(os.path.abspath(args.source))
+    source.parse()
+    source.rawpath = os.path.abspath(source.rawpath)
+else:
+    data_path = os.path.join(tmpdir, 'libraries.xml')
+    write_dataset(data_path, args.records, 0)
+    src_path = os.path.join(tmpdir, 'libraries.json')
+    with open(src_path, 'w') as f:
+        json.dump({'localfile' : 'libraries.xml', 'format' : 'xml', 'header' : 'Library', \
+                   'database_type' : 'library', 'encoding' : 'utf-8', \
+                   'info' : {'library_name' : 'Name', 'library_type' : 'Type', 'library_board' : 'Board', \
+                             'hours' : 'Contact/Hours', 'phone' : 'Phone', \
+                             'address' : {'street_name' : 'Civic', 'city' : 'City', \
+                                          'prov/terr' : 'Province', 'postcode' : 'PostalCode'}}}, f)
+    source = opentabulate.Source(src_path)
+    source.parse()
+    source.rawpath = data_path
+
+print("Dataset:", source.rawpath, "(%d bytes)" % os.path.getsize(source.rawpath))
+reference = None
+for name in sorted(opentabulate.XML_BACKENDS):
+    if name == 'lxml' and opentabulate.lxml_etree == None:
+        print("%-8s not installed" % name)
+        continue
+    source.xml_backend = name
+    algorithm = opentabulate.XML_Algorithm(None, source.metadata['database_type'])
+    algorithm.extract_labels(source)
+    start = time.perf_counter()
+    rows = list(algorithm._parse_rows(source))
+    elapsed = time.perf_counter() - start
+    if reference == None:
+        reference = rows
+    elif rows != reference:
+        print("Error! Backend", name, "gives different rows.")
+        exit(1)
+    print("%-8s %8.3f s %12.0f records/s" % (name, elapsed, (len(rows) - 1) / elapsed))
+
+shutil.rmtree(tmpdir)
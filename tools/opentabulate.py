@@ -28,18 +28,55 @@ Statistics Canada
 # MODULES #
 ###########
 
+import array
+import bz2
+import codecs
+import collections
+import contextlib
 import csv
+import fcntl
+import gzip
+import hashlib
+import heapq
+import importlib
+import io
+import itertools
 import json
+import lzma
+import mmap
+import multiprocessing
+import multiprocessing.connection as mpc
 import operator
 import os
 import re
 import requests
+import shutil
+import sqlite3
+import struct
 import subprocess
+import sys
+import tempfile
+import threading
+import time
 import urllib.request as req
+import zlib
 
 from xml.etree import ElementTree
 from zipfile import ZipFile
 
+# optional C-accelerated XML parser
+try:
+    from lxml import etree as lxml_etree
+except ImportError:
+    lxml_etree = None
+
+# optional Parquet output
+try:
+    import pyarrow
+    import pyarrow.parquet as pyarrow_parquet
+except ImportError:
+    pyarrow = None
+
 
 #############################
 # CORE DATA PROCESS CLASSES #
@@ -57,6 +94,8 @@ class DataProcess(object):
 
       dp_address_parser: An object containing an address parser method,
         defined by an AddressParser object.
+
+      metrics: StageMetrics object recording the processing stages.
     """
     def __init__(self, source=None, address_parser=None, algorithm=None):
         """
@@ -68,22 +107,26 @@ class DataProcess(object):
             as a Source object.
 
           address_parser: An address parsing function which accepts a
-            string as an argument.
+            string as an argument, or an AddressParser object.
 
           algorithm: An object that is a child class of Algorithm.
         """
         self.source = source
 
         if address_parser != None:
-            self.dp_address_parser = AddressParser(address_parser)
+            self.setAddressParser(address_parser)
 
         self.algorithm = algorithm
+        self.metrics = StageMetrics(source.local_fname if source != None else None)
 
     def setAddressParser(self, address_parser):
         """
         Set the current address parser.
         """
-        self.dp_address_parser = AddressParser(address_parser)
+        if isinstance(address_parser, AddressParser):
+            self.dp_address_parser = address_parser
+        else:
+            self.dp_address_parser = AddressParser(address_parser)
 
     
     def process(self):
@@ -96,12 +139,21 @@ class DataProcess(object):
             self.preprocessData()
         self.prepareData()
         self.extractLabels()
-        self.parse()
-        self.clean()
+        # the staged mode writes each intermediate step to disk, which is
+        # useful for debugging but costs additional passes over the data
+        if self.source.staged_flag:
+            self.parse()
+            self.clean()
+        else:
+            self.stream()
+        self.dp_address_parser.flush()
+        self._record_address_parsing()
         if self.source.post_flag:
             self.postprocessData()
-        if self.source.blank_fill_flag:
-            self.blankFill()
+            # the blank-filled dataset is written with the clean dataset, 
+            # unless a script modifies the clean dataset afterwards
+            if self.source.blank_fill_flag:
+                self.blankFill()
 
     def preprocessData(self):
         """
@@ -120,16 +172,23 @@ class DataProcess(object):
         else:
             return None
 
+        with self.metrics.stage('preprocess'):
+            self._run_scripts(scr, self.source.rawpath, 'preprocessing')
+
+    def _run_scripts(self, scr, path, kind):
+        """
+        Runs a script, or a list of scripts, with the argument 'path'.
+        """
         # string argument for script path
         if isinstance(scr, str):
-            print('DEBUG: Running preprocessing script "%s".' % scr)
-            rc = subprocess.call([scr, self.source.rawpath])
+            print('DEBUG: Running %s script "%s".' % (kind, scr))
+            rc = subprocess.call([scr, path])
             print('DEBUG: process return code %d.' % rc)
         # list of strings argument for script path
         elif isinstance(scr, list):
             for subscr in scr:
-                print('DEBUG: Running preprocessing script "%s".' % subscr)
-                rc = subprocess.call([subscr, self.source.rawpath])
+                print('DEBUG: Running %s script "%s".' % (kind, subscr))
+                rc = subprocess.call([subscr, path])
                 print('DEBUG: process return code %d.' % rc)
 
                 
@@ -140,11 +199,24 @@ class DataProcess(object):
         """
         if self.source.metadata['format'] == 'csv':
             fmt_algorithm = CSV_Algorithm(self.dp_address_parser, self.source.metadata['database_type'])
-            fmt_algorithm.format_correction(self.source, fmt_algorithm.char_encode_check(self.source))
         elif self.source.metadata['format'] == 'xml':
             fmt_algorithm = XML_Algorithm(self.dp_address_parser, self.source.metadata['database_type'])
         # need the following line so the Algorithm wrapper methods work
         self.algorithm = fmt_algorithm
+
+        with self.metrics.stage('encoding_check') as stage:
+            fmt_algorithm.char_encode_check(self.source)
+            stage['bytes_read'] = fmt_algorithm.encoding_bytes_read
+
+        # in streaming mode, format correction is applied during 'stream'
+        if self.source.metadata['format'] == 'csv' and self.source.staged_flag:
+            with self.metrics.stage('format_correction') as stage:
+                fmt_algorithm.format_correction(self.source, self.source.encoding)
+                stage.update(bytes_read=self.source.raw_stat()[0], \
+                             bytes_written=_file_size(self.source.dirtypath, self.source.dirtypath + '.errors'), \
+                             rows_in=fmt_algorithm.fc_row_count - 1, \
+                             rows_out=fmt_algorithm.fc_row_count - 1 - fmt_algorithm.fc_error_count, \
+                             rows_rejected=fmt_algorithm.fc_error_count)
         
     def extractLabels(self):
         """
@@ -157,14 +229,127 @@ class DataProcess(object):
         'Algorithm' wrapper method. Parses the source dataset based on label extraction,
         and reformats the data into a dirty CSV file.
         """
-        self.algorithm.parse(self.source)
+        with self.metrics.stage('parse') as stage:
+            # the dirty CSV file of format correction is overwritten
+            bytes_read = _file_size(self.source.dirtypath) if self.source.metadata['format'] == 'csv' \
+                         else self.source.raw_stat()[0]
+            self.algorithm.parse(self.source)
+            stage.update(bytes_read=bytes_read, bytes_written=_file_size(self.source.dirtypath), \
+                         rows_in=self.algorithm.records_read, rows_out=self.algorithm.rows_parsed)
 
     def clean(self):
         """
         'Algorithm' wrapper method. Applies basic data cleaning to a recently parsed
         and reformatted dataset.
         """
-        self.algorithm.clean(self.source)
+        with self.metrics.stage('clean') as stage:
+            stage['bytes_read'] = _file_size(self.source.dirtypath)
+            self.algorithm.clean(self.source)
+            self._record_clean(stage, self.source.cleanpath)
+
+    def stream(self):
+        """
+        'Algorithm' wrapper method. Applies format correction, parsing and cleaning
+        in a single pass over the raw dataset, without writing a dirty CSV file.
+        """
+        with self.metrics.stage('stream') as stage:
+            self.algorithm.stream(self.source)
+            stage['bytes_read'] = self.source.raw_stat()[0]
+            self._record_clean(stage, self.source.cleanpath, self.source.dirtypath + '.errors')
+
+    def _record_clean(self, stage, cleanpath, fc_errorpath=None):
+        """
+        Adds the rows and outputs of '_write_clean' to the metrics of a stage. 
+        If 'fc_errorpath' is given, format correction was part of the stage, 
+        whose rows read are then the records of the raw dataset.
+        """
+        algorithm = self.algorithm
+        rejected = sum(algorithm.clean_rejections.values())
+        rows_out = algorithm.clean_rows_in - rejected
+        rows_in = algorithm.clean_rows_in
+        paths = [cleanpath, cleanpath + '.errors', cleanpath + '.bf']
+        if fc_errorpath != None:
+            rows_in = algorithm.records_read
+            if isinstance(algorithm, CSV_Algorithm):
+                rows_in = algorithm.fc_row_count - 1
+                rejected += algorithm.fc_error_count
+                paths.append(fc_errorpath)
+        stage.update(bytes_written=_file_size(*paths), rows_in=rows_in, rows_out=rows_out, \
+                     rows_rejected=rejected)
+        if algorithm.clean_rejections:
+            stage['rejections'] = dict(algorithm.clean_rejections)
+
+    def _record_address_parsing(self):
+        """
+        Adds the time spent parsing addresses, which is part of the parsing 
+        stage, to the metrics.
+        """
+        parser = self.dp_address_parser
+        lookups = parser.hits + parser.disk_hits + parser.misses
+        if lookups > 0:
+            self.metrics.add('address_parsing', wall=parser.parse_time, rows_in=lookups, \
+                             rows_out=lookups, cache=parser.stats())
+
+    def splitData(self, chunk_size):
+        """
+        Prepares a CSV dataset to be processed in chunks by several processes,
+        and returns the byte ranges of the chunks. Each chunk is processed with 
+        'processChunk', after which the outputs are combined with 'mergeChunks'.
+
+        Args:
+
+          chunk_size: Approximate size of each chunk in bytes.
+
+        Returns:
+
+          ranges: A list of (start, end) byte offset tuples.
+        """
+        if self.source.pre_flag:
+            self.preprocessData()
+        self.prepareData()
+        self.extractLabels()
+        return self.algorithm.split_chunks(self.source, chunk_size)
+
+    def processChunk(self, index, start, end):
+        """
+        'Algorithm' wrapper method. Applies 'stream' to a chunk of a CSV dataset,
+        as returned by 'splitData'.
+
+        Returns:
+
+          count: The number of records in the chunk.
+        """
+        self.prepareData()
+        self.extractLabels()
+        with self.metrics.stage('stream') as stage:
+            count = self.algorithm.stream_chunk(self.source, index, start, end)
+            stage['bytes_read'] = end - start
+            self._record_clean(stage, self.source.cleanpath + '.part%d' % index, \
+                               self.source.dirtypath + '.part%d.errors' % index)
+        self.dp_address_parser.flush()
+        self._record_address_parsing()
+        return count
+
+    def mergeChunks(self, counts):
+        """
+        'Algorithm' wrapper method. Combines the outputs of 'processChunk' and 
+        completes processing, as done by 'process'.
+
+        Args:
+
+          counts: A list of the record counts returned by 'processChunk', in 
+            the order of the chunks.
+        """
+        self.prepareData()
+        with self.metrics.stage('merge') as stage:
+            self.algorithm.merge_chunks(self.source, counts)
+            stage.update(rows_in=sum(counts), bytes_written=_file_size(self.source.cleanpath, \
+                         self.source.cleanpath + '.errors', self.source.cleanpath + '.bf', \
+                         self.source.dirtypath + '.errors'))
+        if self.source.post_flag:
+            self.postprocessData()
+            if self.source.blank_fill_flag:
+                self.blankFill()
 
     def postprocessData(self):
         """
@@ -183,17 +368,8 @@ class DataProcess(object):
         else:
             return None
 
-        # string argument for script path
-        if isinstance(scr, str):
-            print('DEBUG: Running postprocess script "%s".' % scr)
-            rc = subprocess.call([scr, self.source.cleanpath])
-            print('DEBUG: process return code %d.' % rc)
-        # list of strings argument for script path
-        elif isinstance(scr, list):
-            for subscr in scr:
-                print('DEBUG: Running postprocess script "%s".' % subscr)
-                rc = subprocess.call([subscr, self.source.cleanpath])
-                print('DEBUG: process return code %d.' % rc)
+        with self.metrics.stage('postprocess'):
+            self._run_scripts(scr, self.source.cleanpath, 'postprocess')
 
 
     def blankFill(self):
@@ -201,19 +377,49 @@ class DataProcess(object):
         'Algorithm' wrapper method. Adds columns from the standard list by appending 
         blanks.
         """
-        self.algorithm.blank_fill(self.source)
+        with self.metrics.stage('blank_fill') as stage:
+            self.algorithm.blank_fill(self.source)
+            stage.update(bytes_read=_file_size(self.source.cleanpath), \
+                         bytes_written=_file_size(self.source.cleanpath + '.bf'), \
+                         rows_in=self.algorithm.blank_fill_rows, rows_out=self.algorithm.blank_fill_rows)
 
 class AddressParser(object):
     """
-    Wrapper class for an address parser.
+    Wrapper class for an address parser. Parsed addresses are memoized in a
+    bounded in-process LRU cache and, optionally, in an SQLite database on disk
+    that can be shared between processes and runs.
 
     Currently supported parsers: libpostal
 
     Attributes:
 
       address_parser: Address parsing function.
+
+      cache_size: Maximum number of parsed addresses kept in memory.
+
+      cache_path: Path to the SQLite database of parsed addresses, or 'None'.
+
+      version: Version tag of the address parser. Parsed addresses stored on
+        disk are only reused by a parser with the same version tag.
+
+      hits: Number of addresses found in the in-process cache.
+
+      disk_hits: Number of addresses found in the on-disk cache.
+
+      misses: Number of addresses sent to the address parsing function.
+
+      parse_time: Wall clock time in seconds spent in the address parsing 
+        function, or waiting for the parser processes.
     """
-    def __init__(self, address_parser=None):
+
+    # number of new on-disk cache entries buffered and written per transaction,
+    # which is kept small so that the write lock is only held briefly
+    _DISK_COMMIT_INTERVAL = 64
+
+    # seconds to wait for the write lock of the on-disk cache
+    _DISK_TIMEOUT = 5
+
+    def __init__(self, address_parser=None, cache_size=100000, cache_path=None, version=None):
         """
         Initialize an AddressParser object.
 
@@ -221,8 +427,41 @@ class AddressParser(object):
 
           address_parser: An address parsing function which accepts a string 
             as an argument.
+
+          cache_size: Maximum number of parsed addresses kept in memory. If 0,
+            the in-process cache is disabled.
+
+          cache_path: Path to an SQLite database used as an on-disk cache. If
+            'None', parsed addresses are not stored on disk.
+
+          version: Version tag of the address parser. If 'None', the module and
+            name of 'address_parser' are used.
         """
         self.address_parser = address_parser
+        self.cache_size = cache_size
+        self.cache_path = cache_path
+
+        if version == None and address_parser != None:
+            version = getattr(address_parser, '__module__', '') + '.' + \
+                      getattr(address_parser, '__qualname__', type(address_parser).__name__)
+        self.version = version
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.parse_time = 0.0
+
+        self._cache = collections.OrderedDict()
+        self._db = None
+        self._uncommitted = []
+
+    def __getstate__(self):
+        # database connections cannot be sent to other processes, they are
+        # opened again when needed
+        state = self.__dict__.copy()
+        state['_db'] = None
+        state['_uncommitted'] = []
+        return state
 
     def parse(self, addr):
         """
@@ -237,7 +476,454 @@ class AddressParser(object):
           self.address_parser(addr): parsed address in libpostal 
             format.
         """
-        return self.address_parser(addr)
+        ap_entry = self._cache_lookup(addr)
+        if ap_entry == None:
+            self.misses += 1
+            start = time.perf_counter()
+            ap_entry = self.address_parser(addr)
+            self.parse_time += time.perf_counter() - start
+            self._cache_store(addr, ap_entry)
+        return ap_entry
+
+    def parse_iter(self, addrs):
+        """
+        Generator that parses an iterable of address strings, yielding the tokens
+        of each address in order.
+
+        Args:
+
+          addrs: An iterable of strings containing the addresses to parse.
+        """
+        for addr in addrs:
+            yield self.parse(addr)
+
+    def _cache_lookup(self, addr):
+        """
+        Returns the cached tokens of an address, or 'None' if it is not cached.
+        """
+        cache = self._cache
+        if addr in cache:
+            self.hits += 1
+            cache.move_to_end(addr)
+            return cache[addr]
+        if self.cache_path != None:
+            ap_entry = self._disk_lookup(addr)
+            if ap_entry != None:
+                self.disk_hits += 1
+                self._memory_store(addr, ap_entry)
+                return ap_entry
+        return None
+
+    def _cache_store(self, addr, ap_entry):
+        """
+        Adds newly parsed address tokens to the caches.
+        """
+        if self.cache_path != None:
+            self._disk_store(addr, ap_entry)
+        self._memory_store(addr, ap_entry)
+
+    def _memory_store(self, addr, ap_entry):
+        if self.cache_size > 0:
+            cache = self._cache
+            cache[addr] = ap_entry
+            if len(cache) > self.cache_size:
+                cache.popitem(last=False)
+
+    def stats(self):
+        """
+        Returns a dict of cache hit and miss counts.
+        """
+        return {'hits' : self.hits, 'disk_hits' : self.disk_hits, 'misses' : self.misses}
+
+    def flush(self):
+        """
+        Writes pending entries to the on-disk cache and closes it.
+        """
+        if self._uncommitted:
+            self._disk_write()
+        if self._db != None:
+            self._db.close()
+            self._db = None
+
+    def _connect(self):
+        if self._db == None:
+            # in WAL mode, readers are not blocked by the writing process
+            db = sqlite3.connect(self.cache_path, timeout=self._DISK_TIMEOUT)
+            try:
+                db.execute("PRAGMA journal_mode=WAL")
+                db.execute("CREATE TABLE IF NOT EXISTS address_cache "
+                           "(version TEXT, addr TEXT, tokens TEXT, PRIMARY KEY (version, addr))")
+                db.commit()
+            except sqlite3.OperationalError:
+                db.close()
+                raise
+            self._db = db
+        return self._db
+
+    def _disk_lookup(self, addr):
+        try:
+            row = self._connect().execute("SELECT tokens FROM address_cache WHERE version = ? AND addr = ?", \
+                                          (self.version, addr)).fetchone()
+        except sqlite3.OperationalError:
+            # a busy or locked database is treated as a cache miss
+            return None
+        if row == None:
+            return None
+        return [tuple(token) for token in json.loads(row[0])]
+
+    def _disk_store(self, addr, ap_entry):
+        # entries are buffered so that each transaction is short
+        self._uncommitted.append((self.version, addr, json.dumps(ap_entry)))
+        if len(self._uncommitted) >= self._DISK_COMMIT_INTERVAL:
+            self._disk_write()
+
+    def _disk_write(self):
+        """
+        Writes the buffered entries to the on-disk cache in one transaction. If
+        the database stays locked, the entries are dropped, since they are only
+        a cache.
+        """
+        entries = self._uncommitted
+        self._uncommitted = []
+        try:
+            db = self._connect()
+            with db:
+                db.executemany("INSERT OR REPLACE INTO address_cache VALUES (?, ?, ?)", entries)
+        except sqlite3.OperationalError:
+            pass
+
+
+class RemoteAddressParser(AddressParser):
+    """
+    An AddressParser that sends batches of addresses to the dedicated parser
+    processes of an AddressParserService. Batches are sent to the parser 
+    processes in turn, and several batches may be in flight at once so that 
+    the parser processes are kept busy, while tokens are still returned in 
+    the order of the addresses.
+
+    Attributes:
+
+      service_addresses: Listener addresses of the parser processes.
+
+      authkey: Authentication key of the parser processes.
+
+      batch_size: Number of addresses sent to a parser process at once.
+
+      pipeline_depth: Maximum number of batches waiting for their tokens.
+    """
+    def __init__(self, service, batch_size=256, pipeline_depth=None, **kwargs):
+        """
+        Initialize a RemoteAddressParser object.
+
+        Args:
+
+          service: A started AddressParserService object.
+
+          batch_size: Number of addresses sent to a parser process at once.
+
+          pipeline_depth: Maximum number of batches waiting for their tokens. 
+            If 'None', two batches per parser process are allowed.
+
+          kwargs: Caching arguments, as accepted by AddressParser.
+        """
+        if kwargs.get('version') == None:
+            kwargs['version'] = service.parser_path
+        AddressParser.__init__(self, None, **kwargs)
+        self.service_addresses = service.addresses
+        self.authkey = service.authkey
+        self.batch_size = batch_size
+        if pipeline_depth == None:
+            pipeline_depth = 2 * len(service.addresses)
+        self.pipeline_depth = pipeline_depth
+
+        self._conns = None
+        self._next_conn = 0
+
+    def __getstate__(self):
+        state = AddressParser.__getstate__(self)
+        state['_conns'] = None
+        return state
+
+    def parse(self, addr):
+        """
+        Parses and address string and returns the tokens.
+
+        Args:
+
+          addr: A string containing the address to parse.
+
+        Returns:
+
+          tokens: parsed address in libpostal format.
+        """
+        return next(self.parse_iter([addr]))
+
+    def parse_iter(self, addrs):
+        """
+        Generator that parses an iterable of address strings, yielding the tokens
+        of each address in order.
+
+        Args:
+
+          addrs: An iterable of strings containing the addresses to parse.
+        """
+        pending = collections.deque()
+        batch = []
+        for addr in addrs:
+            batch.append(addr)
+            if len(batch) == self.batch_size:
+                pending.append(self._submit_batch(batch))
+                batch = []
+                while len(pending) > self.pipeline_depth:
+                    yield from self._finish_batch(pending.popleft())
+        if batch:
+            pending.append(self._submit_batch(batch))
+        while pending:
+            yield from self._finish_batch(pending.popleft())
+
+    def flush(self):
+        """
+        Commits pending entries to the on-disk cache and closes the connections
+        to the parser processes.
+        """
+        AddressParser.flush(self)
+        if self._conns != None:
+            for conn in self._conns:
+                conn.close()
+            self._conns = None
+
+    def _submit_batch(self, batch):
+        """
+        Looks up a batch of addresses in the caches and sends the remaining 
+        addresses to the next parser process. Returns the state of the batch
+        for '_finish_batch'.
+        """
+        tokens = [self._cache_lookup(addr) for addr in batch]
+        misses = list(set(batch[i] for i in range(len(batch)) if tokens[i] == None))
+        conn = None
+        if misses:
+            if self._conns == None:
+                self._conns = [mpc.Client(address, authkey=self.authkey) \
+                               for address in self.service_addresses]
+            conn = self._conns[self._next_conn]
+            self._next_conn = (self._next_conn + 1) % len(self._conns)
+            conn.send(misses)
+        return (batch, tokens, misses, conn)
+
+    def _finish_batch(self, state):
+        """
+        Receives the tokens of a batch from its parser process, if needed, and 
+        yields the tokens of each address of the batch in order.
+        """
+        batch, tokens, misses, conn = state
+        if conn != None:
+            start = time.perf_counter()
+            parsed = dict(zip(misses, conn.recv()))
+            self.parse_time += time.perf_counter() - start
+            self.misses += len(misses)
+            for addr in misses:
+                self._cache_store(addr, parsed[addr])
+            tokens = [parsed[batch[i]] if tokens[i] == None else tokens[i] for i in range(len(batch))]
+        yield from tokens
+
+
+class AddressParserService(object):
+    """
+    A set of dedicated address parser processes, which load the address parser 
+    once and parse batches of addresses sent by RemoteAddressParser objects
+    over local connections. This allows the number of address parser processes
+    to be chosen independently from the number of data processing jobs.
+
+    Attributes:
+
+      parser_path: Import path of the address parsing function, such as
+        'postal.parser.parse_address'.
+
+      nprocs: Number of parser processes.
+
+      addresses: Listener addresses of the parser processes.
+
+      authkey: Authentication key for connections to the parser processes.
+    """
+    def __init__(self, parser_path='postal.parser.parse_address', nprocs=1):
+        """
+        Initialize an AddressParserService object.
+
+        Args:
+
+          parser_path: Import path of the address parsing function.
+
+          nprocs: Number of parser processes.
+        """
+        self.parser_path = parser_path
+        self.nprocs = nprocs
+        self.addresses = []
+        self.authkey = os.urandom(32)
+        self._procs = []
+        self._tmpdir = None
+
+    def start(self):
+        """
+        Starts the parser processes, and waits until each of them has loaded
+        the address parser.
+
+        Raises:
+
+          RuntimeError: A parser process failed to start.
+        """
+        self._tmpdir = tempfile.mkdtemp(prefix='opentab-parser-')
+        ready = []
+        for i in range(self.nprocs):
+            address = os.path.join(self._tmpdir, 'parser-%d.sock' % i)
+            recv_end, send_end = multiprocessing.Pipe(duplex=False)
+            proc = multiprocessing.Process(target=_address_parser_server, \
+                                           args=(self.parser_path, address, self.authkey, send_end), \
+                                           daemon=True)
+            proc.start()
+            send_end.close()
+            self._procs.append(proc)
+            self.addresses.append(address)
+            ready.append(recv_end)
+        for recv_end in ready:
+            try:
+                recv_end.recv()
+            except EOFError:
+                self.stop()
+                raise RuntimeError("Address parser process failed to start.")
+
+    def stop(self):
+        """
+        Stops the parser processes.
+        """
+        for proc in self._procs:
+            proc.terminate()
+            proc.join()
+        self._procs = []
+        self.addresses = []
+        if self._tmpdir != None:
+            shutil.rmtree(self._tmpdir, ignore_errors=True)
+            self._tmpdir = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+def _address_parser_server(parser_path, address, authkey, ready):
+    """
+    Main function of an AddressParserService parser process. Each connection is
+    served by its own thread, which answers every batch of addresses it receives
+    with the list of their tokens.
+    """
+    module_name, func_name = parser_path.rsplit('.', 1)
+    parse_address = getattr(importlib.import_module(module_name), func_name)
+    listener = mpc.Listener(address, authkey=authkey)
+    ready.send(True)
+    ready.close()
+
+    def serve(conn):
+        with conn:
+            while True:
+                try:
+                    batch = conn.recv()
+                except EOFError:
+                    return
+                conn.send([parse_address(addr) for addr in batch])
+
+    while True:
+        conn = listener.accept()
+        threading.Thread(target=serve, args=(conn,), daemon=True).start()
+
+
+##################
+# CLEANING RULES #
+##################
+
+class CleanRule(object):
+    """
+    A declarative cleaning rule for the entries of one column. The rule is a
+    list of steps applied in order to each non-empty entry of the column:
+
+      ('normalize', function): replaces the entry by 'function(entry)'.
+
+      ('check', name, predicate, error): rejects the row if 'predicate(entry)'
+        is false.
+
+      ('lookup', name, table, error): replaces the entry by 'table[entry]', or
+        rejects the row if the entry is not a key of 'table'.
+
+    A rejected row is written to the '.errors' file with 'error' in its ERROR
+    column, and counted under '<label>:<name>'. The entry keeps the value it 
+    had when the row was rejected.
+
+    Attributes:
+
+      label: Standardized column name the rule applies to.
+
+      steps: List of steps, as described above.
+    """
+    def __init__(self, label, steps):
+        self.label = label
+        self.steps = steps
+
+    def compile(self):
+        """
+        Returns a function that applies the rule to a non-empty entry, and
+        returns the resulting entry and the step that rejected it, or 'None'.
+        """
+        steps = self.steps
+        if len(steps) == 1 and steps[0][0] == 'normalize':
+            normalize = steps[0][1]
+            return lambda entry: (normalize(entry), None)
+
+        def apply(entry):
+            for step in steps:
+                if step[0] == 'normalize':
+                    entry = step[1](entry)
+                elif step[0] == 'check':
+                    if not step[2](entry):
+                        return entry, step
+                else:
+                    value = step[2].get(entry)
+                    if value == None:
+                        return entry, step
+                    entry = value
+            return entry, None
+        return apply
+
+def _remove_whitespace_upper(entry):
+    return ''.join(entry.split()).upper()
+
+_PHONE_PUNCTUATION = str.maketrans('', '', '()-')
+
+def _remove_phone_punctuation(entry):
+    return ''.join(entry.split()).translate(_PHONE_PUNCTUATION)
+
+def _three_letters_three_digits(entry):
+    return sum(map(str.isalpha, entry)) == 3 and sum(map(str.isdigit, entry)) == 3
+
+_POSTCODE_FORMAT = re.compile(r'[A-Z][0-9][A-Z][0-9][A-Z][0-9]')
+
+# province and territory names and abbreviations, mapped to abbreviations
+_PROV_TERR_TABLE = {"ab": "ab", "bc": "bc", "mb": "mb", "nb": "nb", "nl": "nl", "ns": "ns", "nt": "nt", \
+                    "nu": "nu", "on": "on", "pe": "pe", "qc": "qc", "sk": "sk", "yt": "yt", \
+                    "alberta": "ab", \
+                    "british columbia": "bc", \
+                    "manitoba": "mb", \
+                    "new brunswick": "nb", \
+                    "newfoundland": "nl", \
+                    "nova scotia": "ns", \
+                    "northwest territories": "nt", \
+                    "nunavut": "nu", \
+                    "ontario": "on", \
+                    "prince edward island": "pe", \
+                    "québec": "qc", \
+                    "saskatchewan": "sk", \
+                    "yukon": "yt"}
+
+_COUNTRY_TABLE = {"ca": "ca", "canada": "ca"}
 
 
 #####################################
@@ -256,6 +942,23 @@ class Algorithm(object):
 
       ENCODING_LIST: List of character encodings to test.
 
+      VERSION: Version of the output of the algorithms. Increase it whenever a
+        change affects clean datasets, so that BuildRecord does not consider
+        outputs of earlier versions up to date.
+
+      CLEAN_RULES: CleanRule objects applied by 'clean' for the database type,
+        in order.
+
+      clean_rejections: collections.Counter of the rows rejected by each 
+        cleaning rule, keyed by '<label>:<name>'.
+
+      records_read, rows_parsed, clean_rows_in, blank_fill_rows: Number of 
+        records given to the label extractors, non-empty rows they produced,
+        rows given to the cleaning rules and rows blank-filled, as reported
+        in the metrics of DataProcess.
+
+      encoding_bytes_read: Number of bytes tested by 'char_encode_check'.
+
       address_parser: Address parsing function to use.
     """
 
@@ -292,6 +995,30 @@ class Algorithm(object):
 
     # supported encodings (as defined in Python standard library)
     ENCODING_LIST = ["utf-8", "cp1252", "cp437"]
+
+    # output version, see BuildRecord; it is not derived from the code, so it
+    # must be increased by hand with any change to the clean, blank-filled or
+    # '.errors' outputs, or sources processed by an earlier version are skipped
+    VERSION = 1
+
+    # cleaning rules of every database type
+    _GENERAL_CLEAN_RULES = [CleanRule('postcode', [('normalize', _remove_whitespace_upper), \
+                                                   ('check', 'length', lambda entry: len(entry) == 6, "postcode:"), \
+                                                   ('check', 'characters', _three_letters_three_digits, "postcode:"), \
+                                                   ('check', 'format', _POSTCODE_FORMAT.match, "postcode")]), \
+                            CleanRule('phone', [('normalize', _remove_phone_punctuation)]), \
+                            CleanRule('fax', [('normalize', _remove_phone_punctuation)]), \
+                            CleanRule('prov/terr', [('lookup', 'known', _PROV_TERR_TABLE, "prov/terr")]), \
+                            CleanRule('country', [('lookup', 'known', _COUNTRY_TABLE, "country")])]
+
+    # cleaning rules of each database type, applied after the general rules
+    _BUSINESS_CLEAN_RULES = []
+    _EDU_FACILITY_CLEAN_RULES = []
+    _HOSPITAL_CLEAN_RULES = []
+    _LIBRARY_CLEAN_RULES = []
+
+    # size of the binary chunks read when guessing the character encoding
+    _ENCODING_CHUNK_SIZE = 1 << 20
     
     # conversion table for address labels to libpostal tags
     _ADDR_LABEL_TO_POSTAL = {'street_no' : 'house_number', \
@@ -316,18 +1043,32 @@ class Algorithm(object):
         
         if self.database_type == "education":
             self.FIELD_LABEL = self._EDU_FACILITY_LABELS + self._GENERAL_LABELS
+            self.CLEAN_RULES = self._GENERAL_CLEAN_RULES + self._EDU_FACILITY_CLEAN_RULES
         elif self.database_type == "hospital":
             self.FIELD_LABEL = self._HOSPITAL_LABELS + self._GENERAL_LABELS
+            self.CLEAN_RULES = self._GENERAL_CLEAN_RULES + self._HOSPITAL_CLEAN_RULES
         elif self.database_type == "library":
             self.FIELD_LABEL = self._LIBRARY_LABELS + self._GENERAL_LABELS
+            self.CLEAN_RULES = self._GENERAL_CLEAN_RULES + self._LIBRARY_CLEAN_RULES
         else: # default to business
             self.FIELD_LABEL = self._BUSINESS_LABELS + self._GENERAL_LABELS
+            self.CLEAN_RULES = self._GENERAL_CLEAN_RULES + self._BUSINESS_CLEAN_RULES
+
+        self.clean_rejections = collections.Counter()
+        self.records_read = 0
+        self.rows_parsed = 0
+        self.clean_rows_in = 0
+        self.blank_fill_rows = 0
+        self.encoding_bytes_read = 0
     
 
     def char_encode_check(self, source):
         """
         Identifies the character encoding of a source by reading the metadata
-        or by a heuristic test.
+        or by a heuristic test. The result is stored in 'source.encoding', so
+        the test is only done once per Source object. Guessed encodings are
+        also kept in an EncodingCache, so unchanged files are not tested again
+        in later runs.
         
         Args:
 
@@ -344,23 +1085,74 @@ class Algorithm(object):
 
           RunTimeError: Character encoding test failed.
         """
+        if source.encoding != None:
+            return source.encoding
+
         metadata = source.metadata
         if 'encoding' in metadata:
             data_enc = metadata['encoding']
             if data_enc in self.ENCODING_LIST:
+                source.encoding = data_enc
                 return data_enc
             else:
                 raise ValueError(data_enc + " is not a valid encoding.")
         else:
-            for enc in self.ENCODING_LIST:
+            cache = EncodingCache()
+            enc = cache.lookup(source, source.encoding_sample)
+            if enc == None:
+                with source.open_raw() as raw:
+                    enc = self._guess_encoding(raw, source.encoding_sample)
+                cache.store(source, source.encoding_sample, enc)
+            source.encoding = enc
+            return enc
+
+    def _guess_encoding(self, f, sample_size=None):
+        """
+        Tests every encoding in ENCODING_LIST at once, by feeding the file in
+        binary chunks to an incremental decoder for each encoding. An encoding
+        is discarded as soon as it fails to decode a chunk.
+
+        Args:
+
+          f: Binary file object to test.
+
+          sample_size: Number of bytes to test. If 'None', the whole file
+            is tested.
+
+        Returns:
+
+          e: the first encoding in ENCODING_LIST that decodes the tested bytes.
+
+        Raises:
+
+          RunTimeError: Character encoding test failed.
+        """
+        decoders = [(enc, codecs.getincrementaldecoder(enc)()) for enc in self.ENCODING_LIST]
+        nbytes = 0
+
+        while decoders:
+            chunk_size = self._ENCODING_CHUNK_SIZE
+            if sample_size != None:
+                chunk_size = min(chunk_size, sample_size - nbytes)
+            chunk = f.read(chunk_size)
+            # at the end of the file, decoders must not hold incomplete characters
+            final = (chunk == b'')
+            nbytes += len(chunk)
+            remaining = []
+            for enc, decoder in decoders:
                 try:
-                    with open('./pddir/raw/' + source.local_fname, encoding=enc) as f:
-                        for line in f:
-                            pass
-                    return enc
+                    decoder.decode(chunk, final)
+                    remaining.append((enc, decoder))
                 except UnicodeDecodeError:
                     pass
-            raise RuntimeError("Could not guess original character encoding.")
+            decoders = remaining
+            if final or (sample_size != None and nbytes >= sample_size):
+                break
+
+        self.encoding_bytes_read += nbytes
+        if decoders:
+            return decoders[0][0]
+        raise RuntimeError("Could not guess original character encoding.")
 
 
     ############################################
@@ -376,6 +1168,141 @@ class Algorithm(object):
                 row.insert(ind, atag)
         return row
 
+    def _compile_label_map(self, label_map):
+        """
+        Compiles a label map into an extraction plan, which resolves the 'force'
+        syntax and list concatenation once per source instead of once per row.
+
+        Args:
+
+          label_map: A dict object of standardized labels and dataset tags, as
+            produced by 'extract_labels'.
+
+        Returns:
+
+          plan: A list of tuples (key, parts, concat), one for each label, where 
+            'parts' is a list of (is_const, text) tuples and 'concat' indicates a
+            list concatenation. If 'is_const' is True, 'text' is forced content, 
+            otherwise it is a tag of the dataset.
+        """
+        plan = []
+        for key in label_map:
+            tag = label_map[key]
+            if isinstance(tag, list):
+                parts = [self._compile_tag(t) for t in tag]
+                # tags with more than one ':' are ignored in concatenations
+                parts = [p for p in parts if p != None]
+                plan.append((key, parts, True))
+            elif key == "full_addr":
+                # by design, an address to parse cannot be forced
+                plan.append((key, [(False, tag)], False))
+            else:
+                part = self._compile_tag(tag)
+                if part == None:
+                    part = (True, '')
+                plan.append((key, [part], False))
+        return plan
+
+    def _compile_tag(self, tag):
+        """
+        Splits a tag of the form 'force:*', returning (True, forced content), or
+        (False, tag) for any other tag. Returns 'None' for malformed tags.
+        """
+        tt = tag.split(':')
+        if len(tt) == 1:
+            return (False, tag)
+        elif len(tt) == 2:
+            return (True, tt[1])
+        return None
+
+    def _bind_label_plan(self, plan, getter):
+        """
+        Binds an extraction plan to a dataset, producing one extractor callable 
+        per label. Each extractor accepts an entity of the dataset and returns
+        its entry, which has not been scrubbed yet.
+
+        Args:
+
+          plan: An extraction plan, as produced by '_compile_label_map'.
+
+          getter: A function which accepts a dataset tag and returns a callable
+            that extracts the raw entry of that tag from an entity.
+
+        Returns:
+
+          extractors: A list of extractor callables, in the order of 'plan'.
+
+          addr_index: Index of the "full_addr" extractor in 'extractors', or 
+            'None'. The entry it returns must still go through the address parser.
+        """
+        extractors = []
+        addr_index = None
+        for key, parts, concat in plan:
+            if key == "full_addr":
+                addr_index = len(extractors)
+            if not concat:
+                is_const, text = parts[0]
+                if is_const:
+                    extractors.append(lambda entity, entry=text: entry)
+                else:
+                    extractors.append(getter(text))
+            else:
+                getters = []
+                for is_const, text in parts:
+                    if is_const:
+                        getters.append(lambda entity, entry=text: entry)
+                    else:
+                        getters.append(getter(text))
+                # the trailing space matches the historical concatenation, which
+                # affects how '_quick_scrub' trims single character entries
+                extractors.append(lambda entity, getters=getters: \
+                                  ' '.join([get(entity) for get in getters]) + ' ')
+        return extractors, addr_index
+
+    def _address_fields(self, ap_entry):
+        """
+        Converts the output of the address parser to a list of entries ordered as
+        ADDR_FIELD_LABEL. If the parser returns a label more than once, the first
+        token is used.
+        """
+        tokens = dict()
+        for token, label in ap_entry:
+            if label not in tokens:
+                tokens[label] = token
+        return [tokens.get(self._ADDR_LABEL_TO_POSTAL[afl], "") for afl in self.ADDR_FIELD_LABEL]
+
+    def _extract_rows(self, entities, extractors, addr_index):
+        """
+        Generator that applies bound extractors to each entity of a dataset, and 
+        yields the non-empty rows of the standardized CSV format.
+        """
+        scrub = self._quick_scrub_batch
+        if addr_index == None:
+            for entity in entities:
+                self.records_read += 1
+                row = scrub([extract(entity) for extract in extractors])
+                if not self._isRowEmpty(row):
+                    self.rows_parsed += 1
+                    yield row
+            return
+
+        # rows wait in 'pending' while their addresses are being parsed, which
+        # lets the address parser work on batches of addresses
+        pending = collections.deque()
+        def addresses():
+            for entity in entities:
+                self.records_read += 1
+                row = scrub([extract(entity) for extract in extractors])
+                pending.append(row)
+                yield row[addr_index]
+
+        for ap_entry in self.address_parser.parse_iter(addresses()):
+            row = pending.popleft()
+            row[addr_index:addr_index+1] = self._address_fields(ap_entry)
+            if not self._isRowEmpty(row):
+                self.rows_parsed += 1
+                yield row
+
     def _isRowEmpty(self, row):
         """
         Checks if a list 'row' consists of only empty string entries.
@@ -387,54 +1314,90 @@ class Algorithm(object):
 
     def _quick_scrub(self, entry):
         """
-        Cleans a string 'entry' using regular expressions and returns it.
-        """
-        if isinstance(entry, bytes):
-            entry = entry.decode()
-        # remove [:space:] char class
-        #
-        # since this includes removal of newlines, the next regexps are safe and
-        # do not require the "DOTALL" flag
-        entry = re.sub(r"\s+", " ", entry)
-        # remove spaces occuring at the beginning and end of an entry
-        entry = re.sub(r"^\s+([^\s].+)", r"\1", entry)
-        entry = re.sub(r"(.+[^\s])\s+$", r"\1", entry)
-        entry = re.sub(r"^\s+$", "", entry)
-        # make entries lowercase
-        entry = entry.lower()
-        return entry
+        Cleans a string 'entry' and returns it. See '_quick_scrub_batch'.
+        """
+        return self._quick_scrub_batch([entry])[0]
+
+    def _quick_scrub_batch(self, entries):
+        r"""
+        Cleans a list of strings, such as the entries of a row, and returns the
+        list of cleaned strings. Runs of whitespace are replaced by a single space,
+        whitespace is trimmed from both ends and entries are made lowercase.
+
+        This gives the same output as the regular expressions
+
+          re.sub(r"\s+", " ", entry)
+          re.sub(r"^\s+([^\s].+)", r"\1", entry)
+          re.sub(r"(.+[^\s])\s+$", r"\1", entry)
+          re.sub(r"^\s+$", "", entry)
+
+        applied in that order, including their quirk of not trimming entries that 
+        consist of a single character and a single space.
+        """
+        scrubbed = []
+        append = scrubbed.append
+        for entry in entries:
+            if isinstance(entry, bytes):
+                entry = entry.decode()
+            # str.split and '\s' agree on what is whitespace
+            parts = entry.split()
+            if not parts:
+                append('')
+                continue
+            entry_out = ' '.join(parts)
+            # if the length is unchanged, there was nothing to trim or collapse
+            if len(entry_out) != len(entry):
+                lead = entry[0].isspace()
+                trail = entry[-1].isspace()
+                if lead and len(entry_out) + trail < 2:
+                    entry_out = ' ' + entry_out
+                elif trail and len(entry_out) < 2:
+                    entry_out = entry_out + ' '
+            append(entry_out.lower())
+        return scrubbed
 
     def blank_fill(self, source):
         """
         Adds columns excluded by original data processing/metadata to a 
         formatted dataset and fills entries with blanks.
 
+        Unless postprocessing scripts are enabled, the blank-filled dataset is
+        written along with the clean dataset by '_write_clean', without this
+        additional pass.
+
         Args:
 
           source: A dataset and its associated metadata, defined as a Source 
             object.
         """
-        LABELS = [i for i in self.FIELD_LABEL if i != "full_addr"]
+        LABELS = self._blank_fill_labels()
 
         # open files for read and writing
-        # 'f' refers to the original file, 'bff' refers to the new blank filled file
-        with open(source.cleanpath, 'r') as f, open(source.cleanpath + '.bf', 'w') as bff:
-            # initialize csv reader/writer
-            rf = csv.DictReader(f)
-            wf = csv.writer(bff, delimiter=',', quotechar='"', quoting=csv.QUOTE_ALL)
-
-            wf.writerow(LABELS)
+        # 'rf' reads the original file, 'wf' writes the new blank filled file
+        with open_output(source.cleanpath) as rf, \
+             source.output_sink(source.cleanpath + '.bf', LABELS) as wf:
+            # position of each label in the rows of the original file, where
+            # the last of duplicate labels wins as in csv.DictReader
+            index = {col : i for i, col in enumerate(rf.fieldnames)}
+            positions = [index.get(col) for col in LABELS]
 
             for old_row in rf:
+                self.blank_fill_rows += 1
                 row2write = []
-                for col in LABELS:
-                    if col not in old_row:
+                for i in positions:
+                    if i == None or i >= len(old_row):
                         row2write.append("")
                     else:
-                        row2write.append(old_row[col])
+                        row2write.append(old_row[i])
                 wf.writerow(row2write)
                 
 
+    def _blank_fill_labels(self):
+        """
+        Returns the column names of blank-filled datasets.
+        """
+        return [i for i in self.FIELD_LABEL if i != "full_addr"]
+
     def clean(self, source):
         """
         A general dataset cleaning method.
@@ -444,130 +1407,176 @@ class Algorithm(object):
           source: A dataset and its associated metadata, defined as a Source 
             object.
         """
-        error_flag = False
-        
-        with open(source.dirtypath, 'r') as dirty, \
-             open(source.cleanpath, 'w') as clean, \
-             open(source.cleanpath + ".errors", 'w') as error:
-
-            csvreader = csv.DictReader(dirty)
-            csvwriter = csv.DictWriter(clean, fieldnames=csvreader.fieldnames, quoting=csv.QUOTE_ALL)
-
-            error_headers = ['ERROR'] + csvreader.fieldnames
-            csverror = csv.DictWriter(error, fieldnames=error_headers, quoting=csv.QUOTE_ALL)
-            
-            csvwriter.writeheader()
-            csverror.writeheader()
-            
-            for row in csvreader:
-                # general field cleaning
-                # clean postal codes
-                if 'postcode' in csvreader.fieldnames and row['postcode'] != '':
-                    postal_code = row['postcode']
-                    postal_code = re.sub(r"\s+", "", postal_code)
-                    postal_code = postal_code.upper()
-                    row['postcode'] = postal_code
-
-                    # check string length
-                    if len(postal_code) != 6:
-                        row['ERROR'] = "postcode:"
-                        csverror.writerow(row)
-                        error_flag = True
-                        continue
+        with open(source.dirtypath, 'r') as dirty:
+            # skip blank lines, as done by csv.DictReader
+            rows = (row for row in csv.reader(dirty) if row != [])
+            self._write_clean(source, rows)
 
-                    # check character frequency
-                    alpha = 0
-                    digit = 0
-                    for c in postal_code:
-                        if c.isalpha():
-                            alpha += 1
-                        elif c.isdigit():
-                            digit += 1
-                    if alpha != 3 or digit != 3:
-                        row['ERROR'] = "postcode:"
-                        csverror.writerow(row)
-                        error_flag = True
-                        continue
+        os.remove(source.dirtypath)
 
-                    # check structure
-                    if not re.match(r'[A-Z][0-9][A-Z][0-9][A-Z][0-9]', postal_code):
-                        row['ERROR'] = "postcode"
-                        csverror.writerow(row)
-                        error_flag = True
-                        continue
+    def _write_clean(self, source, rows, cleanpath=None):
+        """
+        Cleans parsed rows and writes them to the clean dataset in the output
+        format of the source, along with a '.errors' CSV file containing the rows
+        that failed cleaning. With blank filling and without postprocessing
+        scripts, the blank-filled dataset is written to a '.bf' file as well.
 
-                if 'phone' in csvreader.fieldnames and row['phone'] != '':
-                    phone_number = row['phone']
-                    phone_number = re.sub(r"[\s\(\)-]", "", phone_number)
-                    row['phone'] = phone_number
+        Args:
 
-                if 'fax' in csvreader.fieldnames and row['fax'] != '':
-                    fax_number = row['fax']
-                    fax_number = re.sub(r"[\s\(\)-]", "", fax_number)
-                    row['fax'] = fax_number
+          source: A dataset and its associated metadata, defined as a Source 
+            object.
 
-                
-                if 'prov/terr' in csvreader.fieldnames and row['prov/terr'] != '':
-                    province_territory_shortlist = ["ab", "bc", "mb", "nb", "nl", "ns", "nt", "nu", "on", "pe", "qc", "sk", "yt"]
-                    long_to_short_map = {"alberta": "ab", \
-                                         "british columbia": "bc", \
-                                         "manitoba": "mb", \
-                                         "new brunswick": "nb", \
-                                         "newfoundland": "nl", \
-                                         "nova scotia": "ns", \
-                                         "northwest territories": "nt", \
-                                         "nunavut": "nu", \
-                                         "ontario": "on", \
-                                         "prince edward island": "pe", \
-                                         "québec": "qc", \
-                                         "saskatchewan": "sk", \
-                                         "yukon": "yt"}
-
-                    if row['prov/terr'] in province_territory_shortlist:
-                        pass
-                    elif row['prov/terr'] in long_to_short_map:
-                        row['prov/terr'] = long_to_short_map[row['prov/terr']]
-                    else:
-                        row['ERROR'] = "prov/terr"
-                        csverror.writerow(row)
-                        error_flag = True
-                        continue
+          rows: An iterable of lists, where the first list contains the
+            standardized column names.
 
-                if 'country' in csvreader.fieldnames and row['country'] != '':
-                    if row['country'] in ["ca", "canada"]:
-                        row['country'] = "ca"
+          cleanpath: Path of the clean dataset to write. If 'None', 
+            source.cleanpath is used.
+        """
+        if cleanpath == None:
+            cleanpath = source.cleanpath
+        batch_size = source.clean_batch_size
+        rows = iter(rows)
+        fieldnames = next(rows)
+        plan, positions = self._compile_clean_plan(fieldnames)
+        rejections = collections.Counter()
+
+        clean = source.output_sink(cleanpath, fieldnames)
+        if source.blank_fill_flag and not source.post_flag:
+            clean = BlankFillSink(clean, source.output_sink(cleanpath + '.bf', self._blank_fill_labels()))
+        
+        with clean, open(cleanpath + ".errors", 'w') as error:
+
+            csverror = csv.writer(error, quoting=csv.QUOTE_ALL)
+            csverror.writerow(['ERROR'] + fieldnames)
+
+            if batch_size != None:
+                for batch in iter(lambda: list(itertools.islice(rows, batch_size)), []):
+                    self.clean_rows_in += len(batch)
+                    clean_rows, error_rows = self._clean_batch(batch, plan, positions, rejections)
+                    clean.writerows(clean_rows)
+                    csverror.writerows(error_rows)
+            else:
+                writerow = clean.writerow
+                rows_in = 0
+                for rows_in, row in enumerate(rows, 1):
+                    for i, rule, label in plan:
+                        entry = row[i]
+                        if entry != '':
+                            row[i], step = rule(entry)
+                            if step != None:
+                                break
                     else:
-                        row['ERROR'] = "country"
-                        csverror.writerow(row)
-                        error_flag = True
+                        writerow(row if positions == None else [row[i] for i in positions])
                         continue
+                    rejections[label + ':' + step[1]] += 1
+                    csverror.writerow([step[3]] + (row if positions == None else [row[i] for i in positions]))
+                self.clean_rows_in += rows_in
 
-                # business label cleaning
-                if self.database_type == "business":
-                    pass
-                    
-                # education label cleaning
-                if self.database_type == "education":
-                    pass
-                    
-                # hospital label cleaning
-                if self.database_type == "hospital":
-                    pass
+        self.clean_rejections.update(rejections)
+        if not rejections:
+            os.remove(cleanpath + ".errors")
 
-                # library label cleaning
-                if self.database_type == "library":
-                    pass
-                csvwriter.writerow(row)
-                    
-        if error_flag == False:
-            os.remove(source.cleanpath + ".errors")
-        os.remove(source.dirtypath)
+    def _clean_batch(self, rows, plan, positions, rejections):
+        """
+        Cleans a batch of rows column by column, applying each rule of the 
+        compiled plan once to every distinct entry of its column. The result is
+        the same as cleaning the rows one at a time.
+
+        Args:
+
+          rows: A list of rows of equal length.
+
+          plan, positions: Compiled cleaning rules, see '_compile_clean_plan'.
+
+          rejections: collections.Counter to which rejected rows are added.
+
+        Returns:
+
+          A list of the clean rows and a list of the rejected rows, prefixed 
+          with their errors, both in their original order.
+        """
+        columns = list(zip(*rows))
+        outcomes = []
+        # index of the first rule rejecting each rejected row
+        rejected = {}
+        for k, (i, rule, label) in enumerate(plan):
+            column = columns[i]
+            outcome = dict.fromkeys(column)
+            for entry in outcome:
+                outcome[entry] = (entry, None) if entry == '' else rule(entry)
+            outcomes.append(outcome)
+            failing = {entry for entry, result in outcome.items() if result[1] != None}
+            if failing:
+                for n in [n for n, entry in enumerate(column) if entry in failing]:
+                    rejected.setdefault(n, k)
+            columns[i] = [outcome[entry][0] for entry in column]
+
+        if positions != None:
+            columns = [columns[i] for i in positions]
+        clean_rows = zip(*columns)
+        if not rejected:
+            return clean_rows, []
+        clean_rows = [row for n, row in enumerate(clean_rows) if n not in rejected]
+
+        # rejected rows keep the entries they had when the rule rejected them
+        error_rows = []
+        for n in sorted(rejected):
+            row = list(rows[n])
+            for k in range(rejected[n] + 1):
+                i = plan[k][0]
+                row[i], step = outcomes[k][row[i]]
+            rejections[plan[k][2] + ':' + step[1]] += 1
+            error_rows.append([step[3]] + (row if positions == None else [row[i] for i in positions]))
+        return clean_rows, error_rows
+
+    def _compile_clean_plan(self, fieldnames):
+        """
+        Compiles the cleaning rules that apply to the columns 'fieldnames'.
+
+        Returns:
+
+          plan: A list of (index, rule, label) tuples, with the index of the
+            column and the compiled rule, in the order of CLEAN_RULES.
+
+          positions: 'None', or the index of the entry to write in each column 
+            if 'fieldnames' has duplicate labels, in which case every column
+            with the same label gets the entry of the last one.
+        """
+        index = {label : i for i, label in enumerate(fieldnames)}
+        plan = [(index[rule.label], rule.compile(), rule.label) \
+                for rule in self.CLEAN_RULES if rule.label in index]
+        positions = [index[label] for label in fieldnames]
+        if positions == list(range(len(fieldnames))):
+            positions = None
+        return plan, positions
     
 class CSV_Algorithm(Algorithm):
     """
     A child class of Algorithm, accompanied with methods designed for
     CSV-formatted datasets.
     """
+
+    # size of the binary blocks read when splitting a dataset into chunks
+    _SPLIT_BLOCK_SIZE = 1 << 20
+
+    # a record of well-formed fields and its line terminator, where a quoted
+    # field encloses its entry in quote characters and doubles those inside it
+    _RECORD = re.compile(rb'(?:"(?:[^"]|"")*"|[^",\r\n]*)(?:,(?:"(?:[^"]|"")*"|[^",\r\n]*))*(?:\r\n|\n|\r|\Z)')
+    _QUOTED_FIELD = re.compile(rb'"(?:[^"]|"")*"')
+
+    # a line and its terminator, as split by universal newlines mode
+    _LINE = re.compile(rb'([^\r\n]*)(\r\n|\n|\r)?')
+
+    # a quote character that does not start or end a field, where the bytes 
+    # outside of quoted fields are joined by quote characters
+    _MISPLACED_QUOTE = re.compile(rb'[^,\r\n"]"|"[^,\r\n"]')
+
+    # bytes that may separate quoted fields
+    _SEPARATORS = {b'', b',', b'\n', b'\r\n', b'\r'}
+
+    # size of the blocks of records scanned at once by format correction
+    _SCAN_BLOCK_SIZE = 1 << 22
+
     def extract_labels(self, source):
         """
         Constructs a dictionary that stores only tags that were exclusively used in 
@@ -587,6 +1596,7 @@ class CSV_Algorithm(Algorithm):
             elif ('address' in metadata['info']) and (i in metadata['info']['address']):
                 label_map[i] = metadata['info']['address'][i] 
         source.label_map = label_map
+        source.label_plan = self._compile_label_map(label_map)
 
 
     def parse(self, source):
@@ -601,90 +1611,56 @@ class CSV_Algorithm(Algorithm):
         if not hasattr(source, 'label_map'):
             raise ValueError("Source object missing 'label_map', 'extract_labels' was not ran.")
 
-        tags = source.label_map
         enc = self.char_encode_check(source)
 
         with open(source.dirtypath, 'r', encoding=enc) as csv_file_read, \
              open(source.dirtypath + '-temp', 'w', encoding="utf-8") as csv_file_write:
-            csvreader = csv.DictReader(csv_file_read)
+            # skip blank lines, as done by csv.DictReader
+            csvreader = (row for row in csv.reader(csv_file_read) if row != [])
             csvwriter = csv.writer(csv_file_write, delimiter=',', quotechar='"', quoting=csv.QUOTE_ALL)
+            csvwriter.writerows(self._parse_rows(source, csvreader))
 
-            # write the initial row which identifies each column
-            col_labels = self._generateFirstRow(tags)
-            csvwriter.writerow(col_labels)
+        os.rename(source.dirtypath + '-temp', source.dirtypath)
 
-            # SUGGESTION: this try-catch block does not appear for XML_Algorithm.
-            # Perhaps it's not needed?
-            try:
-                for entity in csvreader:
-                    row = []
-                    for key in tags:
-                        # # #
-                        # decision: Check if tags[key] is of type JSON array (list).
-                        #
-                        # depth: 1
-                        # # #
-                        if isinstance(tags[key], list):
-                            entry = ''
-                            for i in tags[key]:
-                                # check if 'i' is of the form 'force:*'
-                                ii = i.split(':')
-                                if len(ii) == 1:
-                                    entry += entity[i] + ' '
-                                elif len(ii) == 2:
-                                    entry += ii[1] + ' '
-                            entry = self._quick_scrub(entry)
-                            # # #
-                            # decision: check if key is "full_addr"
-                            # depth: 2
-                            # # #
-                            if key != "full_addr":
-                                row.append(entry)
-                            else:
-                                ap_entry = self.address_parser.parse(entry)
-                                # SUGGESTION: This for loop is exclusively for libpostal output.
-                                # Perhaps it should be moved to the AddressParser object?
-                                for afl in self.ADDR_FIELD_LABEL:
-                                    if self._ADDR_LABEL_TO_POSTAL[afl] in [x[1] for x in ap_entry]:
-                                        ind = list(map(operator.itemgetter(1), ap_entry)).index(self._ADDR_LABEL_TO_POSTAL[afl])
-                                        row.append(ap_entry[ind][0])
-                                    else:
-                                        row.append("")
-                            continue
-                        # # #
-                        # decision: check if key is "full_addr"
-                        # depth: 1
-                        # # #
-                        if key == "full_addr":
-                            entry = entity[tags[key]]
-                            entry = self._quick_scrub(entry)
-                            ap_entry = self.address_parser.parse(entry)
-                            # SUGGESTION: This for loop is exclusively for libpostal output.
-                            # Perhaps it should be moved to the AddressParser object?
-                            for afl in self.ADDR_FIELD_LABEL:
-                                if self._ADDR_LABEL_TO_POSTAL[afl] in [x[1] for x in ap_entry]:
-                                    ind = list(map(operator.itemgetter(1), ap_entry)).index(self._ADDR_LABEL_TO_POSTAL[afl])
-                                    row.append(ap_entry[ind][0])
-                                else:
-                                    row.append("")
-                            continue
-                        # # #
-                        # All other cases get handled here.
-                        # # #
-                        # check if 'tags[key]' is of the form 'force:*'
-                        ee = tags[key].split(':')
-                        if len(ee) == 1:
-                            entry = self._quick_scrub(entity[ee[0]])
-                        elif len(ee) == 2:
-                            entry = self._quick_scrub(ee[1])
-                        row.append(entry)
-                    if not self._isRowEmpty(row):
-                        csvwriter.writerow(row)
-            except KeyError:
-                print("[ERROR] ", source.local_fname," :'", tags[key], "' is not a field name in the CSV file. ", sep='')
+    def _parse_rows(self, source, rows):
+        """
+        Generator that transforms CSV rows into rows of the standardized CSV format.
+        The first row yielded identifies each column.
+
+        Args:
+
+          source: A dataset and its associated metadata, defined as a Source 
+            object.
+
+          rows: An iterable of lists, where the first list contains the column
+            names of the dataset.
+        """
+        tags = source.label_map
+        rows = iter(rows)
+        fieldnames = next(rows, [])
+
+        # the initial row which identifies each column
+        yield self._generateFirstRow(tags)
+
+        # dataset tags are bound to column indices; if a field name occurs more
+        # than once, the last column is used, as done by csv.DictReader
+        columns = dict((name, ind) for ind, name in enumerate(fieldnames))
+        missing = [key for key, parts, concat in source.label_plan \
+                   if [text for is_const, text in parts if not is_const and text not in columns]]
+        if missing:
+            # report the missing field only if there is data to process
+            if next(rows, None) != None:
+                print("[ERROR] ", source.local_fname," :'", tags[missing[0]], "' is not a field name in the CSV file. ", sep='')
                 # DEBUG: need a safe way to exit from here
+            # the remaining rows are still read, so that in streaming mode the
+            # format correction of the whole dataset is done, as when staged
+            for _ in rows:
+                pass
+            return
 
-        os.rename(source.dirtypath + '-temp', source.dirtypath)
+        extractors, addr_index = self._bind_label_plan(source.label_plan, \
+                                                       lambda name: operator.itemgetter(columns[name]))
+        yield from self._extract_rows(rows, extractors, addr_index)
 
         
     def format_correction(self, source, data_encoding):
@@ -700,43 +1676,511 @@ class CSV_Algorithm(Algorithm):
 
           data_encoding: The character encoding of the data.
         """
-        error_flag = False
-        
-        with open(source.rawpath, 'r', encoding=data_encoding) as raw, \
-             open(source.dirtypath, 'w', encoding=data_encoding) as dirty, \
-             open(source.dirtypath + '.errors', 'w', encoding=data_encoding) as error:
-            reader = csv.reader(raw)
-            writer = csv.writer(dirty)
-            errors = csv.writer(error)
-            
-            flag = False
-            size = 0
-            first_row = True
-            line = 1
-            
-            for row in reader:
-                if first_row == True:
-                    row[0] = re.sub(r"^\ufeff(.+)", r"\1", row[0])
-                    first_row = False
-
-                if flag == True:
-                    if len(row) != size:
-                        error_flag = True
-                        print("ERROR: Missing or too many entries on line ", line, ".", sep='')
-                        errors.writerow(["FC" + str(line)] + row) # FC for format correction method
-                        line += 1
-                        continue
+        # a raw dataset on disk is scanned at the byte level, which requires
+        # delimiters, quotes and newlines to be encoded as in ASCII
+        if not source.archived and os.path.getsize(source.rawpath) > 0 \
+           and self._ascii_compatible(data_encoding):
+            with open(source.rawpath, 'rb') as raw, \
+                 mmap.mmap(raw.fileno(), 0, access=mmap.ACCESS_READ) as buf, \
+                 open(source.dirtypath, 'wb') as dirty, \
+                 open(source.dirtypath + '.errors', 'w', encoding=data_encoding) as error:
+                self._format_correction_scan(buf, data_encoding, dirty, csv.writer(error))
+        else:
+            with source.open_raw(data_encoding) as raw, \
+                 open(source.dirtypath, 'w', encoding=data_encoding) as dirty, \
+                 open(source.dirtypath + '.errors', 'w', encoding=data_encoding) as error:
+                writer = csv.writer(dirty)
+                errors = csv.writer(error)
+                writer.writerows(self._format_correction_rows(csv.reader(raw), errors))
+
+        if self.fc_error_count == 0:
+            os.remove(source.dirtypath + '.errors')
+
+    def _format_correction_scan(self, buf, enc, dirty, errors):
+        """
+        Byte level implementation of 'format_correction', with the same results
+        as '_format_correction_rows'. Runs of records with well-formed fields and
+        the same number of entries as the first row are copied to 'dirty' as
+        they are. Other records, including the first row, are parsed with 
+        csv.reader and handled as in '_format_correction_rows'.
+
+        The scan is only used by the staged pipeline. 'stream' and 
+        'stream_chunk' need the entries of every record for 'parse', so they
+        read the raw dataset with csv.reader and '_format_correction_rows'.
+
+        Args:
+
+          buf: A bytes-like object of the raw dataset, such as an mmap object.
+
+          enc: The character encoding of the data, which must be compatible 
+            with ASCII.
+
+          dirty: A binary file object the corrected dataset is written to.
+
+          errors: A csv.writer object for rows with the wrong number of entries.
+        """
+        self.fc_error_count = 0
+        self.fc_row_count = 0
+        size = len(buf)
+        text = io.StringIO()
+        writer = csv.writer(text)
+        def write_row(row):
+            writer.writerow(row)
+            dirty.write(text.getvalue().encode(enc))
+            text.seek(0)
+            text.truncate()
+
+        row, pos = self._read_record(buf, 0, enc)
+        self.fc_row_count += 1
+        row[0] = re.sub(r"^\ufeff(.+)", r"\1", row[0])
+        nfields = len(row)
+        write_row(row)
+        errors.writerow(['ERROR'] + row)
+
+        line = 2
+        # start of the run of valid records not yet copied
+        run = pos
+        match = self._RECORD.match
+        quoted = self._QUOTED_FIELD.sub
+
+        def check(pos):
+            # checks the record at 'pos' and returns the offset after it
+            nonlocal line, run
+            m = match(buf, pos)
+            if m != None:
+                record = m.group()
+                if b'"' in record:
+                    valid = quoted(b'', record).count(b',') + 1 == nfields
+                else:
+                    # a blank line is a row without entries
+                    valid = record.count(b',') + 1 == nfields and record[:1] not in (b'\r', b'\n')
+                if valid:
+                    self.fc_row_count += 1
+                    line += 1
+                    return m.end()
+
+            dirty.write(view[run:pos])
+            row, pos = self._read_record(buf, pos, enc)
+            run = pos
+            self.fc_row_count += 1
+            if len(row) != nfields:
+                self.fc_error_count += 1
+                print("ERROR: Missing or too many entries on line ", line, ".", sep='')
+                errors.writerow(["FC" + str(line)] + row) # FC for format correction method
+            else:
+                write_row(row)
+            line += 1
+            return pos
+
+        with memoryview(buf) as view:
+            while pos < size:
+                end = min(pos + self._SCAN_BLOCK_SIZE, size)
+                if end < size:
+                    # blocks end on a newline, or extend to the next one
+                    cut = buf.rfind(b'\n', pos, end)
+                    end = cut + 1 if cut != -1 else (buf.find(b'\n', end) + 1 or size)
+                start = pos
+                scan = self._scan_block(buf[start:end], nfields)
+                if scan != None:
+                    nrecords, suspects = scan
+                    done = 0
+                    for index, offset, next_offset in suspects:
+                        self.fc_row_count += index - done
+                        line += index - done
+                        pos = check(start + offset)
+                        done = index + 1
+                        if pos != start + next_offset:
+                            break
                     else:
-                        writer.writerow(row)
+                        self.fc_row_count += nrecords - done
+                        line += nrecords - done
+                        pos = end
+                # records are checked one at a time if the block could not be 
+                # scanned at once
+                while pos < end:
+                    pos = check(pos)
+            dirty.write(view[run:size])
+
+    def _scan_block(self, block, nfields):
+        """
+        Scans the records of 'block', a part of a CSV dataset that starts at a
+        record, with bytes operations only.
+
+        Returns:
+
+          'None' if the records cannot be told apart this way, or the number of
+          records in the block and a list of the suspect records, which are not
+          well-formed, have more or less than 'nfields' entries, or are blank 
+          lines. Suspect records are given as (index, start, end) tuples of 
+          their position in the block and their byte offsets.
+        """
+        outside = block
+        if b'"' in block:
+            parts = block.split(b'"')
+            if len(parts) % 2 == 0:
+                return None
+            # the bytes outside of quoted fields, in which each quoted field is
+            # replaced by quote characters
+            outside = b'"'.join(parts[0::2])
+            if not (set(parts[2:-1:2]) <= self._SEPARATORS and parts[0][-1:] in self._SEPARATORS \
+                    and parts[-1][:1] in self._SEPARATORS) \
+               and self._MISPLACED_QUOTE.search(outside) != None:
+                return None
+        if b'\r' in outside:
+            outside = outside.replace(b'\r\n', b'\n')
+            if b'\r' in outside:
+                return None
+
+        lines = outside.split(b'\n')
+        if lines[-1] == b'':
+            lines.pop()
+        counts = list(map(bytes.count, lines, itertools.repeat(b',')))
+        if counts.count(nfields - 1) == len(counts) and b'' not in lines:
+            return len(lines), []
+        if outside.count(b'\n') != block.count(b'\n'):
+            # quoted fields contain newlines, so records and lines differ
+            return None
+        indices = set(itertools.compress(range(len(lines)), map(operator.ne, counts, itertools.repeat(nfields - 1))))
+        indices.update(itertools.compress(range(len(lines)), map(operator.not_, lines)))
+        # offset of each line, without the newlines before it
+        offsets = list(itertools.accumulate(map(len, block.split(b'\n')), initial=0))
+        return len(lines), [(i, offsets[i] + i, offsets[i + 1] + i + 1) for i in sorted(indices)]
+
+    def _read_record(self, buf, pos, enc):
+        """
+        Parses the record of a CSV dataset starting at byte offset 'pos' of 'buf',
+        with csv.reader and universal newlines as done for text files. Returns
+        the row, or 'None' at the end of 'buf', and the offset after the record.
+        """
+        end = pos
+        def lines():
+            nonlocal end
+            while end < len(buf):
+                m = self._LINE.match(buf, end)
+                end = m.end()
+                yield m.group(1).decode(enc) + ('\n' if m.group(2) else '')
+        return next(csv.reader(lines()), None), end
+
+    def _ascii_compatible(self, enc):
+        """
+        Checks if the character encoding 'enc' encodes ASCII characters as ASCII
+        bytes, one byte per character.
+        """
+        ascii = bytes(range(128))
+        try:
+            return ascii.decode(enc) == ascii.decode('ascii')
+        except (UnicodeDecodeError, LookupError):
+            return False
+
+    def _format_correction_rows(self, reader, errors, report=True):
+        """
+        Generator for the 'format_correction' method. Yields the rows of 'reader'
+        that have the same number of entries as the first row, and writes the
+        remaining rows to 'errors'. The number of rows written to 'errors' is 
+        stored in 'self.fc_error_count', and the number of rows read in
+        'self.fc_row_count'.
+
+        Args:
+
+          reader: An iterable of lists, such as a csv.reader object.
+
+          errors: A csv.writer object for rows with the wrong number of entries.
+
+          report: If True, print an error message for each removed row.
+        """
+        self.fc_error_count = 0
+        self.fc_row_count = 0
+
+        flag = False
+        size = 0
+        first_row = True
+        line = 1
+
+        for row in reader:
+            self.fc_row_count += 1
+            if first_row == True:
+                row[0] = re.sub(r"^\ufeff(.+)", r"\1", row[0])
+                first_row = False
+
+            if flag == True:
+                if len(row) != size:
+                    self.fc_error_count += 1
+                    if report:
+                        print("ERROR: Missing or too many entries on line ", line, ".", sep='')
+                    errors.writerow(["FC" + str(line)] + row) # FC for format correction method
+                    line += 1
+                    continue
                 else:
-                    size = len(row)
-                    flag = True
-                    writer.writerow(row)
-                    errors.writerow(['ERROR'] + row)
-                line += 1
+                    yield row
+            else:
+                size = len(row)
+                flag = True
+                yield row
+                errors.writerow(['ERROR'] + row)
+            line += 1
 
-        if error_flag == False:
-            os.remove(source.dirtypath + '.errors')
+    def stream(self, source):
+        """
+        Applies 'format_correction', 'parse' and 'clean' to a dataset in CSV format
+        as a single chain of generators. Only the raw dataset is read, and only the
+        clean dataset and '.errors' files are written.
+
+        Args:
+
+          source: A dataset and its associated metadata, defined as a Source 
+            object.
+        """
+        if not hasattr(source, 'label_map'):
+            raise ValueError("Source object missing 'label_map', 'extract_labels' was not ran.")
+
+        enc = self.char_encode_check(source)
+
+        with source.open_raw(enc) as raw:
+            self._stream_rows(source, csv.reader(raw), source.cleanpath, source.dirtypath + '.errors')
+
+    def _stream_rows(self, source, reader, cleanpath, fc_errorpath, report=True):
+        """
+        Applies format correction, parsing and cleaning to the rows of 'reader',
+        where the first row contains the column names of the dataset.
+        """
+        # format correction errors are kept apart from the clean errors, since
+        # they do not share the standardized columns
+        with open(fc_errorpath, 'w', encoding=source.encoding) as error:
+            rows = self._format_correction_rows(reader, csv.writer(error), report)
+            rows = self._parse_rows(source, rows)
+            self._write_clean(source, rows, cleanpath)
+
+        if self.fc_error_count == 0:
+            os.remove(fc_errorpath)
+
+    ##################################################
+    # Support functions for processing large chunked #
+    # CSV datasets with several processes            #
+    ##################################################
+
+    def split_chunks(self, source, chunk_size):
+        """
+        Splits the raw dataset into byte ranges of about 'chunk_size' bytes
+        that end on record boundaries. The ranges cover every record after the
+        first row of column names, and are intended for 'stream_chunk'. There
+        is at least one range, even if it is empty, so that a dataset without
+        records still has a clean dataset of column labels.
+
+        Records are read block by block from the first row. In a block whose
+        quote characters only enclose quoted fields, as in RFC 4180, a newline
+        ends a record if an even number of quote characters precede it. Other
+        blocks, such as those with a quote character in an unquoted field, or
+        with CR line terminators, are read one record at a time with '_RECORD'
+        and csv.reader, as in '_format_correction_scan'.
+
+        Args:
+
+          source: A dataset and its associated metadata, defined as a Source 
+            object.
+
+          chunk_size: Approximate size of each byte range.
+
+        Returns:
+
+          ranges: A list of (start, end) byte offset tuples.
+        """
+        if source.archived:
+            raise ValueError("Datasets read from an archive cannot be split into chunks.")
+
+        enc = self.char_encode_check(source)
+        size = os.path.getsize(source.rawpath)
+        if size == 0:
+            return [(0, 0)]
+
+        with open(source.rawpath, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            header_end = self._read_record(buf, 0, enc)[1]
+            nchunks = max(1, -(-(size - header_end) // chunk_size))
+            bounds = [header_end]
+            pos = header_end
+            for i in range(1, nchunks):
+                target = header_end + (size - header_end) * i // nchunks
+                if pos < target:
+                    pos = self._next_record(buf, pos, target, enc)
+                    if pos < size:
+                        bounds.append(pos)
+        bounds.append(size)
+        ranges = [(bounds[i], bounds[i+1]) for i in range(len(bounds) - 1) if bounds[i] < bounds[i+1]]
+        return ranges if ranges else [(header_end, size)]
+
+    def _next_record(self, buf, pos, target, enc):
+        """
+        Reads the records of 'buf' from the record starting at byte offset 'pos',
+        and returns the offset of the first record starting at or after 'target'.
+        """
+        size = len(buf)
+        while pos < target and pos < size:
+            block = buf[pos:pos + self._SPLIT_BLOCK_SIZE]
+            parts = block.split(b'"')
+            # the bytes outside of quoted fields, as in '_scan_block'
+            outside = b'"'.join(parts[0::2])
+            if self._MISPLACED_QUOTE.search(outside) == None and \
+               outside.count(b'\r') == outside.count(b'\r\n'):
+                # the first record ending at or after the target, or the last
+                # record ending in the block
+                ind = block.find(b'\n', max(target - pos - 1, 0))
+                while ind != -1 and block.count(b'"', 0, ind) % 2 != 0:
+                    ind = block.find(b'\n', ind + 1)
+                if ind == -1:
+                    ind = block.rfind(b'\n')
+                    while ind != -1 and block.count(b'"', 0, ind) % 2 != 0:
+                        ind = block.rfind(b'\n', 0, ind)
+                if ind != -1:
+                    pos += ind + 1
+                    continue
+                if pos + len(block) == size:
+                    return size
+            # the block is read one record at a time
+            end = min(target, pos + len(block))
+            while pos < end:
+                m = self._RECORD.match(buf, pos)
+                if m != None and m.end() > pos:
+                    pos = m.end()
+                else:
+                    pos = self._read_record(buf, pos, enc)[1]
+        return pos
+
+    def stream_chunk(self, source, index, start, end):
+        """
+        Applies 'stream' to a byte range of the raw dataset, as produced by 
+        'split_chunks'. The outputs are written to part files, which are 
+        combined by 'merge_chunks'.
+
+        Args:
+
+          source: A dataset and its associated metadata, defined as a Source 
+            object.
+
+          index: Index of the byte range.
+
+          start: Byte offset of the first record.
+
+          end: Byte offset after the last record.
+
+        Returns:
+
+          count: The number of records read from the byte range.
+        """
+        if not hasattr(source, 'label_map'):
+            raise ValueError("Source object missing 'label_map', 'extract_labels' was not ran.")
+
+        enc = self.char_encode_check(source)
+        header_end = self._header_end(source.rawpath, enc)
+        with _open_byte_range(source.rawpath, 0, header_end, enc) as header, \
+             _open_byte_range(source.rawpath, start, end, enc) as raw:
+            reader = itertools.chain(itertools.islice(csv.reader(header), 1), csv.reader(raw))
+            # error messages of format correction need the line numbers of the
+            # complete dataset, so they are printed by 'merge_chunks'
+            self._stream_rows(source, reader, source.cleanpath + '.part%d' % index, \
+                              source.dirtypath + '.part%d.errors' % index, report=False)
+        return self.fc_row_count - 1
+
+    def merge_chunks(self, source, counts):
+        """
+        Combines the part files written by 'stream_chunk' into the clean dataset
+        and '.errors' files, in the original order of the records.
+
+        Args:
+
+          source: A dataset and its associated metadata, defined as a Source 
+            object.
+
+          counts: A list of the record counts returned by 'stream_chunk', in the
+            order of the byte ranges.
+        """
+        nparts = len(counts)
+
+        clean_parts = [source.cleanpath + '.part%d' % i for i in range(nparts)]
+        if source.output_format == 'csv':
+            # the clean part files each start with the same single line of labels
+            self._merge_parts(clean_parts, source.cleanpath)
+        else:
+            self._merge_outputs(source, clean_parts, source.cleanpath)
+        self._merge_parts([source.cleanpath + '.part%d.errors' % i for i in range(nparts)], \
+                          source.cleanpath + '.errors')
+        # blank-filled part files, if they were written with the clean parts
+        fill_parts = [path + '.bf' for path in clean_parts]
+        if source.output_format == 'csv':
+            self._merge_parts(fill_parts, source.cleanpath + '.bf')
+        else:
+            self._merge_outputs(source, fill_parts, source.cleanpath + '.bf')
+
+        # format correction errors are renumbered with the line numbers of the
+        # complete dataset
+        enc = source.encoding
+        line_offset = 0
+        error = None
+        for i in range(nparts):
+            part_path = source.dirtypath + '.part%d.errors' % i
+            if os.path.exists(part_path):
+                if error == None:
+                    error = open(source.dirtypath + '.errors', 'w', encoding=enc)
+                    errors = csv.writer(error)
+                with open(part_path, 'r', encoding=enc) as part:
+                    reader = csv.reader(part)
+                    header = next(reader)
+                    if error.tell() == 0:
+                        errors.writerow(header)
+                    for row in reader:
+                        line = int(row[0][2:]) + line_offset
+                        print("ERROR: Missing or too many entries on line ", line, ".", sep='')
+                        row[0] = "FC" + str(line)
+                        errors.writerow(row)
+                os.remove(part_path)
+            line_offset += counts[i]
+        if error != None:
+            error.close()
+
+    def _merge_outputs(self, source, part_paths, path):
+        """
+        Combines the existing clean datasets of 'part_paths', which are in the
+        output format of the source, into 'path' and removes them. If no file 
+        exists, 'path' is not created.
+        """
+        out = None
+        for part_path in part_paths:
+            if not os.path.exists(part_path):
+                continue
+            with open_output(part_path) as part:
+                if out == None:
+                    out = source.output_sink(path, part.fieldnames)
+                out.writerows(part)
+            os.remove(part_path)
+        if out != None:
+            out.close()
+
+    def _merge_parts(self, part_paths, path):
+        """
+        Concatenates the existing files of 'part_paths' into 'path', keeping the
+        first line of the first file only. If no file exists, 'path' is not 
+        created.
+        """
+        out = None
+        for part_path in part_paths:
+            if not os.path.exists(part_path):
+                continue
+            with open(part_path, 'rb') as part:
+                if out == None:
+                    out = open(path, 'wb')
+                else:
+                    part.readline()
+                shutil.copyfileobj(part, out)
+            os.remove(part_path)
+        if out != None:
+            out.close()
+
+    def _header_end(self, path, enc):
+        """
+        Returns the byte offset after the first record of a CSV file.
+        """
+        if os.path.getsize(path) == 0:
+            return 0
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            return self._read_record(buf, 0, enc)[1]
 
 class XML_Algorithm(Algorithm):
     """
@@ -744,6 +2188,10 @@ class XML_Algorithm(Algorithm):
     XML-formatted datasets.
     """
 
+    # XPath expressions that select the first descendant with a given tag,
+    # optionally qualified by a namespace URI
+    _SIMPLE_PATH = re.compile(r"\.//(\{[^}]+\})?[^/\[\]()@!=\s:{}*.][^/\[\]()@!=\s:{}*]*")
+
     def extract_labels(self, source):
         """
         Constructs a dictionary that stores only tags that were exclusively used in 
@@ -771,6 +2219,7 @@ class XML_Algorithm(Algorithm):
                 # note that the labels have to map to XPath expressions
                 label_map[i] = ".//" + metadata['info']['address'][i]
         source.label_map = label_map
+        source.label_plan = self._compile_label_map(label_map)
 
 
     def parse(self, source):
@@ -785,123 +2234,736 @@ class XML_Algorithm(Algorithm):
         if not hasattr(source, 'label_map'):
             raise ValueError("Source object missing 'label_map', 'extract_labels' was not ran.")
 
-        tags = source.label_map
-        header = source.metadata['header']
-        enc = self.char_encode_check(source)
-        xmlp = ElementTree.XMLParser(encoding=enc)
-        tree = ElementTree.parse(source.rawpath, parser=xmlp)
-        root = tree.getroot()
+        with open(source.dirtypath, 'w', encoding="utf-8") as csvfile:
+            csvwriter = csv.writer(csvfile, delimiter=',', quotechar='"', quoting=csv.QUOTE_ALL)
+            csvwriter.writerows(self._parse_rows(source))
+
+    def stream(self, source):
+        """
+        Applies 'parse' and 'clean' to a dataset in XML format as a single chain
+        of generators, without writing a dirty CSV file.
+
+        Args:
+
+          source: A dataset and its associated metadata, defined as a Source 
+            object.
+        """
+        if not hasattr(source, 'label_map'):
+            raise ValueError("Source object missing 'label_map', 'extract_labels' was not ran.")
+
+        self._write_clean(source, self._parse_rows(source))
+
+    def _parse_rows(self, source):
+        """
+        Generator that transforms the entities of an XML dataset into rows of the
+        standardized CSV format. The first row yielded identifies each column.
+
+        Args:
+
+          source: A dataset and its associated metadata, defined as a Source 
+            object.
+        """
+        tags = source.label_map
+
+        # the initial row which identifies each column
+        yield self._generateFirstRow(tags)
+
+        # labels of the form './/tag' are answered from an index of the descendants
+        # of each record, which is built in a single walk of the record; other
+        # XPath expressions are compiled by the XML backend
+        get = self._xml_empty_element_handler
+        indexed_tags = set()
+        def getter(path):
+            if self._SIMPLE_PATH.fullmatch(path):
+                tag = path[3:]
+                indexed_tags.add(tag)
+                return lambda entity: get(entity[1].get(tag))
+            find = backend.compile_path(path)
+            return lambda entity: get(find(entity[0]))
+        backend = self.xml_backend(source)
+        extractors, addr_index = self._bind_label_plan(source.label_plan, getter)
+
+        index = backend.index_descendants
+        entities = ((element, index(element, indexed_tags)) \
+                    for element in self._iter_records(source, backend))
+        yield from self._extract_rows(entities, extractors, addr_index)
+
+    def xml_backend(self, source):
+        """
+        Selects the XML backend of a source. The 'xml_backend' tag of the source
+        file takes precedence over 'source.xml_backend', which is set for the
+        whole run. If the selected backend is not installed, the standard
+        library backend is used.
+
+        Args:
+
+          source: A dataset and its associated metadata, defined as a Source 
+            object.
+
+        Returns:
+
+          backend: An XMLBackend object.
+        """
+        name = source.metadata.get('xml_backend', source.xml_backend)
+        if name == None or name == 'auto':
+            name = 'lxml' if lxml_etree != None else 'etree'
+        if name == 'lxml' and lxml_etree == None:
+            print("WARNING: lxml is not installed, using the standard library XML parser.")
+            name = 'etree'
+        return XML_BACKENDS[name]()
+
+    def _iter_records(self, source, backend=None):
+        """
+        Generator that incrementally parses an XML dataset and yields its
+        'header' elements in document order, as done by the 'iter' method of
+        the root element. Elements are removed from the tree once they are 
+        processed, so the memory used depends on the size of the records rather
+        than the size of the dataset.
+
+        Args:
+
+          source: A dataset and its associated metadata, defined as a Source 
+            object.
+
+          backend: The XMLBackend object to parse with. If 'None', it is selected
+            by 'xml_backend'.
+        """
+        header = source.metadata['header']
+        enc = self.char_encode_check(source)
+        if backend == None:
+            backend = self.xml_backend(source)
+        with source.open_raw() as raw:
+            yield from backend.iter_records(raw, enc, header)
+
+    def _xml_empty_element_handler(self, element):
+        """
+        The 'xml.etree' module returns 'None' for text of empty-element tags. Moreover, 
+        if the element cannot be found, the element is 'None'. This function is defined 
+        to handle these cases.
+
+        Args:
+
+          element: A node in the XML tree.
+
+        Returns:
+
+          '': missing or empty tag
+                  
+          element.text: tag text
+        """
+        if element is None:
+            return ''
+        if not (element.text is None):
+            return element.text
+        else:
+            return ''
+
+
+
+#######################
+# XML PARSER BACKENDS #
+#######################
+
+class XMLBackend(object):
+    """
+    Parent class of the XML parsers used by XML_Algorithm. Elements produced
+    by a backend must support the ElementTree API.
+    """
+    name = None
+
+    def iter_records(self, source, encoding, header):
+        """
+        Incrementally parses an XML file and returns an iterator of its 'header'
+        elements in document order. Processed elements are removed from the tree.
+
+        Args:
+
+          source: Path or binary file object of the XML file.
+
+          encoding: Character encoding of the XML file, which overrides the
+            encoding declared by the file.
+
+          header: Tag of the elements to return, or '*' for every element.
+        """
+        raise NotImplementedError
+
+    def compile_path(self, path):
+        """
+        Compiles a path expression, returning a function which accepts an element
+        and returns the first element selected by the path, or 'None'.
+        """
+        raise NotImplementedError
+
+    def index_descendants(self, element, tags):
+        """
+        Returns a dict that maps each tag of 'tags' to the first descendant of
+        'element' with that tag in document order, which is the element found
+        by 'element.find(".//" + tag)'.
+        """
+        index = dict()
+        if not tags:
+            return index
+        descendants = element.iter()
+        # skip 'element' itself
+        next(descendants)
+        for subelement in descendants:
+            tag = subelement.tag
+            if tag in tags and tag not in index:
+                index[tag] = subelement
+        return index
+
+class ElementTreeBackend(XMLBackend):
+    """
+    XML backend using the standard library module xml.etree.ElementTree.
+    """
+    name = 'etree'
+
+    def iter_records(self, source, encoding, header):
+        xmlp = ElementTree.XMLParser(encoding=encoding)
+
+        # open elements, from the root to the current element
+        stack = []
+        # header elements of the outermost open header element, which may
+        # contain further header elements
+        records = []
+
+        for event, element in ElementTree.iterparse(source, events=('start', 'end'), parser=xmlp):
+            if event == 'start':
+                stack.append(element)
+                if element.tag == header or header == '*':
+                    records.append(element)
+                continue
+
+            stack.pop()
+            # a header element is only complete once the outermost open header
+            # element ends
+            if records and records[0] is element:
+                yield from records
+                records = []
+            if not records and stack:
+                # the subtree is complete and no longer needed
+                stack[-1].remove(element)
+
+    def compile_path(self, path):
+        return lambda element: element.find(path)
+
+class LxmlBackend(XMLBackend):
+    """
+    XML backend using the lxml package, which is optional. Only the events of
+    header elements are reported by the parser.
+    """
+    name = 'lxml'
+
+    def iter_records(self, source, encoding, header):
+        tag = None if header == '*' else header
+        events = lxml_etree.iterparse(source, events=('start', 'end'), tag=tag, \
+                                      encoding=encoding, huge_tree=True)
+        records = []
+        depth = 0
+        for event, element in events:
+            if event == 'start':
+                depth += 1
+                records.append(element)
+                continue
+
+            depth -= 1
+            if depth == 0:
+                yield from records
+                records = []
+                # free the record and everything parsed before it
+                element.clear(keep_tail=True)
+                for ancestor in itertools.chain((element,), element.iterancestors()):
+                    parent = ancestor.getparent()
+                    while ancestor.getprevious() is not None:
+                        del parent[0]
+
+    def compile_path(self, path):
+        # the ElementPath implementation of lxml selects the same element as
+        # ElementTree, unlike XPath, which returns matches in document order
+        return lambda element: element.find(path)
+
+    def index_descendants(self, element, tags):
+        index = dict()
+        if not tags:
+            return index
+        # lxml filters the descendants by tag without creating Python objects
+        # for the other elements
+        for subelement in element.iter(*tags):
+            tag = subelement.tag
+            if tag not in index and subelement is not element:
+                index[tag] = subelement
+        return index
+
+# XML backends by name, as used by the 'xml_backend' tag of a source file and
+# the '--xml-backend' option of tabctl.py
+XML_BACKENDS = {'etree' : ElementTreeBackend, 'lxml' : LxmlBackend}
+
+
+class _ByteRange(io.RawIOBase):
+    """
+    A read-only binary stream of the bytes of a file between two offsets.
+    """
+    def __init__(self, path, start, end):
+        self._f = open(path, 'rb')
+        self._f.seek(start)
+        self._left = end - start
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        n = min(len(b), self._left)
+        if n <= 0:
+            return 0
+        n = self._f.readinto(memoryview(b)[:n])
+        self._left -= n
+        return n
+
+    def close(self):
+        self._f.close()
+        io.RawIOBase.close(self)
+
+def _open_byte_range(path, start, end, encoding):
+    """
+    Opens the bytes of a file between two offsets in text mode.
+    """
+    return io.TextIOWrapper(io.BufferedReader(_ByteRange(path, start, end)), encoding=encoding)
+
+
+
+################
+# OUTPUT SINKS #
+################
+
+class OutputSink(object):
+    """
+    Parent class of the writers of clean datasets. A sink is created with the
+    column names of the dataset and is given its rows one at a time, as lists
+    of strings in the order of the column names.
+
+    Attributes:
+
+      suffix: File name suffix of the format, used for 'Source.cleanpath'.
+
+      reader: Class that reads files written by the sink.
+
+      fieldnames: List of column names.
+    """
+    suffix = None
+    reader = None
+
+    def __init__(self, path, fieldnames):
+        self.path = path
+        self.fieldnames = list(fieldnames)
+
+    def writerow(self, row):
+        raise NotImplementedError
+
+    def writerows(self, rows):
+        for row in rows:
+            self.writerow(row)
+
+    def close(self):
+        raise NotImplementedError
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class OutputReader(object):
+    """
+    Parent class of the readers of clean datasets. Iterating over a reader
+    yields the rows of the dataset as lists of strings, without the row of
+    column names.
+
+    Attributes:
+
+      fieldnames: List of column names.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.fieldnames = None
+
+    def __iter__(self):
+        raise NotImplementedError
+
+    def column(self, name):
+        """
+        Returns the entries of the column 'name' as a list.
+        """
+        i = self.fieldnames.index(name)
+        return [row[i] for row in self]
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class CSVSink(OutputSink):
+    """
+    Writes a CSV file with every entry quoted, which is the default format of
+    clean datasets.
+    """
+    suffix = '.csv'
+
+    def __init__(self, path, fieldnames):
+        OutputSink.__init__(self, path, fieldnames)
+        self._file = open(path, 'w')
+        writer = csv.writer(self._file, delimiter=',', quotechar='"', quoting=csv.QUOTE_ALL)
+        writer.writerow(self.fieldnames)
+        self.writerow = writer.writerow
+        self.writerows = writer.writerows
+
+    def close(self):
+        self._file.close()
+
+class CSVReader(OutputReader):
+    """
+    Reads a CSV file written by CSVSink.
+    """
+    def __init__(self, path):
+        OutputReader.__init__(self, path)
+        self._file = open(path, 'r')
+        self.fieldnames = next(csv.reader(self._file), [])
+
+    def __iter__(self):
+        self._file.seek(0)
+        reader = csv.reader(self._file)
+        next(reader, None)
+        # skip blank lines, as done by csv.DictReader
+        return (row for row in reader if row != [])
+
+    def close(self):
+        self._file.close()
+
+CSVSink.reader = CSVReader
+
+class ColumnarSink(OutputSink):
+    """
+    Writes a compact binary file in which the rows are stored in groups, and
+    each group stores its entries column by column. A column with few distinct
+    entries, such as 'city' or 'prov/terr', is dictionary encoded as a list of
+    its distinct entries and an array of indices into that list. Every column is
+    then compressed with zlib.
+
+    The file starts with a magic string and a JSON object holding the column
+    names, whose length is given as a 4-byte unsigned integer. Each row group
+    is the number of rows, followed by a header and a payload for each column.
+    All integers are little-endian.
+
+    Attributes:
+
+      row_group_size: Number of rows in each row group.
+
+      level: zlib compression level.
+    """
+    suffix = '.otc'
+
+    MAGIC = b'OTCOLUMN\x01'
+
+    # encodings of the columns of a row group
+    PLAIN = 0
+    DICTIONARY = 1
+
+    # column header: encoding, typecode of the dictionary indices, number of
+    # strings stored and size of the compressed payload
+    _COLUMN_HEADER = struct.Struct('<BcII')
+    _UINT32 = struct.Struct('<I')
+
+    def __init__(self, path, fieldnames, row_group_size=65536, level=1):
+        OutputSink.__init__(self, path, fieldnames)
+        self.row_group_size = row_group_size
+        self.level = level
+        self._rows = []
+        self._file = open(path, 'wb')
+        header = json.dumps({'fieldnames' : self.fieldnames}).encode('utf-8')
+        self._file.write(self.MAGIC + self._UINT32.pack(len(header)) + header)
+
+    def writerow(self, row):
+        self._rows.append(row)
+        if len(self._rows) >= self.row_group_size:
+            self._flush()
+
+    def writerows(self, rows):
+        rows = iter(rows)
+        while True:
+            self._rows.extend(itertools.islice(rows, self.row_group_size - len(self._rows)))
+            if len(self._rows) < self.row_group_size:
+                return
+            self._flush()
+
+    def _flush(self):
+        nrows = len(self._rows)
+        if nrows == 0:
+            return
+        # transpose the rows into columns
+        columns = list(itertools.zip_longest(*self._rows, fillvalue=''))
+        columns += [('',) * nrows] * (len(self.fieldnames) - len(columns))
+        self._rows = []
+
+        out = [self._UINT32.pack(nrows)]
+        for column in columns[:len(self.fieldnames)]:
+            distinct = dict.fromkeys(column)
+            if len(distinct) <= nrows // 2:
+                typecode = 'B' if len(distinct) <= 1<<8 else 'H' if len(distinct) <= 1<<16 else 'I'
+                index = {entry : i for i, entry in enumerate(distinct)}
+                codes = array.array(typecode, map(index.__getitem__, column))
+                if sys.byteorder != 'little':
+                    codes.byteswap()
+                payload = _encode_strings(distinct) + codes.tobytes()
+                encoding, count = self.DICTIONARY, len(distinct)
+            else:
+                typecode = 'B'
+                payload = _encode_strings(column)
+                encoding, count = self.PLAIN, nrows
+            payload = zlib.compress(payload, self.level)
+            out.append(self._COLUMN_HEADER.pack(encoding, typecode.encode('ascii'), count, len(payload)))
+            out.append(payload)
+        self._file.write(b''.join(out))
+
+    def close(self):
+        if not self._file.closed:
+            self._flush()
+            self._file.close()
+
+class ColumnarReader(OutputReader):
+    """
+    Reads a file written by ColumnarSink. Reading a single column with the
+    'column' method skips the payloads of the other columns.
+    """
+    def __init__(self, path):
+        OutputReader.__init__(self, path)
+        self._file = open(path, 'rb')
+        magic = self._file.read(len(ColumnarSink.MAGIC))
+        if magic != ColumnarSink.MAGIC:
+            self._file.close()
+            raise ValueError("'" + path + "' is not a columnar clean dataset.")
+        size, = ColumnarSink._UINT32.unpack(self._file.read(ColumnarSink._UINT32.size))
+        self.fieldnames = json.loads(self._file.read(size).decode('utf-8'))['fieldnames']
+        self._start = self._file.tell()
+
+    def _groups(self, wanted):
+        """
+        Yields the number of rows of each row group, and a list with the decoded
+        entries of the columns whose indices are in 'wanted', or 'None'.
+        """
+        f = self._file
+        f.seek(self._start)
+        uint32 = ColumnarSink._UINT32
+        column_header = ColumnarSink._COLUMN_HEADER
+        while True:
+            head = f.read(uint32.size)
+            if len(head) < uint32.size:
+                return
+            nrows, = uint32.unpack(head)
+            columns = []
+            for i in range(len(self.fieldnames)):
+                encoding, typecode, count, size = column_header.unpack(f.read(column_header.size))
+                if i not in wanted:
+                    f.seek(size, 1)
+                    columns.append(None)
+                    continue
+                payload = zlib.decompress(f.read(size))
+                entries, end = _decode_strings(payload, count)
+                if encoding == ColumnarSink.DICTIONARY:
+                    codes = array.array(typecode.decode('ascii'))
+                    codes.frombytes(payload[end:])
+                    if sys.byteorder != 'little':
+                        codes.byteswap()
+                    entries = list(map(entries.__getitem__, codes))
+                columns.append(entries)
+            yield nrows, columns
+
+    def __iter__(self):
+        wanted = range(len(self.fieldnames))
+        for nrows, columns in self._groups(wanted):
+            yield from map(list, zip(*columns))
+
+    def column(self, name):
+        i = self.fieldnames.index(name)
+        entries = []
+        for nrows, columns in self._groups((i,)):
+            entries.extend(columns[i])
+        return entries
+
+    def close(self):
+        self._file.close()
+
+ColumnarSink.reader = ColumnarReader
+
+def _encode_strings(strings):
+    """
+    Encodes strings as an array of their lengths in characters, the size of
+    their concatenation in UTF-8 and the concatenation itself. Lengths in 
+    characters let the concatenation be decoded at once, then sliced.
+    """
+    lengths = array.array('I', map(len, strings))
+    if sys.byteorder != 'little':
+        lengths.byteswap()
+    text = ''.join(strings).encode('utf-8', 'surrogatepass')
+    return lengths.tobytes() + ColumnarSink._UINT32.pack(len(text)) + text
+
+def _decode_strings(payload, count):
+    """
+    Decodes 'count' strings encoded by '_encode_strings' at the start of
+    'payload', returning the list of strings and the offset after them.
+    """
+    lengths = array.array('I')
+    lengths.frombytes(payload[:4 * count])
+    if sys.byteorder != 'little':
+        lengths.byteswap()
+    start = 4 * count + 4
+    nbytes, = ColumnarSink._UINT32.unpack_from(payload, 4 * count)
+    text = payload[start:start + nbytes].decode('utf-8', 'surrogatepass')
+    offsets = list(itertools.accumulate(lengths, initial=0))
+    strings = [text[offsets[i]:offsets[i + 1]] for i in range(count)]
+    return strings, start + nbytes
+
+class ParquetSink(OutputSink):
+    """
+    Writes a Parquet file with the optional pyarrow package. Every column is a
+    string column, dictionary encoded by pyarrow where it is effective.
+
+    Attributes:
+
+      row_group_size: Number of rows in each row group.
+    """
+    suffix = '.parquet'
+
+    def __init__(self, path, fieldnames, row_group_size=65536):
+        if pyarrow == None:
+            raise ImportError("Parquet output requires the 'pyarrow' package.")
+        OutputSink.__init__(self, path, fieldnames)
+        self.row_group_size = row_group_size
+        self._rows = []
+        self._schema = pyarrow.schema([(name, pyarrow.string()) for name in self.fieldnames])
+        self._writer = pyarrow_parquet.ParquetWriter(path, self._schema, use_dictionary=True)
+
+    def writerow(self, row):
+        self._rows.append(row)
+        if len(self._rows) >= self.row_group_size:
+            self._flush()
+
+    writerows = ColumnarSink.writerows
+
+    def _flush(self):
+        nrows = len(self._rows)
+        if nrows == 0:
+            return
+        columns = list(itertools.zip_longest(*self._rows, fillvalue=''))
+        columns += [('',) * nrows] * (len(self.fieldnames) - len(columns))
+        self._rows = []
+        arrays = [pyarrow.array(column, pyarrow.string()) for column in columns[:len(self.fieldnames)]]
+        self._writer.write_table(pyarrow.Table.from_arrays(arrays, schema=self._schema))
+
+    def close(self):
+        if self._writer != None:
+            self._flush()
+            self._writer.close()
+            self._writer = None
+
+class ParquetReader(OutputReader):
+    """
+    Reads a Parquet file with the optional pyarrow package.
+    """
+    def __init__(self, path):
+        if pyarrow == None:
+            raise ImportError("Reading Parquet files requires the 'pyarrow' package.")
+        OutputReader.__init__(self, path)
+        self._file = pyarrow_parquet.ParquetFile(path)
+        self.fieldnames = self._file.schema_arrow.names
+
+    def __iter__(self):
+        for batch in self._file.iter_batches():
+            yield from map(list, zip(*(column.to_pylist() for column in batch.columns)))
 
-        with open(source.dirtypath, 'w', encoding="utf-8") as csvfile:
-            
-            csvwriter = csv.writer(csvfile, delimiter=',', quotechar='"', quoting=csv.QUOTE_ALL)
+    def column(self, name):
+        return self._file.read(columns=[name]).column(0).to_pylist()
 
-            # write the initial row which identifies each column
-            col_labels = self._generateFirstRow(tags)
-            csvwriter.writerow(col_labels)
-
-            for element in root.iter(header):
-                row = []
-                for key in tags:
-                    # # #
-                    # decision: Check if tags[key] is of type JSON array (list).
-                    # By design, FORCE keys should be ignored in this decision.
-                    #
-                    # depth: 1
-                    # # #
-                    if isinstance(tags[key], list):
-                        entry = ''
-                        for i in tags[key]:
-                            # check if 'i' is of the form 'force:*'
-                            ii = i.split(':')
-                            if len(ii) == 1:
-                                subelement = element.find(i)
-                                subelement = self._xml_empty_element_handler(subelement)
-                                entry += subelement + ' '
-                            elif len(ii) == 2:
-                                entry += ii[1] + ' '
-                        entry = self._quick_scrub(entry)
-                        # # #
-                        # decision: check if key is "full_addr"
-                        # depth: 2
-                        # # #
-                        if key != "full_addr":
-                            row.append(entry)
-                        else:
-                            ap_entry = self.address_parser.parse(entry)
-                            # SUGGESTION: This for loop is exclusively for libpostal output.
-                            # Perhaps it should be moved to the AddressParser object?
-                            for afl in self.ADDR_FIELD_LABEL:
-                                if self._ADDR_LABEL_TO_POSTAL[afl] in [x[1] for x in ap_entry]:
-                                    ind = list(map(operator.itemgetter(1), ap_entry)).index(self._ADDR_LABEL_TO_POSTAL[afl])
-                                    row.append(ap_entry[ind][0])
-                                else:
-                                    row.append("")
-                        continue
-                    # # #
-                    # decision: check if key is "full_addr"
-                    # depth: 1
-                    # # #
-                    if key == "full_addr":
-                        entry = element.find(tags[key])
-                        entry = self._xml_empty_element_handler(entry)
-                        entry = self._quick_scrub(entry)
-                        ap_entry = self.address_parser.parse(entry)
-                        # SUGGESTION: This for loop is exclusively for libpostal output.
-                        # Perhaps it should be moved to the AddressParser object?
-                        for afl in self.ADDR_FIELD_LABEL:
-                            if self._ADDR_LABEL_TO_POSTAL[afl] in [x[1] for x in ap_entry]:
-                                ind = list(map(operator.itemgetter(1), ap_entry)).index(self._ADDR_LABEL_TO_POSTAL[afl])
-                                row.append(ap_entry[ind][0])
-                            else:
-                                row.append("")
-                        continue
-                    # # #
-                    # All other cases get handled here.
-                    # # #
-                    # check if 'tags[key]' is of the form 'force:*'
-                    ee = tags[key].split(':')
-                    if len(ee) == 1:
-                        subelement = element.find(ee[0])
-                        subel_content = self._xml_empty_element_handler(subelement)
-                    elif len(ee) == 2:
-                        subel_content = ee[1]
-                    row.append(self._quick_scrub(subel_content))
-                if not self._isRowEmpty(row):
-                    csvwriter.writerow(row)
+    def close(self):
+        self._file.close()
 
+ParquetSink.reader = ParquetReader
 
+class BlankFillSink(OutputSink):
+    """
+    Writes rows to a sink of a clean dataset, and their blank-filled layout to
+    a second sink, so that blank filling does not need another pass over the 
+    clean dataset. The layout is projected from the columns of the first sink
+    to those of the second sink, where missing columns are blank and the last
+    of duplicate columns wins.
 
+    Args:
 
-    def _xml_empty_element_handler(self, element):
-        """
-        The 'xml.etree' module returns 'None' for text of empty-element tags. Moreover, 
-        if the element cannot be found, the element is 'None'. This function is defined 
-        to handle these cases.
+      clean: OutputSink of the clean dataset.
 
-        Args:
+      filled: OutputSink of the blank-filled dataset.
+    """
+    def __init__(self, clean, filled):
+        OutputSink.__init__(self, clean.path, clean.fieldnames)
+        self._clean = clean
+        self._filled = filled
+        # rows are extended by a blank entry, which fills the missing columns
+        index = {label : i for i, label in enumerate(clean.fieldnames)}
+        blank = len(clean.fieldnames)
+        self._project = operator.itemgetter(*[index.get(label, blank) for label in filled.fieldnames])
+
+    def writerow(self, row):
+        self._clean.writerow(row)
+        self._filled.writerow(self._project([*row, '']))
+
+    def writerows(self, rows):
+        rows = list(rows)
+        self._clean.writerows(rows)
+        project = self._project
+        self._filled.writerows([project([*row, '']) for row in rows])
+
+    def close(self):
+        self._clean.close()
+        self._filled.close()
+
+# output formats of clean datasets by name, as used by the '--output-format'
+# option of tabctl.py
+OUTPUT_FORMATS = {'csv' : CSVSink, 'columnar' : ColumnarSink, 'parquet' : ParquetSink}
+
+def open_output(path):
+    """
+    Opens a clean dataset written by any of the OUTPUT_FORMATS for reading, 
+    detecting its format from the start of the file.
 
-          element: A node in the XML tree.
+    Args:
 
-        Returns:
+      path: Path to the clean dataset.
 
-          '': missing or empty tag
-                  
-          element.text: tag text
-        """
-        if element is None:
-            return ''
-        if not (element.text is None):
-            return element.text
-        else:
-            return ''
+    Returns:
 
+      An OutputReader object, which can be iterated over for the rows of the
+      dataset, or used to read a single column with its 'column' method.
+    """
+    with open(path, 'rb') as f:
+        magic = f.read(len(ColumnarSink.MAGIC))
+    if magic == ColumnarSink.MAGIC:
+        return ColumnarReader(path)
+    if magic[:4] == b'PAR1':
+        return ParquetReader(path)
+    return CSVReader(path)
 
 
 ###############################
 # SOURCE DATASET / FILE CLASS #
 ###############################
 
+# the umask can only be read by setting it, so it is read once on import, 
+# before the fetch threads are started
+_UMASK = os.umask(0o022)
+os.umask(_UMASK)
+
 class Source(object):
     """
     Source dataset class. Contains metadata and other information about the dataset
@@ -918,6 +2980,16 @@ class Source(object):
       rawpath: path to the raw dataset relative to the OBR directory. This is
         assigned './pddir/raw'.
 
+      archivepath: path to the archive or compressed file containing the raw 
+        dataset relative to the OBR directory, or 'None' if the dataset is not
+        compressed. For gzip, bz2 and xz compression without a 'localarchive'
+        tag, this is 'rawpath' with the suffix of the format appended.
+
+      archive_member: name of the raw dataset in a zip archive, or 'None'.
+
+      archived: whether the raw dataset is read directly from the archive, 
+        instead of from 'rawpath'. This is set by 'archive_extraction'.
+
       dirtypath: path to the dirty dataset relative to the OBR directory. This is
         assigned './pddir/dirty'.
 
@@ -927,12 +2999,43 @@ class Source(object):
       label_map: a dict object that stores the mapping of OBRs standardized labels
         to the dataset's labels, as obtained by the source file.
 
+      label_plan: the label map compiled into an extraction plan, as done by
+        Algorithm._compile_label_map.
+
       database_type: string which indicates the type of database, intended to be
         interpreted by the DataProcess class when determining standardized column 
         names.
+
+      encoding: character encoding of the raw dataset, as determined by 
+        Algorithm.char_encode_check.
+
+      encoding_sample: number of bytes of the raw dataset to test when guessing
+        its character encoding. If 'None', the whole dataset is tested.
+
+      xml_backend: name of the XML backend to use for XML datasets, unless the
+        source file has an 'xml_backend' tag. If 'None', lxml is used when it is
+        installed.
+
+      extract_flag: whether 'archive_extraction' writes datasets in archives to
+        the raw directory, instead of having them read from the archive.
+
+      output_format: name of the format of the clean dataset in OUTPUT_FORMATS,
+        which also determines the suffix of 'cleanpath'.
+
+      clean_batch_size: number of rows cleaned at once, column by column. If 
+        'None', rows are cleaned one at a time.
     """
+    # size of the chunks in which downloads are written to disk
+    _DOWNLOAD_CHUNK_SIZE = 1<<20
+
+    # compression formats of a single file, with their modules and default 
+    # file name suffixes
+    _STREAM_CODECS = {'gzip' : (gzip, '.gz'), 'bz2' : (bz2, '.bz2'), 'xz' : (lzma, '.xz')}
+
     def __init__(self, path, pre_flag=False, post_flag=False, no_fetch_flag=True, \
-                 no_extract_flag=True, blank_fill_flag=False):
+                 no_extract_flag=True, blank_fill_flag=False, staged_flag=False, \
+                 encoding_sample=None, xml_backend=None, extract_flag=False, \
+                 output_format='csv', clean_batch_size=None):
         """
         Initializes a new source file object.
 
@@ -952,15 +3055,28 @@ class Source(object):
         self.no_fetch_flag = no_fetch_flag
         self.no_extract_flag = no_extract_flag
         self.blank_fill_flag = blank_fill_flag
+        self.staged_flag = staged_flag
+        self.encoding_sample = encoding_sample
+        self.xml_backend = xml_backend
+        self.extract_flag = extract_flag
+        self.output_format = output_format
+        self.clean_batch_size = clean_batch_size
         
         # determined during parsing
         self.local_fname = None
         self.rawpath = None
+        self.archivepath = None
+        self.archive_member = None
+        self.archived = False
         self.dirtypath = None
         self.cleanpath = None
         self.label_map = None
+        self.label_plan = None
         self.database_type = None
 
+        # determined during processing
+        self.encoding = None
+
     def parse(self):
         """
         Parses the source file to check correction of syntax.
@@ -1017,15 +3133,34 @@ class Source(object):
         if (self.metadata['format'] != 'csv') and ('header' in self.metadata) and (not isinstance(self.metadata['header'], str)):
             raise TypeError("'header' must be a string.")
 
+        # xml backend
+        if 'xml_backend' in self.metadata:
+            if not isinstance(self.metadata['xml_backend'], str):
+                raise TypeError("'xml_backend' must be a string.")
+            if self.metadata['xml_backend'] != 'auto' and self.metadata['xml_backend'] not in XML_BACKENDS:
+                raise ValueError("Unsupported XML backend '" + self.metadata['xml_backend'] + "'")
+
+        # output format
+        if self.output_format not in OUTPUT_FORMATS:
+            raise ValueError("Unsupported output format '" + str(self.output_format) + "'")
+
         # url
         if 'url' in self.metadata and (not isinstance(self.metadata['url'], str)):
             raise TypeError("'url' must be a string.")
 
+        # checksum
+        if 'checksum' in self.metadata:
+            if not isinstance(self.metadata['checksum'], str):
+                raise TypeError("'checksum' must be a string.")
+            checksum = self.metadata['checksum'].split(':', 1)
+            if len(checksum) != 2 or checksum[0] not in hashlib.algorithms_available:
+                raise ValueError("'checksum' must have the form 'algorithm:hexdigest', such as 'sha256:...'")
+
         # compression
         if 'compression' in self.metadata:
             if not isinstance(self.metadata['compression'], str):
                 raise TypeError("'compression' must be a string.")
-            if self.metadata['compression'] != 'zip':
+            if self.metadata['compression'] != 'zip' and self.metadata['compression'] not in self._STREAM_CODECS:
                 raise ValueError("Unsupported compression format '" + self.metadata['compression'] + "'")
 
         # localarchive
@@ -1084,73 +3219,868 @@ class Source(object):
         # set local_fname, rawpath, dirtypath, and cleanpath values
         self.local_fname = self.metadata['localfile'].split(':')[0]
         self.rawpath = './pddir/raw/' + self.local_fname
+        if 'localarchive' in self.metadata:
+            self.archivepath = './pddir/raw/' + self.metadata['localarchive']
+        elif 'compression' in self.metadata and self.metadata['compression'] in self._STREAM_CODECS:
+            self.archivepath = self.rawpath + self._STREAM_CODECS[self.metadata['compression']][1]
+        if 'compression' in self.metadata and self.metadata['compression'] == 'zip':
+            self.archive_member = self.metadata['localfile'].split(':')[-1]
         if len(self.local_fname.split('.')) == 1:
             self.dirtypath = './pddir/dirty/' + self.local_fname + "-dirty.csv"
         else:
             self.dirtypath = './pddir/dirty/' + '.'.join(str(x) for x in self.local_fname.split('.')[:-1]) + "-dirty.csv"
 
+        suffix = OUTPUT_FORMATS[self.output_format].suffix
         if len(self.local_fname.split('.')) == 1:
-            self.cleanpath = './pddir/clean/' + self.local_fname + "-clean.csv"
+            self.cleanpath = './pddir/clean/' + self.local_fname + "-clean" + suffix
         else:
-            self.cleanpath = './pddir/clean/' + '.'.join(str(x) for x in self.local_fname.split('.')[:-1]) + "-clean.csv"
+            self.cleanpath = './pddir/clean/' + '.'.join(str(x) for x in self.local_fname.split('.')[:-1]) + "-clean" + suffix
 
                 
     def fetch_url(self):
         """
         Downloads a dataset by fetching its URL and writing to the raw directory.
+        The download is streamed to a temporary file in chunks, which replaces
+        the local copy once the download is complete, so an interrupted download
+        never leaves a truncated dataset behind. If the source file has a 
+        'checksum' tag, the digest of the download is computed as it is written
+        and checked before the local copy is replaced.
+
+        Downloads are recorded in a DownloadManifest. HTTP requests for a URL in
+        the manifest are conditional, so the server can answer that the dataset 
+        is not modified, and a downloaded dataset with the same content as the
+        local copy does not replace it.
+
+        Returns:
+
+          'True' if the local copy was replaced, and 'False' otherwise.
+
+        Raises:
+
+          ValueError: The checksum of the download does not match the 'checksum'
+            tag.
         """
         if self.no_fetch_flag == True:
-            return None
-        
+            return False
+
+        if 'compression' in self.metadata:
+            path = self.archivepath
+        else:
+            path = './pddir/raw/' + self.metadata['localfile']
+
+        url = self.metadata['url']
+        manifest = DownloadManifest()
+        entry = manifest.lookup(url, path)
+
         # use requests library if protocol is HTTP
-        if self.metadata['url'][0:4] == "http":
-            response = requests.get(self.metadata['url'])
-            content = response.content
+        if url[0:4] == "http":
+            headers = dict()
+            if entry != None and entry['etag'] != None:
+                headers['If-None-Match'] = entry['etag']
+            if entry != None and entry['last_modified'] != None:
+                headers['If-Modified-Since'] = entry['last_modified']
+            with requests.get(url, headers=headers, stream=True) as response:
+                if response.status_code == 304:
+                    print("DEBUG:", self.local_fname, "is not modified, skipping download")
+                    return False
+                response.raise_for_status()
+                etag = response.headers.get('ETag')
+                last_modified = response.headers.get('Last-Modified')
+                sha256, replaced = self._write_download(response.iter_content(self._DOWNLOAD_CHUNK_SIZE), \
+                                                        path, entry)
         # otherwise, use urllib to handle other protocols (e.g. FTP)
         else:
-            response = req.urlopen(self.metadata['url'])
-            content = response.read()
-            
-        if 'compression' in self.metadata:
-            if self.metadata['compression'] == "zip":
-                with open('./pddir/raw/' + self.metadata['localarchive'], 'wb') as data:
-                    data.write(content)
-        else:
-            with open('./pddir/raw/' + self.metadata['localfile'], 'wb') as data:
-                data.write(content)
+            with req.urlopen(url) as response:
+                etag = None
+                last_modified = response.headers.get('Last-Modified') if response.headers != None else None
+                chunks = iter(lambda: response.read(self._DOWNLOAD_CHUNK_SIZE), b'')
+                sha256, replaced = self._write_download(chunks, path, entry)
+
+        manifest.store(url, path, etag, last_modified, sha256)
+        return replaced
+
+    def _write_download(self, chunks, path, entry=None):
+        """
+        Writes an iterable of byte chunks to a temporary file in the directory of
+        'path', then renames it to 'path' unless it has the same SHA-256 digest
+        as the manifest entry 'entry'. The digest of the 'checksum' tag is also
+        computed and compared, if the tag is given.
+
+        Returns:
+
+          A tuple of the SHA-256 hex digest of the download and whether 'path' 
+          was replaced.
+        """
+        sha256 = hashlib.sha256()
+        checksum = None
+        if 'checksum' in self.metadata:
+            algorithm, expected = self.metadata['checksum'].split(':', 1)
+            checksum = sha256 if algorithm == 'sha256' else hashlib.new(algorithm)
+
+        fd, tmp_path = self._temp_file(path)
+        try:
+            with os.fdopen(fd, 'wb') as data:
+                for chunk in chunks:
+                    data.write(chunk)
+                    sha256.update(chunk)
+                    if checksum != None and checksum is not sha256:
+                        checksum.update(chunk)
+            if checksum != None and checksum.hexdigest() != expected.lower():
+                raise ValueError("Checksum mismatch for '" + self.metadata['url'] + \
+                                 "': expected " + expected.lower() + ", got " + checksum.hexdigest())
+            # keep the local copy, and its modification time, if it is unchanged
+            if entry != None and entry['sha256'] == sha256.hexdigest():
+                os.remove(tmp_path)
+                return sha256.hexdigest(), False
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return sha256.hexdigest(), True
+
+    def _temp_file(self, path):
+        """
+        Creates a temporary file in the directory of 'path', which replaces 
+        'path' once it is written, and returns its file descriptor and path.
+        Unlike 'tempfile.mkstemp', the permissions of the file follow the umask,
+        as for a file created by 'open'.
+        """
+        fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', \
+                                        suffix='.part', dir=os.path.dirname(path))
+        os.fchmod(fd, 0o666 & ~_UMASK)
+        return fd, tmp_path
 
     def archive_extraction(self):
+        """
+        Prepares a compressed dataset for processing. By default, the dataset is
+        read directly from its archive or compressed file (see 'open_raw'), so
+        it is not written to disk. It is extracted to 'rawpath' if 
+        'extract_flag' is set, or if pre-processing scripts are enabled, since
+        they modify the raw dataset in place.
+        """
         if self.no_extract_flag == True:
             return None
+
+        compression = self.metadata['compression']
+        extract = self.extract_flag == True or (self.pre_flag == True and 'pre' in self.metadata)
         
-        if self.metadata['compression'] == "zip":
-            with ZipFile('./pddir/raw/' + self.metadata['localarchive'], 'r') as zip_file:
+        if compression == "zip":
+            if not extract:
+                # check that the dataset is in the archive
+                with ZipFile(self.archivepath, 'r') as zip_file:
+                    zip_file.getinfo(self.archive_member)
+                self.archived = True
+                return None
+
+            with ZipFile(self.archivepath, 'r') as zip_file:
                 archive_fname = self.metadata['localfile'].split(':')
                 if len(archive_fname) == 1:
                     zip_file.extract(archive_fname[0], './pddir/raw/')
                 else:
                     zip_file.extract(archive_fname[1], './pddir/raw/')
                     os.rename('./pddir/raw/' + archive_fname[1], './pddir/raw/' + self.local_fname)
+            self.archived = False
+
+        elif compression in self._STREAM_CODECS:
+            if not os.path.exists(self.archivepath):
+                raise OSError('Compressed file "%s" does not exist.' % self.archivepath)
+            self.archived = True
+            if not extract:
+                return None
+
+            # decompress to a temporary file, which replaces the raw dataset
+            fd, tmp_path = self._temp_file(self.rawpath)
+            try:
+                with self.open_raw() as raw, os.fdopen(fd, 'wb') as data:
+                    shutil.copyfileobj(raw, data, self._DOWNLOAD_CHUNK_SIZE)
+                os.replace(tmp_path, self.rawpath)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+            self.archived = False
+
+    def open_raw(self, encoding=None):
+        """
+        Opens the raw dataset for reading, either from 'rawpath' or directly
+        from its archive or compressed file if 'archived' is set, in which case
+        the dataset is decompressed as it is read.
+
+        Args:
+
+          encoding: Character encoding to decode the dataset with. If 'None', 
+            the dataset is opened in binary mode.
+
+        Returns:
+
+          A file object of the raw dataset.
+        """
+        if self.archived == True and self.metadata['compression'] == "zip":
+            # the member remains readable after the archive is closed
+            with ZipFile(self.archivepath, 'r') as zip_file:
+                raw = zip_file.open(self.archive_member)
+        elif self.archived == True:
+            raw = self._STREAM_CODECS[self.metadata['compression']][0].open(self.archivepath, 'rb')
+        else:
+            raw = open(self.rawpath, 'rb')
+        if encoding == None:
+            return raw
+        return io.TextIOWrapper(raw, encoding=encoding)
+
+    def output_sink(self, path, fieldnames):
+        """
+        Returns an OutputSink that writes a clean dataset with the column names
+        'fieldnames' to 'path', in the output format of the source.
+        """
+        return OUTPUT_FORMATS[self.output_format](path, fieldnames)
+
+    def raw_stat(self):
+        """
+        Returns a tuple of the size of the raw dataset in bytes and the 
+        modification time in nanoseconds of the file containing it, which is the
+        archive if 'archived' is set. The size of a dataset in a gzip, bz2 or xz
+        file is not known without decompressing it, so the size of the 
+        compressed file is returned instead.
+        """
+        if self.archived == True and self.metadata['compression'] in self._STREAM_CODECS:
+            st = os.stat(self.archivepath)
+            return st.st_size, st.st_mtime_ns
+        if self.archived == True:
+            with ZipFile(self.archivepath, 'r') as zip_file:
+                size = zip_file.getinfo(self.archive_member).file_size
+            return size, os.stat(self.archivepath).st_mtime_ns
+        st = os.stat(self.rawpath)
+        return st.st_size, st.st_mtime_ns
+
+##########
+# CACHES #
+##########
+
+class EncodingCache(object):
+    """
+    A cache of guessed character encodings, stored as a JSON file so that it 
+    persists across runs. Entries are keyed on the path of a raw dataset and 
+    are only valid while the size and modification time of the dataset, as 
+    given by 'Source.raw_stat', are unchanged.
+
+    Attributes:
+
+      path: path to the JSON cache file.
+    """
+    def __init__(self, path='./pddir/encoding_cache.json'):
+        """
+        Initializes an EncodingCache object.
+
+        Args:
+
+          path: path to the JSON cache file.
+        """
+        self.path = path
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return dict()
+
+    def _key(self, source):
+        return os.path.abspath(source.rawpath)
+
+    def lookup(self, source, sample_size=None):
+        """
+        Returns the cached encoding of the raw dataset of 'source', or 'None' if
+        there is no valid entry. An entry guessed from a sample is only used if
+        the sample was at least as large as 'sample_size'.
+        """
+        entry = self._load().get(self._key(source))
+        if entry == None:
+            return None
+        size, mtime = source.raw_stat()
+        if entry['size'] != size or entry['mtime'] != mtime:
+            return None
+        if entry['sample'] != None and (sample_size == None or entry['sample'] < sample_size):
+            return None
+        return entry['encoding']
+
+    def store(self, source, sample_size, encoding):
+        """
+        Adds or replaces the cache entry of the raw dataset of 'source'. The 
+        cache file is updated under a lock file and rewritten atomically, since
+        several processes may share it.
+        """
+        size, mtime = source.raw_stat()
+        tmp_path = self.path + '.' + str(os.getpid())
+        try:
+            # the lock is held from reading the cache to replacing it, so that
+            # entries stored by other processes in the meantime are not lost
+            with open(self.path + '.lock', 'a') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                cache = self._load()
+                cache[self._key(source)] = {'size' : size, \
+                                            'mtime' : mtime, \
+                                            'sample' : sample_size, \
+                                            'encoding' : encoding}
+                with open(tmp_path, 'w') as f:
+                    json.dump(cache, f)
+                os.replace(tmp_path, self.path)
+        except OSError:
+            # the cache is an optimization, so failing to write it is not fatal
+            pass
+
+
+class DownloadManifest(object):
+    """
+    A record of the datasets downloaded from each URL, stored as a JSON file so
+    that unchanged datasets are not downloaded again by later runs. An entry 
+    keeps the validators sent by the server (ETag and Last-Modified), and the
+    size, modification time and SHA-256 digest of the local copy. Entries are 
+    only valid while the size and modification time of the local copy are 
+    unchanged.
+
+    Attributes:
+
+      path: path to the JSON manifest file.
+    """
+    # serializes updates from the fetch threads of a process
+    _lock = threading.Lock()
+
+    def __init__(self, path='./pddir/download_manifest.json'):
+        """
+        Initializes a DownloadManifest object.
+
+        Args:
+
+          path: path to the JSON manifest file.
+        """
+        self.path = path
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return dict()
+
+    def lookup(self, url, fpath):
+        """
+        Returns the manifest entry of 'url' as a dict, or 'None' if there is no
+        valid entry for the local copy 'fpath'.
+        """
+        entry = self._load().get(url)
+        if entry == None or entry['path'] != os.path.abspath(fpath):
+            return None
+        if not os.path.exists(fpath):
+            return None
+        st = os.stat(fpath)
+        if entry['size'] != st.st_size or entry['mtime'] != st.st_mtime_ns:
+            return None
+        return entry
+
+    def store(self, url, fpath, etag, last_modified, sha256):
+        """
+        Adds or replaces the manifest entry of 'url', whose dataset is stored in
+        'fpath'. The manifest file is rewritten atomically.
+        """
+        st = os.stat(fpath)
+        with self._lock:
+            manifest = self._load()
+            manifest[url] = {'path' : os.path.abspath(fpath), \
+                             'etag' : etag, \
+                             'last_modified' : last_modified, \
+                             'size' : st.st_size, \
+                             'mtime' : st.st_mtime_ns, \
+                             'sha256' : sha256}
+            tmp_path = self.path + '.' + str(os.getpid())
+            try:
+                with open(tmp_path, 'w') as f:
+                    json.dump(manifest, f, indent=1)
+                os.replace(tmp_path, self.path)
+            except OSError:
+                # like the encoding cache, the manifest is an optimization
+                pass
+
+
+class BuildRecord(object):
+    """
+    A record of the inputs and outputs of each processed source, stored as a 
+    JSON file so that later runs can skip sources whose outputs are up to date,
+    in the manner of a build system. The inputs of a source are fingerprinted by
+    the size and SHA-256 digest of its raw dataset, the SHA-256 digest of its
+    source file, the processing options that affect the output and the versions
+    of the algorithms and of the address parser. The outputs, including the
+    '.errors' files, are recorded by their size and modification time.
+
+    Attributes:
+
+      path: path to the JSON record file.
+
+      parser_version: Version tag of the address parser, see AddressParser.
+    """
+    _BLOCK_SIZE = 1 << 20
+
+    def __init__(self, path='./pddir/build_record.json', parser_version=None):
+        """
+        Initializes a BuildRecord object.
+
+        Args:
+
+          path: path to the JSON record file.
+
+          parser_version: Version tag of the address parser, so that outputs
+            parsed by another version of the parser are not up to date.
+        """
+        self.path = path
+        self.parser_version = parser_version
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return dict()
+
+    def _key(self, source):
+        return os.path.abspath(source.srcpath)
+
+    def _hash_file(self, f):
+        sha256 = hashlib.sha256()
+        for block in iter(lambda: f.read(self._BLOCK_SIZE), b''):
+            sha256.update(block)
+        return sha256.hexdigest()
+
+    def _outputs(self, source):
+        outputs = [source.cleanpath]
+        if source.blank_fill_flag == True:
+            outputs.append(source.cleanpath + '.bf')
+        return outputs
+
+    def _error_outputs(self, source):
+        # rows rejected by format correction and cleaning, which are only
+        # written if there are any
+        return [source.dirtypath + '.errors', source.cleanpath + '.errors']
+
+    def fingerprint(self, source):
+        """
+        Returns the fingerprint of the inputs of 'source' as a dict. The raw 
+        dataset is only hashed if its size or modification time differs from
+        the record, as extracting an archive again changes the modification 
+        time but not the content.
+        """
+        size, mtime = source.raw_stat()
+        raw = {'size' : size, 'mtime' : mtime, 'sha256' : None}
+        entry = self._load().get(self._key(source))
+        if entry != None and entry['inputs']['raw']['size'] == raw['size'] and \
+           entry['inputs']['raw']['mtime'] == raw['mtime']:
+            raw['sha256'] = entry['inputs']['raw']['sha256']
+        else:
+            with source.open_raw() as f:
+                raw['sha256'] = self._hash_file(f)
+
+        with open(source.srcpath, 'rb') as f:
+            srchash = self._hash_file(f)
+        return {'version' : Algorithm.VERSION, \
+                'parser' : self.parser_version, \
+                'source' : srchash, \
+                'options' : {'blank_fill' : source.blank_fill_flag, \
+                             'encoding_sample' : source.encoding_sample, \
+                             'output_format' : source.output_format}, \
+                'raw' : raw}
+
+    def is_current(self, source, fingerprint):
+        """
+        Returns 'True' if the recorded outputs of 'source' exist, are unchanged
+        and were produced from inputs with the fingerprint 'fingerprint'. Sources
+        with pre-processing or post-processing scripts enabled are never current,
+        since the scripts are not fingerprinted.
+        """
+        if (source.pre_flag == True and 'pre' in source.metadata) or \
+           (source.post_flag == True and 'post' in source.metadata):
+            return False
+        entry = self._load().get(self._key(source))
+        if entry == None:
+            return False
+
+        # the modification time of the raw dataset is not part of the inputs
+        recorded = dict(entry['inputs'], raw=dict(entry['inputs']['raw'], mtime=None))
+        if recorded != dict(fingerprint, raw=dict(fingerprint['raw'], mtime=None)):
+            return False
+
+        if sorted(entry['outputs']) != sorted(self._outputs(source) + self._error_outputs(source)):
+            return False
+        for fpath, output in entry['outputs'].items():
+            # an output recorded as missing must still be missing
+            if output == None:
+                if os.path.exists(fpath):
+                    return False
+                continue
+            if not os.path.exists(fpath):
+                return False
+            st = os.stat(fpath)
+            if output['size'] != st.st_size or output['mtime'] != st.st_mtime_ns:
+                return False
+        return True
+
+    def store(self, source, fingerprint):
+        """
+        Records the outputs of 'source' as produced from inputs with the 
+        fingerprint 'fingerprint'. '.errors' files that were not written are
+        recorded as missing. If the clean dataset or its blank-filled copy is
+        missing, the entry of 'source' is removed instead, so that it is 
+        processed again. The record file is rewritten atomically.
+        """
+        outputs = dict()
+        for fpath in self._outputs(source) + self._error_outputs(source):
+            try:
+                st = os.stat(fpath)
+                outputs[fpath] = {'size' : st.st_size, 'mtime' : st.st_mtime_ns}
+            except FileNotFoundError:
+                outputs[fpath] = None
+        record = self._load()
+        if None in [outputs[fpath] for fpath in self._outputs(source)]:
+            record.pop(self._key(source), None)
+        else:
+            record[self._key(source)] = {'inputs' : fingerprint, 'outputs' : outputs}
+        tmp_path = self.path + '.' + str(os.getpid())
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(record, f, indent=1)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+
+##############
+# SCHEDULING #
+##############
+
+class ScheduledJob(object):
+    """
+    A job queued by a JobScheduler, which is used like the AsyncResult 
+    objects of multiprocessing.Pool.
+
+    Attributes:
+
+      cost: Estimated processing time of the job in seconds.
+
+      start, end: Values of 'time.perf_counter' when the job was sent to the
+        pool and when it finished, or 'None'.
+    """
+    def __init__(self, cost, func, args):
+        self.cost = cost
+        self.func = func
+        self.args = args
+        self.start = None
+        self.end = None
+        self._value = None
+        self._error = None
+        self._done = threading.Event()
+
+    def ready(self):
+        """
+        Returns 'True' if the job has finished.
+        """
+        return self._done.is_set()
+
+    def get(self):
+        """
+        Waits for the job to finish and returns its result, or raises the 
+        exception raised by the job.
+        """
+        self._done.wait()
+        if self._error != None:
+            raise self._error
+        return self._value
+
+
+class JobScheduler(object):
+    """
+    Sends jobs to a multiprocessing.Pool in decreasing order of their estimated
+    cost (longest processing time first). Jobs are queued by 'submit' and only
+    sent to the pool when a worker is free, so that a large dataset submitted 
+    last does not keep a single worker busy long after the others are idle.
+
+    The cost of a job is estimated from the size of its raw dataset, its format
+    and whether its addresses are parsed, which usually dominates.
+
+    Attributes:
+
+      pool: multiprocessing.Pool running the jobs.
+
+      workers: Number of worker processes of 'pool'.
+
+      finished: List of the finished ScheduledJob objects, in order.
+    """
+    # estimated processing rate of each dataset format, in bytes per second
+    _BYTES_PER_SECOND = {'csv' : 4e6, 'xml' : 2e6}
+
+    # slowdown of datasets whose 'full_addr' entries are address parsed
+    _ADDRESS_PARSING_FACTOR = 8.0
+
+    # typical compression ratio of text in a gzip, bz2 or xz file
+    _COMPRESSION_RATIO = {'gzip' : 5.0, 'bz2' : 7.0, 'xz' : 7.0}
+
+    # fixed cost of a job in seconds, such as sending the address parser
+    _JOB_OVERHEAD = 0.1
+
+    def __init__(self, pool, workers):
+        """
+        Initializes a JobScheduler object.
+
+        Args:
+
+          pool: multiprocessing.Pool running the jobs.
+
+          workers: Number of worker processes of 'pool'.
+        """
+        self.pool = pool
+        self.workers = workers
+        self.finished = []
+        self._queue = []
+        self._running = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def estimate_cost(self, source, size=None):
+        """
+        Returns the estimated processing time of 'source' in seconds. If 'size'
+        is given, the cost of that many bytes of the dataset is returned 
+        instead, as for the chunks of a split dataset.
+        """
+        if size == None:
+            size = source.raw_stat()[0]
+            # the size of a compressed file is not the size of the dataset
+            if source.archived == True and source.metadata['compression'] in self._COMPRESSION_RATIO:
+                size *= self._COMPRESSION_RATIO[source.metadata['compression']]
+        cost = size / self._BYTES_PER_SECOND[source.metadata['format']]
+        if 'full_addr' in source.metadata['info']:
+            cost *= self._ADDRESS_PARSING_FACTOR
+        return cost + self._JOB_OVERHEAD
+
+    def submit(self, cost, func, args=()):
+        """
+        Queues the job 'func(*args)' with the estimated cost 'cost' and returns
+        its ScheduledJob. The job is not sent to the pool until 'dispatch' is 
+        called or another job finishes.
+        """
+        job = ScheduledJob(cost, func, args)
+        with self._lock:
+            # jobs of the same cost are dispatched in order of submission
+            heapq.heappush(self._queue, (-cost, self._count, job))
+            self._count += 1
+        return job
+
+    def dispatch(self):
+        """
+        Sends the most costly queued jobs to the pool until every worker is busy.
+        """
+        with self._lock:
+            while self._queue and self._running < self.workers:
+                job = heapq.heappop(self._queue)[2]
+                self._running += 1
+                job.start = time.perf_counter()
+                self.pool.apply_async(job.func, job.args, \
+                                      callback=lambda value, job=job: self._finish(job, value, None), \
+                                      error_callback=lambda error, job=job: self._finish(job, None, error))
+
+    def _finish(self, job, value, error):
+        # called by the result handler thread of the pool
+        job.end = time.perf_counter()
+        job._value = value
+        job._error = error
+        with self._lock:
+            self._running -= 1
+            self.finished.append(job)
+        job._done.set()
+        self.dispatch()
+
+    def makespan(self):
+        """
+        Returns a tuple of the predicted and actual makespan in seconds of the
+        finished jobs. The prediction schedules the estimated costs of the jobs
+        on the workers, longest first, and the actual makespan is the time from
+        the first job sent to the pool to the last job finished.
+        """
+        if not self.finished:
+            return 0.0, 0.0
+        loads = [0.0] * self.workers
+        for cost in sorted((job.cost for job in self.finished), reverse=True):
+            heapq.heapreplace(loads, loads[0] + cost)
+        actual = max(job.end for job in self.finished) - min(job.start for job in self.finished)
+        return max(loads), actual
+
+
+# approximate memory used by a process that has loaded libpostal, and by a 
+# worker process that has not
+_LIBPOSTAL_MEMORY = 2500 << 20
+_WORKER_MEMORY = 200 << 20
+
+def default_jobs(parser_procs=0):
+    """
+    Returns a default number of worker processes, which is the number of CPU 
+    cores available to the process, reduced so that the workers fit in the
+    available memory. Each worker loads libpostal, unless addresses are parsed
+    by 'parser_procs' dedicated processes, which then use the memory instead.
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+
+    memory = None
+    try:
+        with open('/proc/meminfo') as meminfo:
+            for line in meminfo:
+                if line.startswith('MemAvailable:'):
+                    memory = int(line.split()[1]) << 10
+    except OSError:
+        try:
+            memory = os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+        except (AttributeError, ValueError, OSError):
+            pass
+    if memory == None:
+        return cpus
+
+    if parser_procs > 0:
+        memory -= parser_procs * _LIBPOSTAL_MEMORY
+        per_worker = _WORKER_MEMORY
+    else:
+        per_worker = _LIBPOSTAL_MEMORY
+    return max(1, min(cpus, memory // per_worker))
+
 
 ############################
 # LOGGING / DEBUGGING MODE #
 ############################
 
+class StageMetrics(object):
+    """
+    Records the metrics of the processing stages of a source, such as the wall
+    clock and CPU time, the bytes read and written, and the rows read, written
+    and rejected by each stage. The records are plain dicts, so they can be
+    returned from pool workers and written to a log by a Logger.
+
+    Attributes:
+
+      name: Name of the source, usually its local file name.
+
+      stages: List of dicts of the recorded stages, in order.
+    """
+    def __init__(self, name=None):
+        """
+        Initializes a StageMetrics object.
+
+        Args:
+
+          name: Name of the source, usually its local file name.
+        """
+        self.name = name
+        self.stages = []
+
+    @contextlib.contextmanager
+    def stage(self, stage_name):
+        """
+        Context manager that times a stage. It yields a dict to which the stage
+        adds its byte and row counts, and the stage is recorded when the block
+        exits, even if an exception is raised.
+        """
+        counts = dict()
+        wall_start = time.perf_counter()
+        # CPU time of the calling thread, since fetch stages run in threads
+        cpu_start = time.thread_time()
+        try:
+            yield counts
+        finally:
+            self.add(stage_name, wall=time.perf_counter() - wall_start, \
+                     cpu=time.thread_time() - cpu_start, **counts)
+
+    def add(self, stage_name, wall=0.0, cpu=None, **counts):
+        """
+        Records a stage that was timed elsewhere. The throughput of the stage 
+        is computed from its wall clock time and 'rows_out' or 'bytes_read' 
+        counts, if given.
+        """
+        record = {'source' : self.name, 'stage' : stage_name, 'pid' : os.getpid(), \
+                  'wall' : wall, 'cpu' : cpu}
+        record.update(counts)
+        if wall > 0:
+            if 'rows_out' in counts:
+                record['rows_per_sec'] = counts['rows_out'] / wall
+            if 'bytes_read' in counts:
+                record['bytes_per_sec'] = counts['bytes_read'] / wall
+        self.stages.append(record)
+
+    def extend(self, stages):
+        """
+        Appends the records of another StageMetrics object, for example the one
+        of a pool worker.
+        """
+        self.stages.extend(stages.stages if isinstance(stages, StageMetrics) else stages)
+
+    def total(self):
+        """
+        Returns a dict summing the time and counts of the recorded stages. The
+        address parsing stage is not summed, since its time is part of the
+        parsing stages.
+        """
+        total = {'source' : self.name, 'stage' : 'total', 'wall' : 0.0, 'cpu' : 0.0}
+        for record in self.stages:
+            if record['stage'] == 'address_parsing':
+                continue
+            total['wall'] += record['wall']
+            total['cpu'] += record['cpu'] or 0.0
+            for key in ('bytes_read', 'bytes_written', 'rows_rejected'):
+                if key in record:
+                    total[key] = total.get(key, 0) + record[key]
+        return total
+
+
+def _file_size(*paths):
+    """
+    Returns the total size in bytes of the files in 'paths' that exist.
+    """
+    return sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+
+
 class Logger(object):
     """
-    (IN PROGRESS) A logging class to write logs for debugging.
+    Writes the metrics of processed sources to a file as JSON lines, with one
+    line per stage followed by a line of the totals of each source. A Logger is
+    used by the parent process only, and the pool workers return their 
+    StageMetrics to it.
+
+    Attributes:
+
+      path: Path to the log file.
     """
-    def __init__(self):
-        pass
+    def __init__(self, path):
+        """
+        Initializes a Logger object.
 
-    def write(self):
-        pass
+        Args:
+
+          path: Path to the log file, which is overwritten.
+        """
+        self.path = path
+        self._file = None
+
+    def write(self, metrics):
+        """
+        Writes the stages and totals of a StageMetrics object to the log.
+        """
+        for record in metrics.stages + [metrics.total()]:
+            self._file.write(json.dumps(record, sort_keys=True) + '\n')
 
     def flush(self):
-        pass
+        """
+        Flushes the written lines to the log file.
+        """
+        self._file.flush()
 
     def __enter__(self):
-        pass
+        self._file = open(self.path, 'w')
+        return self
 
-    def __exit__(self):
-        pass
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._file.close()
+        self._file = None
+        return False
@@ -2,8 +2,13 @@
 
 # Modules
 import argparse
+import concurrent.futures
+import json
 import multiprocessing
 import os
+import signal
+import socket
+import stat
 import sys
 import time
 import io
@@ -13,8 +18,334 @@ def process(source, parse_address):
     print("DEBUG:", source.local_fname)
     prodsys = opentabulate.DataProcess(source, parse_address)
     prodsys.process()
+    return prodsys.metrics
+
+def process_chunk(source, parse_address, index, start, end):
+    print("DEBUG:", source.local_fname, "chunk", index)
+    prodsys = opentabulate.DataProcess(source, parse_address)
+    count = prodsys.processChunk(index, start, end)
+    for record in prodsys.metrics.stages:
+        record['chunk'] = index
+    return count, prodsys.metrics
+
+def split_chunks(source, parse_address, chunk_size):
+    prodsys = opentabulate.DataProcess(source, parse_address)
+    ranges = prodsys.splitData(chunk_size)
+    return ranges, prodsys.metrics
+
+def merge_chunks(source, parse_address, counts):
+    print("DEBUG:", source.local_fname, "merging", len(counts), "chunks")
+    prodsys = opentabulate.DataProcess(source, parse_address)
+    prodsys.mergeChunks(counts)
     # DEBUG
     #prodsys.blankFill()
+    return prodsys.metrics
+    
+def fetch(sources, build_record):
+    metrics = [opentabulate.StageMetrics(source.local_fname) for source in sources]
+    # the sources share a URL, so only the first one downloads it
+    if 'url' in sources[0].metadata:
+        with metrics[0].stage('fetch') as stage:
+            stage['bytes_written'] = 0
+            if sources[0].fetch_url():
+                path = sources[0].archivepath if 'compression' in sources[0].metadata else sources[0].rawpath
+                stage['bytes_written'] = os.path.getsize(path)
+    fetched = []
+    for source, source_metrics in zip(sources, metrics):
+        if 'compression' in source.metadata:
+            with source_metrics.stage('extract') as stage:
+                source.archive_extraction()
+                # archived datasets are read from the archive when processed
+                if source.archivepath != None and not source.archived and not source.no_extract_flag:
+                    stage.update(bytes_read=os.path.getsize(source.archivepath), \
+                                 bytes_written=os.path.getsize(source.rawpath))
+        # fingerprint the inputs here, since hashing a changed dataset is slow
+        fingerprint = None
+        if build_record != None and (source.archived or os.path.exists(source.rawpath)):
+            fingerprint = build_record.fingerprint(source)
+        fetched.append((source, fingerprint, source_metrics))
+    return fetched
+
+def start_fetching(fetcher, sources, build_record=None):
+    """
+    Submits the download and extraction of the sources to 'fetcher', with each
+    URL downloaded only once, and returns a dict of the futures of the source
+    groups to the groups. If 'build_record' is given, the inputs of each source
+    are also fingerprinted.
+    """
+    groups = {}
+    for srcfile in sources:
+        # sources without a URL have nothing to wait for
+        key = srcfile.metadata['url'] if 'url' in srcfile.metadata else srcfile
+        groups.setdefault(key, []).append(srcfile)
+    # local datasets are submitted first so that they are not queued behind
+    # slow downloads
+    groups = sorted(groups.values(), key=lambda group: 'url' in group[0].metadata)
+    return dict((fetcher.submit(fetch, group, build_record), group) for group in groups)
+
+def ready_sources(fetches, failed):
+    """
+    Yields lists of sources, their fingerprints and the metrics of their fetch
+    stages, with the sources whose downloads and extractions finished since the
+    previous list. Sources that could not be fetched are reported, skipped and
+    appended to 'failed' with their errors.
+    """
+    pending = set(fetches)
+    while pending:
+        done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+        ready = []
+        for fetched in done:
+            try:
+                ready.extend(fetched.result())
+            except Exception as e:
+                print("Error! Could not fetch dataset:", e)
+                failed.extend((source, e) for source in fetches[fetched])
+        yield ready
+
+def jobs_count(value):
+    """
+    Converts the argument of --jobs, which is a number or 'auto'.
+    """
+    if value == 'auto':
+        return None
+    return int(value)
+
+def make_source(path, args):
+    """
+    Creates and parses the Source object of the source file 'path', with the
+    processing options of the command line arguments 'args'.
+    """
+    srcfile = opentabulate.Source(path, args.pre, args.post, args.ignore_url, \
+                         args.no_decompress, args.blank_fill, args.staged, \
+                         args.encoding_sample, args.xml_backend, args.extract, \
+                         args.output_format, args.clean_batch)
+    srcfile.parse()
+    return srcfile
+
+def run_sources(src, pool, fetcher, address_parser, logger, build_record, args, force=False, report=None):
+    """
+    Fetches the sources 'src' with 'fetcher' and processes them with the
+    workers of 'pool', writing their metrics to 'logger'. If 'report' is given,
+    it is called with a dict of the status and metrics of each source as it
+    finishes.
+
+    Returns a tuple of the number of sources skipped as up to date, a list of
+    the sources that failed with their errors, and the JobScheduler of the run.
+    """
+    def finish(source, status, metrics=None, error=None):
+        if report == None:
+            return
+        record = {'source' : source.srcpath, 'status' : status}
+        if error != None:
+            record['error'] = str(error)
+        if metrics != None:
+            record['metrics'] = metrics.stages + [metrics.total()]
+        report(record)
+
+    def submit_chunks(source, fingerprint, metrics, split_job):
+        # queues the chunks of a dataset once it has been split
+        try:
+            ranges, split_metrics = split_job.get()
+            metrics.extend(split_metrics)
+            print("DEBUG:", source.local_fname, "split into", len(ranges), "chunks")
+            costs = [scheduler.estimate_cost(source, end - start) for start, end in ranges]
+            chunk_jobs = [scheduler.submit(costs[i], process_chunk, (source, address_parser) + (i,) + ranges[i]) \
+                          for i in range(len(ranges))]
+        except Exception as e:
+            print("Error! Could not process", source.local_fname + ":", e)
+            failed.append((source, e))
+            finish(source, 'failed', error=e)
+            return
+        chunked.append((source, fingerprint, metrics, chunk_jobs))
+        scheduler.dispatch()
+
+    # jobs are sent to the pool longest first, as workers become free
+    scheduler = opentabulate.JobScheduler(pool, args.jobs)
+    skipped = 0
+    failed = []
+    jobs = []
+    splitting = []
+    chunked = []
+    # sources are processed as soon as their datasets are downloaded and
+    # extracted, while the remaining datasets are still being fetched
+    fetch_failed = []
+    for ready in ready_sources(start_fetching(fetcher, src, build_record), fetch_failed):
+        for source, fingerprint, metrics in ready:
+            # a source that cannot be planned fails alone, like a failed job
+            try:
+                # skip sources whose outputs were produced from the same inputs
+                if not force and fingerprint != None and build_record.is_current(source, fingerprint):
+                    print("DEBUG:", source.local_fname, "is up to date, skipping")
+                    # the modification time of the raw dataset may have changed
+                    build_record.store(source, fingerprint)
+                    logger.write(metrics)
+                    finish(source, 'skipped', metrics)
+                    skipped += 1
+                    continue
+                # large CSV datasets are split into chunks that run as separate jobs,
+                # unless they are read from an archive, which cannot be seeked
+                if args.chunk_size != None and source.metadata['format'] == 'csv' and not args.staged \
+                   and not source.archived and os.path.getsize(source.rawpath) > args.chunk_size:
+                    # the dataset is split by a worker, since splitting reads the
+                    # whole dataset and runs its pre-processing script; the split
+                    # job has the cost of the dataset, so that it is sent to the
+                    # pool before the jobs of smaller datasets
+                    cost = scheduler.estimate_cost(source)
+                    splitting.append((source, fingerprint, metrics, \
+                                      scheduler.submit(cost, split_chunks, (source, address_parser, args.chunk_size))))
+                else:
+                    cost = scheduler.estimate_cost(source)
+                    jobs.append((source, fingerprint, metrics, \
+                                 scheduler.submit(cost, process, (source, address_parser))))
+            except Exception as e:
+                print("Error! Could not process", source.local_fname + ":", e)
+                failed.append((source, e))
+                finish(source, 'failed', error=e)
+        # the sources fetched together are dispatched together, so the largest
+        # of them starts first
+        scheduler.dispatch()
+        # the chunks of datasets split in the meantime are queued
+        for entry in [entry for entry in splitting if entry[3].ready()]:
+            splitting.remove(entry)
+            submit_chunks(*entry)
+    for source, error in fetch_failed:
+        finish(source, 'failed', error=error)
+    failed.extend(fetch_failed)
+    for entry in splitting:
+        submit_chunks(*entry)
+
+    # merge the outputs of a chunked dataset once all of its chunks are done
+    for source, fingerprint, metrics, chunk_jobs in chunked:
+        counts = []
+        try:
+            for chunk_job in chunk_jobs:
+                count, chunk_metrics = chunk_job.get()
+                counts.append(count)
+                metrics.extend(chunk_metrics)
+        except Exception as e:
+            print("Error! Could not process", source.local_fname + ":", e)
+            failed.append((source, e))
+            finish(source, 'failed', error=e)
+            continue
+        jobs.append((source, fingerprint, metrics, \
+                     scheduler.submit(scheduler.estimate_cost(source, 0), merge_chunks, (source, address_parser, counts))))
+        scheduler.dispatch()
+    # wait for jobs to finish, recording the outputs and metrics of each source
+    for source, fingerprint, metrics, pool_proc in jobs:
+        try:
+            metrics.extend(pool_proc.get())
+            if fingerprint != None:
+                build_record.store(source, fingerprint)
+        except Exception as e:
+            print("Error! Could not process", source.local_fname + ":", e)
+            failed.append((source, e))
+            finish(source, 'failed', error=e)
+            continue
+        logger.write(metrics)
+        logger.flush()
+        finish(source, 'done', metrics)
+    return skipped, failed, scheduler
+
+def serve(path, pool, fetcher, address_parser, logger, args):
+    """
+    Processes source files sent to the Unix socket 'path' until the process is
+    interrupted or terminated. The address parser and the workers of 'pool'
+    stay loaded between requests, so a request does not pay for starting them.
+
+    A request is a JSON line with a list of absolute source file paths under
+    'sources', and optionally 'force'. The reply is a JSON line with the status
+    and metrics of each source as it finishes, followed by a line with the
+    status 'complete', or a line with the status 'error' if the request is
+    invalid. Requests are handled one at a time.
+    """
+    # remove the socket of a service that did not shut down
+    if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):
+        os.remove(path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # the socket is created accessible to the user only, so that no other user
+    # can connect before its permissions are set
+    umask = os.umask(0o177)
+    try:
+        server.bind(path)
+    finally:
+        os.umask(umask)
+    server.listen()
+    build_record = opentabulate.BuildRecord(parser_version=address_parser.version)
+    print("Listening for source files on '", path, "'.", sep="")
+    try:
+        while True:
+            conn, _ = server.accept()
+            with conn, conn.makefile('rw', encoding='utf-8') as stream:
+                def reply(record):
+                    # a client that disconnects does not stop its request
+                    try:
+                        stream.write(json.dumps(record) + '\n')
+                        stream.flush()
+                    except OSError:
+                        pass
+
+                try:
+                    request = json.loads(stream.readline())
+                    if not isinstance(request, dict) or not isinstance(request.get('sources'), list) or \
+                       not all(isinstance(p, str) and os.path.isabs(p) for p in request['sources']):
+                        raise ValueError("'sources' must be a list of absolute paths")
+                except ValueError as e:
+                    reply({'status' : 'error', 'error' : 'Invalid request: ' + str(e)})
+                    continue
+
+                start_time = time.perf_counter()
+                src = []
+                for srcpath in request['sources']:
+                    print("Creating source object:", srcpath)
+                    try:
+                        src.append(make_source(srcpath, args))
+                    except Exception as e:
+                        print("Error! Could not parse source file:", e)
+                        reply({'source' : srcpath, 'status' : 'failed', 'error' : str(e)})
+                # an error in a request is reported to its client only
+                try:
+                    skipped, failed, scheduler = run_sources(src, pool, fetcher, address_parser, logger, \
+                                                             build_record, args, request.get('force', False), reply)
+                except Exception as e:
+                    print("Error! Could not process request:", e)
+                    reply({'status' : 'error', 'error' : 'Could not process request: ' + str(e)})
+                    continue
+                predicted, actual = scheduler.makespan()
+                reply({'status' : 'complete', 'seconds' : time.perf_counter() - start_time, \
+                       'sources' : len(request['sources']), 'skipped' : skipped, \
+                       'failed' : len(failed) + len(request['sources']) - len(src), \
+                       'predicted_makespan' : predicted, 'makespan' : actual})
+    finally:
+        server.close()
+        os.remove(path)
+
+def submit(path, sources, force):
+    """
+    Sends the source files 'sources' to the service listening on the Unix
+    socket 'path' and prints the status of each source as it finishes. Returns
+    the exit status, which is 1 if a source failed.
+    """
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.connect(path)
+    status = 1
+    with client, client.makefile('rw', encoding='utf-8') as stream:
+        stream.write(json.dumps({'sources' : sources, 'force' : force}) + '\n')
+        stream.flush()
+        for line in stream:
+            record = json.loads(line)
+            if record['status'] == 'error':
+                print("Error!", record['error'])
+                break
+            if record['status'] == 'complete':
+                print("Completed", record['sources'], "source(s) in %.3f seconds," % record['seconds'], \
+                      record['skipped'], "skipped,", record['failed'], "failed.")
+                status = 1 if record['failed'] > 0 else 0
+                break
+            if record['status'] == 'failed':
+                print(record['source'], "failed:", record['error'])
+            else:
+                print(record['source'], record['status'], "in %.3f seconds" % record['metrics'][-1]['wall'])
+    return status
     
 
 # Command line interaction
@@ -27,14 +358,40 @@ cmd_args.add_argument('-u', '--ignore-url', action='store_true', default=False,
                       help='ignore "url" entries from source files')
 cmd_args.add_argument('-z', '--no-decompress', action='store_true', default=False, \
                       help='do not decompress files from compressed archives')
+cmd_args.add_argument('-x', '--extract', action='store_true', default=False, \
+                      help='extract datasets from archives instead of reading them from the archive')
+cmd_args.add_argument('--staged', action='store_true', default=False, \
+                      help='write intermediate dirty files between processing steps (for debugging)')
+cmd_args.add_argument('--encoding-sample', action='store', default=None, type=int, metavar='BYTES', \
+                      help='guess character encodings from the first BYTES bytes of each dataset')
+cmd_args.add_argument('--address-cache', action='store', default=None, type=str, metavar='FILE', \
+                      help='store parsed addresses in the SQLite database FILE for reuse')
+cmd_args.add_argument('--parser-procs', action='store', default=0, type=int, metavar='N', \
+                      help='parse addresses in N dedicated processes instead of in each job')
+cmd_args.add_argument('--chunk-size', action='store', default=None, type=int, metavar='BYTES', \
+                      help='split CSV datasets larger than BYTES into chunks processed as separate jobs')
+cmd_args.add_argument('--xml-backend', action='store', default='auto', choices=['auto', 'etree', 'lxml'], \
+                      help='XML parser for XML datasets (default: lxml if installed)')
+cmd_args.add_argument('--output-format', action='store', default='csv', choices=['csv', 'columnar', 'parquet'], \
+                      help='format of clean datasets (default: csv)')
+cmd_args.add_argument('--clean-batch', action='store', default=None, type=int, metavar='ROWS', \
+                      help='clean ROWS rows at a time, column by column')
+cmd_args.add_argument('--fetch-jobs', action='store', default=4, type=int, metavar='N', \
+                      help='download and extract at most N datasets concurrently')
+cmd_args.add_argument('-f', '--force', action='store_true', default=False, \
+                      help='process sources even if their outputs are up to date')
 cmd_args.add_argument('--pre', action='store_true', default=False, \
                       help='(EXPERIMENTAL) allow preprocessing script to run')
 cmd_args.add_argument('--post', action='store_true', default=False, \
                       help='(EXPERIMENTAL) allow postprocessing script to run')
-cmd_args.add_argument('-j', '--jobs', action='store', default=1, type=int, metavar='N', \
-                      help='run at most N jobs asynchronously')
+cmd_args.add_argument('-j', '--jobs', action='store', default=None, type=jobs_count, metavar='N', \
+                      help='run at most N jobs asynchronously (default: auto, from the CPU cores and memory)')
 cmd_args.add_argument('--log', action='store', default="pdlog.txt", type=str, \
-                      metavar='FILE', help='(NOT FUNCTIONAL) log output to FILE')
+                      metavar='FILE', help='write per-stage metrics of each source to FILE as JSON lines')
+cmd_args.add_argument('--serve', action='store', default=None, type=str, metavar='SOCKET', \
+                      help='keep the address parser and workers loaded and process source files sent to SOCKET')
+cmd_args.add_argument('--submit', action='store', default=None, type=str, metavar='SOCKET', \
+                      help='send the source files to the service listening on SOCKET')
 cmd_args.add_argument('--initialize', action='store_true', default=False, \
                       help='create processing directories')
 cmd_args.add_argument('SOURCE', nargs='*', default=None, help='path to source file')
@@ -44,6 +401,24 @@ args = cmd_args.parse_args()
 # get absolute paths
 for i in range(0,len(args.SOURCE)):
     args.SOURCE[i] = os.path.abspath(args.SOURCE[i])
+if args.address_cache != None:
+    args.address_cache = os.path.abspath(args.address_cache)
+for option in ['serve', 'submit']:
+    if getattr(args, option) != None:
+        setattr(args, option, os.path.abspath(getattr(args, option)))
+
+if args.serve != None and args.submit != None:
+    cmd_args.error("only one of --serve and --submit can be given")
+
+if args.serve != None and args.SOURCE != []:
+    cmd_args.error("SOURCE cannot be given with --serve, send source files with --submit")
+
+# the source files are processed by a running service
+if args.submit != None:
+    if args.SOURCE == []:
+        print("Error! The following arguments are required: SOURCE")
+        exit(1)
+    exit(submit(args.submit, args.SOURCE, args.force))
     
 # change working directory
 os.chdir(os.path.dirname(os.path.realpath(__file__)))
@@ -58,68 +433,130 @@ if args.initialize == True:
     print("Done.")
     exit(0)
 
-if args.SOURCE == []:
+if args.SOURCE == [] and args.serve == None:
     print("Error! The following arguments are required: SOURCE")
     exit(1)
 
-if args.jobs < 1:
+if args.jobs != None and args.jobs < 1:
     print("Error! Jobs should be a positive integer.")
     exit(1)
 
-if args.log != "pdlog.txt" and os.path.exists(args.log):
-    print("Warning!", args.log, "already exists.")
-    if input("Overwrite? (y:yes / *:exit): ") != 'y':
-        print("Exiting.")
-        exit(1)
+if args.fetch_jobs < 1:
+    print("Error! Fetch jobs should be a positive integer.")
+    exit(1)
+
+if args.output_format == 'parquet' and opentabulate.pyarrow == None:
+    print("Error! Parquet output requires the 'pyarrow' package.")
+    exit(1)
+
+if args.parser_procs < 0:
+    print("Error! Parser processes should be a non-negative integer.")
+    exit(1)
+
+if args.chunk_size != None and args.chunk_size < 1:
+    print("Error! Chunk size should be a positive integer.")
+    exit(1)
+
+if args.clean_batch != None and args.clean_batch < 1:
+    print("Error! Clean batch size should be a positive integer.")
+    exit(1)
 
-if input('Process data? (y:yes / *:exit): ') != 'y':
-    print("Exiting.")
+if args.encoding_sample != None and args.encoding_sample < 1:
+    print("Error! Encoding sample size should be a positive integer.")
     exit(1)
 
-print("Logging production system output to '", args.log, "'.", sep="")
+# a service runs unattended, so it does not ask for confirmation
+if args.serve == None:
+    if args.log != "pdlog.txt" and os.path.exists(args.log):
+        print("Warning!", args.log, "already exists.")
+        if input("Overwrite? (y:yes / *:exit): ") != 'y':
+            print("Exiting.")
+            exit(1)
+
+    if input('Process data? (y:yes / *:exit): ') != 'y':
+        print("Exiting.")
+        exit(1)
+
+print("Logging processing metrics to '", args.log, "'.", sep="")
 
 src = []
-urls = []
 
 for source in args.SOURCE:
     print("Creating source object:", source)
-    srcfile = opentabulate.Source(source, args.pre, args.post, args.ignore_url, \
-                         args.no_decompress, args.blank_fill)
     print("Parsing...")
-    srcfile.parse()
+    srcfile = make_source(source, args)
     print("Done.")
     if 'url' not in srcfile.metadata:
         print("WARNING: This source file does not have a URL.")
-    if ('url' in srcfile.metadata) and (srcfile.metadata['url'] not in urls):
-        srcfile.fetch_url()
-        urls.append(srcfile.metadata['url'])
-    if 'compression' in srcfile.metadata:
-        srcfile.archive_extraction()
     src.append(srcfile)
 
 if args.ignore_proc == True:
-    exit(0)
+    failed = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.fetch_jobs) as fetcher:
+        for ready in ready_sources(start_fetching(fetcher, src), failed):
+            pass
+    exit(1 if failed else 0)
     
 print("Beginning data processing, please standby or grab a coffee. :-)")
-print("Loading address parser module...")
-from postal.parser import parse_address
-print("Finished loading libpostal address parser.")
+try:
+    from importlib.metadata import version
+    postal_version = 'postal-' + version('postal')
+except Exception:
+    postal_version = None
+
+parser_service = None
+if args.parser_procs > 0:
+    print("Starting", args.parser_procs, "address parser processes...")
+    parser_service = opentabulate.AddressParserService('postal.parser.parse_address', args.parser_procs)
+    parser_service.start()
+    address_parser = opentabulate.RemoteAddressParser(parser_service, cache_path=args.address_cache, \
+                                                      version=postal_version)
+    print("Finished loading libpostal address parser processes.")
+else:
+    print("Loading address parser module...")
+    from postal.parser import parse_address
+    address_parser = opentabulate.AddressParser(parse_address, cache_path=args.address_cache, \
+                                                version=postal_version)
+    print("Finished loading libpostal address parser.")
+if args.jobs == None:
+    args.jobs = opentabulate.default_jobs(args.parser_procs)
+    print("Using", args.jobs, "jobs for the available CPU cores and memory.")
 print("Starting multiprocessing.Pool jobs...")
 
 start_time = time.perf_counter()
 
 if __name__ == '__main__':
-    with multiprocessing.Pool(processes=args.jobs) as pool, open(args.log, 'w') as logger:
-        # pool function calls of process.py here
-        jobs = []
-        for source in src:
-            jobs.append(pool.apply_async(process, (source, parse_address)))
-        # wait for jobs to finish
-        for pool_proc in jobs:
-            #logger.write(pool_proc.get())
-            pool_proc.get()
+    # the fetch threads are started after the pool forks its workers
+    with multiprocessing.Pool(processes=args.jobs) as pool, opentabulate.Logger(args.log) as logger, \
+         concurrent.futures.ThreadPoolExecutor(max_workers=args.fetch_jobs) as fetcher:
+        if args.serve != None:
+            # terminating the service stops it like an interrupt
+            signal.signal(signal.SIGTERM, signal.default_int_handler)
+            try:
+                serve(args.serve, pool, fetcher, address_parser, logger, args)
+            except KeyboardInterrupt:
+                pass
+        else:
+            skipped, failed, scheduler = run_sources(src, pool, fetcher, address_parser, logger, \
+                                                     opentabulate.BuildRecord(parser_version=address_parser.version), \
+                                                     args, args.force)
+            predicted, actual = scheduler.makespan()
 
 end_time = time.perf_counter()            
 
+if parser_service != None:
+    parser_service.stop()
+
+if args.serve != None:
+    print("Service stopped.")
+    exit(0)
+
 print("Completed multiprocessing.Pool execution in", end_time - start_time, "seconds.")
+print("Predicted makespan of", len(scheduler.finished), "job(s) on", args.jobs, "worker(s):", \
+      "%.1f seconds, actual: %.1f seconds." % (predicted, actual))
+if skipped > 0:
+    print("Skipped", skipped, "of", len(src), "source(s) with up to date outputs (use --force to process them).")
 print("Data processing complete.")
+if failed:
+    print("WARNING:", len(failed), "source(s) could not be fetched or processed.")
+    exit(1)